@@ -1,48 +1,315 @@
 #!/usr/bin/env python3
+import asyncio
 import json
 import os
 import time
+import queue
 import threading
 import http.server
 import socketserver
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FutureTimeoutError
+from collections import OrderedDict
 from datetime import datetime
-from playwright.sync_api import sync_playwright
-import requests
-from bs4 import BeautifulSoup
-from sentence_transformers import SentenceTransformer
+from itertools import islice
 from urllib.parse import urlparse, parse_qs
 import signal
 import sys
 import platform
 import subprocess
-from database import init_db, save_interaction, get_similar_context
+from database import init_db, migrate_db, close_db, get_similar_context, save_indexes, reembed_stale_rows
+from embedding_cache import cache_stats
+import embedding_provider
+from browser_engine import get_engine, shutdown_engine
+from storage_log import SegmentedLog
+from ingestion import IngestionPipeline
 #change this path to desired location to keep scraped data.
 DEFAULT_WINDOWS_PATH = r"C:\Users\yosef\OneDrive\Desktop\Attachments"
 DEFAULT_LINUX_PATH = "/home/ubuntu/scraped_data"
 STORAGE_PATH = os.environ.get('AI_STORAGE_PATH', DEFAULT_WINDOWS_PATH if platform.system() == 'Windows' else DEFAULT_LINUX_PATH)
 if not os.path.exists(STORAGE_PATH):
     os.makedirs(STORAGE_PATH)
+# Messages, scrapes and responses are appended to one segmented log instead
+# of a JSON file each; see storage_log.py.
+SEGMENTS_PATH = os.path.join(STORAGE_PATH, 'segments')
+storage_log = SegmentedLog(SEGMENTS_PATH)
+# Embeds and stores responses, scrapes and conversation turns off the
+# request path.
+ingestion = IngestionPipeline(storage_log)
 
-embedding_model = None
 browser_sessions = {}
+browser_sessions_lock = threading.Lock()
 server = None
+SERVER_WORKERS = int(os.environ.get('AI_SERVER_WORKERS', 16))
+# Hard upper bound on how long send_message_to_ai waits for an answer.
+RESPONSE_TIMEOUT = float(os.environ.get('AI_RESPONSE_TIMEOUT', 120))
+# Extra seconds /ask_all allows past a service's timeout for scraping and saving.
+ASK_ALL_GRACE = 30
+# Runs /ask_all's per-service exchanges, separate from the HTTP workers so a
+# fan-out never waits on a worker that its own request is holding.
+ask_all_executor = ThreadPoolExecutor(max_workers=SERVER_WORKERS, thread_name_prefix='ask-all')
+# Seconds between SSE keep-alive comments on an idle /stream.
+STREAM_KEEPALIVE = 15
+# Open /stream connections as (event queue, services or None for all). One
+# connection per client carries every service's events, so a dashboard
+# holds one server worker and one browser connection however many panels
+# it shows.
+stream_subscribers = []
+stream_subscribers_lock = threading.Lock()
+# Conversations embedded by another model are re-embedded while the server
+# is idle: at most REEMBED_BUDGET seconds of work every REEMBED_INTERVAL
+# seconds, once no POST has arrived for REEMBED_IDLE_AFTER seconds and the
+# ingestion queue is empty.
+REEMBED_INTERVAL = float(os.environ.get('AI_REEMBED_INTERVAL', 60))
+REEMBED_BUDGET = float(os.environ.get('AI_REEMBED_BUDGET', 5))
+REEMBED_IDLE_AFTER = float(os.environ.get('AI_REEMBED_IDLE_AFTER', 30))
+last_post_at = time.monotonic()
+embedding_server = None
+# Heavy imports (playwright, sentence_transformers, requests) are deferred to
+# first use and the model loads in the background, so the server can answer
+# /health as soon as it binds. /health reports these stages.
+startup_stages = {
+    'database': 'pending',
+    'database_migrations': 'pending',
+    'embedding_model': 'pending',
+    'server': 'pending'
+}
 
-def get_embedding_model():
-    global embedding_model
-    if embedding_model is None:
-        embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-    return embedding_model
+def _run_startup_stage(stage, func):
+    startup_stages[stage] = 'loading'
+    try:
+        func()
+        startup_stages[stage] = 'ready'
+    except Exception as e:
+        startup_stages[stage] = f'failed: {e}'
+        print(f"Startup stage {stage} failed: {e}")
+
+# Installed right before a message is sent: a MutationObserver stamps the time
+# of the latest DOM change and the number of assistant messages is recorded.
+RESPONSE_WATCH_SCRIPT = """
+(cfg) => {
+    const watch = window.__aibResponseWatch || (window.__aibResponseWatch = {});
+    if (watch.observer) watch.observer.disconnect();
+    watch.startedAt = performance.now();
+    watch.lastMutation = watch.startedAt;
+    watch.mutated = false;
+    watch.baselineCount = document.querySelectorAll(cfg.response_selector).length;
+    watch.observer = new MutationObserver(() => {
+        watch.lastMutation = performance.now();
+        watch.mutated = true;
+    });
+    watch.observer.observe(document.body, {childList: true, subtree: true, characterData: true});
+}
+"""
+
+RESPONSE_COMPLETE_SCRIPT = """
+(cfg) => {
+    const watch = window.__aibResponseWatch;
+    if (!watch) return true;
+    const now = performance.now();
+    if (!watch.mutated || now - watch.startedAt < cfg.min_wait_ms) return false;
+    const count = document.querySelectorAll(cfg.response_selector).length;
+    if (count <= watch.baselineCount && count > 0) return false;
+    if (cfg.stop_selectors.some(selector => document.querySelector(selector))) return false;
+    if (now - watch.lastMutation < cfg.stable_ms) return false;
+    watch.observer.disconnect();
+    return true;
+}
+"""
+
+# Installed once per page: pushes the text of the newest assistant message to
+# the __aibStreamPush binding as it grows, so /stream/<service> clients see
+# the answer token by token without the page being re-scraped.
+STREAM_SCRIPT = """
+(cfg) => {
+    const start = () => {
+        const stream = window.__aibStream || (window.__aibStream = {});
+        if (stream.observer) stream.observer.disconnect();
+        stream.node = null;
+        stream.text = '';
+        stream.scheduled = false;
+        const flush = () => {
+            stream.scheduled = false;
+            const nodes = document.querySelectorAll(cfg.response_selector);
+            const node = nodes[nodes.length - 1];
+            if (!node) return;
+            const text = node.innerText || '';
+            if (node !== stream.node) {
+                stream.node = node;
+                stream.text = '';
+                window.__aibStreamPush({type: 'reset', text: ''});
+            }
+            if (text === stream.text) return;
+            if (text.startsWith(stream.text)) {
+                window.__aibStreamPush({type: 'delta', text: text.slice(stream.text.length)});
+            } else {
+                window.__aibStreamPush({type: 'reset', text: text});
+            }
+            stream.text = text;
+        };
+        stream.observer = new MutationObserver(() => {
+            // Coalesce a burst of mutations into one read. setTimeout rather
+            // than requestAnimationFrame: rAF never fires in a background
+            // tab, and the service tabs are rarely the visible one.
+            if (stream.scheduled) return;
+            stream.scheduled = true;
+            setTimeout(flush, 50);
+        });
+        stream.observer.observe(document.body, {childList: true, subtree: true, characterData: true});
+        stream.node = Array.from(document.querySelectorAll(cfg.response_selector)).pop() || null;
+        stream.text = stream.node ? (stream.node.innerText || '') : '';
+    };
+    if (document.body) start();
+    else document.addEventListener('DOMContentLoaded', start);
+}
+"""
+
+MESSAGE_SELECTORS = [
+    '[data-message-author-role]',
+    '.message',
+    '[role="presentation"]',
+    '.conversation-turn',
+    '.chat-message'
+]
+# How many scraped messages a session remembers between scrapes.
+SCRAPE_HISTORY = 50
+
+# Installed once per page (and re-installed on navigation by an init
+# script): window.__aibExtractor.extract() returns, in one round trip, the
+# messages added or grown since its previous call as {seq, role, text,
+# html_hash}. Nodes already returned are remembered in a WeakMap with their
+# text length; only unseen nodes and the newest seen one (which may still be
+# streaming) are read again. `reset` marks the first call on a new document.
+EXTRACTOR_SCRIPT = """
+(cfg) => {
+    if (window.__aibExtractor && window.__aibExtractor.service === cfg.service) return;
+    const hash = (value) => {
+        let h = 0x811c9dc5;
+        for (let i = 0; i < value.length; i++) {
+            h ^= value.charCodeAt(i);
+            h = Math.imul(h, 0x01000193);
+        }
+        return (h >>> 0).toString(16).padStart(8, '0');
+    };
+    const roleOf = (node) => {
+        for (const [selector, role] of cfg.roles) {
+            if (node.matches(selector) || node.closest(selector)) return role;
+        }
+        const author = node.closest('[data-message-author-role]');
+        if (author) return author.getAttribute('data-message-author-role');
+        const classes = typeof node.className === 'string' ? node.className : '';
+        if (/\\b(user|human|query)\\b/i.test(classes)) return 'user';
+        if (/\\b(assistant|bot|model|response)\\b/i.test(classes)) return 'assistant';
+        return 'message';
+    };
+    const state = {seq: 0, seen: new WeakMap(), last: null, extracted: false};
+    window.__aibExtractor = {
+        service: cfg.service,
+        extract() {
+            const reset = !state.extracted;
+            state.extracted = true;
+            let nodes = [];
+            for (const selector of cfg.selectors) {
+                try { nodes = Array.from(document.querySelectorAll(selector)); } catch (e) { continue; }
+                if (nodes.length) break;
+            }
+            const changed = [];
+            for (const node of nodes) {
+                const seen = state.seen.get(node);
+                if (seen && node !== state.last) continue;
+                const text = (node.innerText || '').trim();
+                if (!text || (seen && seen.length === text.length)) continue;
+                const entry = seen || {seq: ++state.seq};
+                entry.length = text.length;
+                state.seen.set(node, entry);
+                state.last = node;
+                changed.push({seq: entry.seq, role: roleOf(node), text: text, html_hash: hash(node.innerHTML)});
+            }
+            return {reset: reset, title: document.title, elements: changed};
+        }
+    };
+}
+"""
+
+EXTRACT_CALL = "() => window.__aibExtractor ? window.__aibExtractor.extract() : null"
+
+def _dispatch_stream_push(service, source, event):
+    """Playwright binding callback; routes page events to the live session."""
+    session = browser_sessions.get(service)
+    if session and isinstance(event, dict):
+        session.publish(event)
+
+def publish_stream_event(service, event):
+    """Queue `event`, tagged with its service, for every matching /stream."""
+    event = {'service': service, **event}
+    with stream_subscribers_lock:
+        subscribers = list(stream_subscribers)
+    for subscriber, services in subscribers:
+        if services is not None and service not in services:
+            continue
+        try:
+            subscriber.put_nowait(event)
+        except queue.Full:
+            # A stalled client misses events rather than blocking the page.
+            pass
+
+def close_streams():
+    """End every open /stream so its worker thread can exit."""
+    with stream_subscribers_lock:
+        subscribers = list(stream_subscribers)
+    for subscriber, _ in subscribers:
+        while True:
+            try:
+                subscriber.put_nowait(None)
+                break
+            except queue.Full:
+                # Make room: a client this far behind is being cut off anyway.
+                try:
+                    subscriber.get_nowait()
+                except queue.Empty:
+                    pass
+
+def enhance_message(message, user_id="web_user"):
+    """Prepend similar past conversations to `message`.
+
+    This is the request-scoped enhancement stage: callers sending one
+    message to several services compute it once and pass the result to each
+    session's inject_message. Separate requests for the same message (one
+    /inject_message per panel, retries) hit get_similar_context's memo.
+    """
+    similar_context = get_similar_context(user_id, message, limit=3)
+    if not similar_context:
+        return message
+    context_text = "\n".join(similar_context)
+    return f"Context from previous conversations:\n{context_text}\n\nCurrent question: {message}"
 
 class BrowserSession:
+    """One AI service's tab, driven through the shared async BrowserEngine.
+
+    Public methods are blocking and may be called from any HTTP worker
+    thread; the Playwright work runs as coroutines on the engine loop, where
+    a per-session lock keeps operations on one page in order while other
+    services proceed concurrently.
+    """
     def __init__(self, service_name, url):
         self.service_name = service_name
         self.url = url
-        self.playwright = None
-        self.browser = None
-        self.context = None
+        self.engine = get_engine()
         self.page = None
         self.is_active = False
         self.last_scraped_data = None
+        self._page_lock = None
+        # seq -> element for messages already scraped from the page.
+        self._scraped = OrderedDict()
+        # What the latest scrape is embedded as: the text of the messages
+        # that changed most recently, so an unchanged page re-embeds the
+        # same text and hits the embedding cache.
+        self.embedding_text = None
+        self._extractor_installed = False
+    
+    def _lock(self):
+        if self._page_lock is None:
+            self._page_lock = asyncio.Lock()
+        return self._page_lock
         
     def start_session(self):
         try:
@@ -53,29 +320,21 @@ class BrowserSession:
                 self.is_active = True
                 return True
             
-            self.playwright = sync_playwright().start()
             try:
-                self.browser = self.playwright.chromium.connect_over_cdp("http://localhost:9222")
-                self.context = self.browser.contexts[0] if self.browser.contexts else self.browser.new_context()
-                
-                existing_pages = self.context.pages
-                target_page = None
-                
-                for page in existing_pages:
-                    try:
-                        if self.url.replace('https://', '').replace('http://', '') in page.url:
-                            target_page = page
-                            break
-                    except:
-                        continue
-                
-                if target_page:
-                    self.page = target_page
-                    print(f"Connected to existing {self.service_name} tab")
-                else:
-                    self.page = self.context.new_page()
-                    self.page.goto(self.url)
+                self.page, opened = self.engine.run(self.engine.get_page(self.url))
+                if opened:
                     print(f"Opened new {self.service_name} tab")
+                else:
+                    print(f"Connected to existing {self.service_name} tab")
+                
+                try:
+                    self.engine.run(self._install_stream_observer())
+                except Exception as e:
+                    print(f"Response streaming unavailable for {self.service_name}: {e}")
+                try:
+                    self.engine.run(self._install_extractor())
+                except Exception as e:
+                    print(f"Could not install extractor for {self.service_name}: {e}")
                 
                 self.is_active = True
                 print(f"Successfully connected to {self.service_name} via CDP")
@@ -83,9 +342,7 @@ class BrowserSession:
                 
             except Exception as e:
                 print(f"Failed to connect via CDP, falling back to manual mode: {e}")
-                if self.playwright:
-                    self.playwright.stop()
-                    self.playwright = None
+                self.page = None
                 self.is_active = True
                 return True
                 
@@ -131,18 +388,15 @@ class BrowserSession:
             print(f"Error launching Chrome debugging: {e}")
             return False
     
-    def inject_message(self, message):
+    def inject_message(self, message, enhanced_message=None):
         if not self.is_active:
             return False
             
         try:
             print(f"Injecting message into {self.service_name}: {message}")
             
-            similar_context = get_similar_context("web_user", message, limit=3)
-            enhanced_message = message
-            if similar_context:
-                context_text = "\n".join(similar_context)
-                enhanced_message = f"Context from previous conversations:\n{context_text}\n\nCurrent question: {message}"
+            if enhanced_message is None:
+                enhanced_message = enhance_message(message)
             
             timestamp = datetime.now().isoformat()
             interaction_data = {
@@ -154,21 +408,17 @@ class BrowserSession:
                 'instructions': f'Message automatically injected into {self.service_name} using Playwright'
             }
             
-            filename = f"message_{self.service_name}_{timestamp.replace(':', '-')}.json"
-            filepath = os.path.join(STORAGE_PATH, filename)
-            
-            with open(filepath, 'w') as f:
-                json.dump(interaction_data, f, indent=2)
+            location = storage_log.append('message', interaction_data, self.service_name)
             
             if self.page:
-                success = self._inject_message_by_site(enhanced_message)
+                success = self.engine.run(self._inject_message_by_site(enhanced_message))
                 if success:
                     print(f"Successfully injected message into {self.service_name}")
                     return True
                 else:
                     print(f"Playwright injection failed, falling back to manual mode")
             
-            print(f"Enhanced message saved to: {filepath}")
+            print(f"Enhanced message saved to: {location['segment']} @ {location['offset']}")
             print(f"Enhanced message: {enhanced_message}")
             
             return True
@@ -177,7 +427,7 @@ class BrowserSession:
             print(f"Failed to inject message into {self.service_name}: {e}")
             return False
     
-    def _inject_message_by_site(self, message):
+    async def _inject_message_by_site(self, message):
         if not self.page:
             print(f"No page available for {self.service_name}, falling back to manual mode")
             return False
@@ -185,24 +435,26 @@ class BrowserSession:
         try:
             selectors = self._get_textarea_selectors()
             
-            for selector in selectors:
-                try:
-                    element = self.page.query_selector(selector)
-                    if element:
-                        print(f"Found textarea using selector: {selector}")
-                        
-                        element.click()
-                        element.fill("")
-                        element.type(message)
-                        
-                        self.page.keyboard.press("Enter")
-                        
-                        print(f"Successfully typed and sent message to {self.service_name}")
-                        return True
-                        
-                except Exception as e:
-                    print(f"Failed with selector {selector}: {e}")
-                    continue
+            async with self._lock():
+                for selector in selectors:
+                    try:
+                        element = await self.page.query_selector(selector)
+                        if element:
+                            print(f"Found textarea using selector: {selector}")
+                            
+                            await element.click()
+                            await element.fill("")
+                            await element.type(message)
+                            
+                            await self._start_response_watch()
+                            await self.page.keyboard.press("Enter")
+                            
+                            print(f"Successfully typed and sent message to {self.service_name}")
+                            return True
+                            
+                    except Exception as e:
+                        print(f"Failed with selector {selector}: {e}")
+                        continue
             
             print(f"Could not find suitable textarea for {self.service_name}")
             return False
@@ -238,6 +490,147 @@ class BrowserSession:
         
         return selectors_map.get(self.service_name, ['textarea', 'div[contenteditable="true"]', 'input[type="text"]'])
     
+    def _get_completion_heuristics(self):
+        """How to tell that a service has finished answering.
+
+        response_selector matches the assistant's messages, stop_selectors
+        match the "stop generating" control shown while streaming, and the
+        answer counts as complete once neither changes for stable_ms.
+        """
+        heuristics_map = {
+            'chatgpt': {
+                'response_selector': '[data-message-author-role="assistant"]',
+                'stop_selectors': ['button[data-testid="stop-button"]', 'button[aria-label*="Stop"]'],
+                'stable_ms': 1500
+            },
+            'claude': {
+                'response_selector': '[data-is-streaming], .font-claude-message',
+                'stop_selectors': ['[data-is-streaming="true"]', 'button[aria-label*="Stop"]'],
+                'stable_ms': 1500
+            },
+            'mistral': {
+                'response_selector': '[data-message-author-role="assistant"], .prose',
+                'stop_selectors': ['button[aria-label*="Stop"]'],
+                'stable_ms': 2000
+            },
+            'gemini': {
+                'response_selector': 'model-response',
+                'stop_selectors': ['button[aria-label*="Stop"]', '.stop-icon'],
+                'stable_ms': 2000
+            }
+        }
+        
+        default = {
+            'response_selector': '[data-message-author-role="assistant"], .message, .chat-message',
+            'stop_selectors': ['button[aria-label*="Stop"]'],
+            'stable_ms': 2500
+        }
+        heuristics = dict(heuristics_map.get(self.service_name, default))
+        # Give the site time to render the user's turn and show its stop
+        # button before stability alone can end the wait.
+        heuristics['min_wait_ms'] = 1000
+        return heuristics
+    
+    async def _start_response_watch(self):
+        """Start recording DOM mutations on the page just before sending."""
+        try:
+            await self.page.evaluate(RESPONSE_WATCH_SCRIPT, self._get_completion_heuristics())
+        except Exception as e:
+            print(f"Could not install response watcher for {self.service_name}: {e}")
+    
+    async def _install_stream_observer(self):
+        """Expose __aibStreamPush and start observing the assistant's messages.
+
+        The init script re-installs the observer after navigations; the
+        evaluate covers the document that is already loaded.
+        """
+        cfg = {'response_selector': self._get_completion_heuristics()['response_selector']}
+        try:
+            await self.page.expose_binding(
+                '__aibStreamPush',
+                lambda source, event: _dispatch_stream_push(self.service_name, source, event)
+            )
+        except Exception as e:
+            # A tab reused from an earlier session keeps its binding, which
+            # already dispatches by service name.
+            if 'already registered' not in str(e):
+                raise
+        else:
+            await self.page.add_init_script(script=f"({STREAM_SCRIPT})({json.dumps(cfg)})")
+        await self.page.evaluate(STREAM_SCRIPT, cfg)
+    
+    def publish(self, event):
+        publish_stream_event(self.service_name, event)
+    
+    def _get_extraction_config(self):
+        """Where a service renders chat turns and how to tell whose they are.
+
+        selectors are tried in order until one matches; roles maps a
+        selector matching the turn (or an ancestor) to its role, with the
+        data-message-author-role attribute and class names as fallbacks.
+        """
+        config_map = {
+            'chatgpt': {
+                'selectors': ['[data-message-author-role]'],
+                'roles': [['[data-message-author-role="user"]', 'user'],
+                          ['[data-message-author-role="assistant"]', 'assistant']]
+            },
+            'claude': {
+                'selectors': ['[data-testid="user-message"], .font-claude-message'],
+                'roles': [['[data-testid="user-message"]', 'user'],
+                          ['.font-claude-message', 'assistant']]
+            },
+            'mistral': {
+                'selectors': ['[data-message-author-role]'],
+                'roles': []
+            },
+            'gemini': {
+                'selectors': ['user-query, model-response'],
+                'roles': [['user-query', 'user'], ['model-response', 'assistant']]
+            }
+        }
+        
+        config = dict(config_map.get(self.service_name, {'selectors': [], 'roles': []}))
+        config['selectors'] = config['selectors'] + MESSAGE_SELECTORS
+        config['service'] = self.service_name
+        return config
+    
+    async def _install_extractor(self):
+        """Define window.__aibExtractor now and on every later navigation."""
+        config = self._get_extraction_config()
+        if not self._extractor_installed:
+            await self.page.add_init_script(script=f"({EXTRACTOR_SCRIPT})({json.dumps(config)})")
+            self._extractor_installed = True
+        await self.page.evaluate(EXTRACTOR_SCRIPT, config)
+    
+    def wait_for_response(self, timeout=RESPONSE_TIMEOUT):
+        """Block until the answer to the last injected message is complete.
+        
+        Returns True once a new response exists, no stop button is shown and
+        the DOM has been quiet for the service's stable_ms; False on timeout
+        or when there is no page to watch.
+        """
+        if not self.page:
+            return False
+        
+        start = time.time()
+        try:
+            self.engine.run(self._wait_for_response(timeout))
+            print(f"{self.service_name} finished responding in {time.time() - start:.1f}s")
+            return True
+        except Exception as e:
+            print(f"Stopped waiting for {self.service_name} after {time.time() - start:.1f}s: {e}")
+            return False
+    
+    async def _wait_for_response(self, timeout):
+        async with self._lock():
+            await self.page.wait_for_function(
+                RESPONSE_COMPLETE_SCRIPT,
+                arg=self._get_completion_heuristics(),
+                timeout=timeout * 1000,
+                polling=100
+            )
+    
     def scrape_current_data(self):
         if not self.is_active:
             return None
@@ -247,37 +640,7 @@ class BrowserSession:
             
             if self.page:
                 try:
-                    page_title = self.page.title()
-                    page_content = self.page.content()
-                    
-                    chat_elements = []
-                    
-                    message_selectors = [
-                        '[data-message-author-role]',
-                        '.message',
-                        '[role="presentation"]',
-                        '.conversation-turn',
-                        '.chat-message'
-                    ]
-                    
-                    for selector in message_selectors:
-                        try:
-                            elements = self.page.query_selector_all(selector)
-                            if elements:
-                                for i, element in enumerate(elements[-10:]):
-                                    try:
-                                        text = element.inner_text()
-                                        if text.strip():
-                                            chat_elements.append({
-                                                'role': 'message',
-                                                'text': text.strip(),
-                                                'html': element.inner_html()
-                                            })
-                                    except:
-                                        continue
-                                break
-                        except:
-                            continue
+                    page_title, new_elements, chat_elements = self.engine.run(self._scrape_page())
                     
                     if not chat_elements:
                         chat_elements = [{
@@ -294,11 +657,16 @@ class BrowserSession:
                         'timestamp': timestamp,
                         'title': page_title or f'{self.service_name} - Automated Chat Session',
                         'chat_elements': chat_elements,
+                        'new_elements_count': len(new_elements),
                         'full_text': full_text,
                         'status': 'automated_scraping_complete',
                         'instructions': f'Data automatically scraped from {self.service_name} using Playwright'
                     }
                     
+                    # Only what changed since the last scrape is embedded.
+                    if new_elements:
+                        self.embedding_text = ' '.join(elem['text'] for elem in new_elements)
+                    
                 except Exception as e:
                     print(f"Playwright scraping failed for {self.service_name}: {e}")
                     scraped_data = {
@@ -335,9 +703,10 @@ class BrowserSession:
                     'instructions': f'Please manually copy conversation data from the {self.service_name} browser tab'
                 }
             
-            model = get_embedding_model()
-            embedding = model.encode(scraped_data['full_text'])
-            scraped_data['embedding'] = embedding.tolist()
+            # Fallback and placeholder scrapes, and pages with no changed
+            # messages yet, are embedded by their full text.
+            if 'new_elements_count' not in scraped_data or not self.embedding_text:
+                self.embedding_text = scraped_data['full_text']
             
             self.last_scraped_data = scraped_data
             return scraped_data
@@ -346,6 +715,34 @@ class BrowserSession:
             print(f"Failed to scrape data for {self.service_name}: {e}")
             return None
     
+    async def _scrape_page(self):
+        """Fetch messages added or grown since the last scrape.
+        
+        Updates the session's scraped history and returns the page title,
+        the changed elements and the last 10 known elements.
+        """
+        async with self._lock():
+            result = await self.page.evaluate(EXTRACT_CALL)
+            if result is None:
+                await self._install_extractor()
+                result = await self.page.evaluate(EXTRACT_CALL)
+            
+            if result['reset']:
+                self._scraped.clear()
+                self.embedding_text = None
+            
+            new_elements = []
+            for element in result['elements']:
+                scraped = {'role': element['role'], 'text': element['text'],
+                           'html_hash': element['html_hash']}
+                self._scraped[element['seq']] = scraped
+                self._scraped.move_to_end(element['seq'])
+                new_elements.append(scraped)
+            while len(self._scraped) > SCRAPE_HISTORY:
+                self._scraped.popitem(last=False)
+            
+            return result['title'], new_elements, list(self._scraped.values())[-10:]
+    
     def _scrape_by_site(self):
         print(f"Manual scraping placeholder for {self.service_name}")
         return None
@@ -354,28 +751,14 @@ class BrowserSession:
         try:
             if self.page:
                 print(f"Closing Playwright page for {self.service_name}")
-                self.page.close()
+                self.engine.run(self.page.close())
                 self.page = None
-            
-            if self.context:
-                print(f"Closing Playwright context for {self.service_name}")
-                self.context.close()
-                self.context = None
-            
-            if self.browser:
-                print(f"Closing Playwright browser for {self.service_name}")
-                self.browser.close()
-                self.browser = None
-                
-            if self.playwright:
-                print(f"Stopping Playwright for {self.service_name}")
-                self.playwright.stop()
-                self.playwright = None
                 
         except Exception as e:
             print(f"Error closing session for {self.service_name}: {e}")
         
         self.is_active = False
+        self.publish({'type': 'closed'})
 
 class AIBrowserHandler(http.server.SimpleHTTPRequestHandler):
     def __init__(self, *args, **kwargs):
@@ -390,7 +773,13 @@ class AIBrowserHandler(http.server.SimpleHTTPRequestHandler):
             self.send_header('Content-type', 'application/json')
             self.send_header('Access-Control-Allow-Origin', '*')
             self.end_headers()
-            response = {"status": "healthy", "timestamp": datetime.now().isoformat()}
+            response = {
+                "status": "healthy",
+                "timestamp": datetime.now().isoformat(),
+                "ready": all(state == 'ready' for state in startup_stages.values()),
+                "stages": startup_stages,
+                "ingestion_pending": ingestion.pending()
+            }
             self.wfile.write(json.dumps(response).encode())
             return
         elif self.path == '/get_browser_sessions':
@@ -408,14 +797,105 @@ class AIBrowserHandler(http.server.SimpleHTTPRequestHandler):
                 }
             self.wfile.write(json.dumps(sessions_info).encode())
             return
+        elif self.path == '/embedding_cache_stats':
+            self.send_response(200)
+            self.send_header('Content-type', 'application/json')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            self.wfile.write(json.dumps(cache_stats()).encode())
+            return
+        elif self.path.startswith('/stored_records'):
+            query = parse_qs(urlparse(self.path).query)
+            param = lambda name: query[name][0] if name in query else None
+            try:
+                start, end, limit = param('start'), param('end'), param('limit')
+                start = float(start) if start else None
+                end = float(end) if end else None
+                limit = int(limit) if limit else None
+                if limit is not None and limit < 1:
+                    raise ValueError('limit must be positive')
+            except ValueError as e:
+                self.send_response(400)
+                self.send_header('Content-type', 'application/json')
+                self.send_header('Access-Control-Allow-Origin', '*')
+                self.end_headers()
+                self.wfile.write(json.dumps({'error': f'Invalid start, end or limit: {e}'}).encode())
+                return
+            self.stream_stored_records(service=param('service'), kind=param('kind'),
+                                       start=start, end=end, limit=limit)
+            return
+        elif urlparse(self.path).path == '/stream':
+            requested = parse_qs(urlparse(self.path).query).get('services', [''])[0]
+            self.stream_events({service for service in requested.split(',') if service} or None)
+            return
+        elif self.path.startswith('/stream/'):
+            service = urlparse(self.path).path[len('/stream/'):]
+            if service not in browser_sessions:
+                self.send_response(404)
+                self.send_header('Content-type', 'application/json')
+                self.send_header('Access-Control-Allow-Origin', '*')
+                self.end_headers()
+                self.wfile.write(json.dumps({'error': 'Browser session not found'}).encode())
+                return
+            self.stream_events({service}, until_closed=True)
+            return
         super().do_GET()
     
+    def stream_events(self, services, until_closed=False):
+        """Server-Sent Events feed of the sessions' response text.
+
+        Serves /stream (every service, or the comma-separated ?services=)
+        and /stream/<service>. Events carry data.service: 'reset' (data.text
+        replaces the current text), 'delta' (data.text is appended), 'done'
+        (the response finished) and 'closed' (the session ended). The
+        connection stays open across sessions until the client disconnects;
+        `until_closed` ends it with the single service's 'closed' instead.
+        """
+        self.send_response(200)
+        self.send_header('Content-type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        
+        subscription = (queue.Queue(maxsize=1000), services)
+        with stream_subscribers_lock:
+            stream_subscribers.append(subscription)
+        try:
+            self.wfile.write(b': connected\n\n')
+            self.wfile.flush()
+            while True:
+                try:
+                    event = subscription[0].get(timeout=STREAM_KEEPALIVE)
+                except queue.Empty:
+                    # Also how a vanished client is noticed.
+                    self.wfile.write(b': keepalive\n\n')
+                    self.wfile.flush()
+                    continue
+                if event is None:
+                    break
+                self.wfile.write(
+                    f"event: {event.get('type', 'delta')}\ndata: {json.dumps(event)}\n\n".encode())
+                self.wfile.flush()
+                if until_closed and event.get('type') == 'closed':
+                    break
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            with stream_subscribers_lock:
+                stream_subscribers.remove(subscription)
+    
     def do_POST(self):
+        global last_post_at
+        last_post_at = time.monotonic()
         try:
             content_length = int(self.headers['Content-Length'])
             post_data = self.rfile.read(content_length)
             data = json.loads(post_data.decode('utf-8'))
             
+            if self.path == '/ask_all' and data.get('stream'):
+                self.stream_ask_all(data)
+                return
+            
             self.send_response(200)
             self.send_header('Content-type', 'application/json')
             self.send_header('Access-Control-Allow-Origin', '*')
@@ -433,6 +913,8 @@ class AIBrowserHandler(http.server.SimpleHTTPRequestHandler):
                 result = scrape_chat_data(data)
             elif self.path == '/send_message_to_ai':
                 result = send_message_to_ai(data)
+            elif self.path == '/ask_all':
+                result = ask_all(data)
             else:
                 self.send_response(404)
                 self.end_headers()
@@ -448,6 +930,64 @@ class AIBrowserHandler(http.server.SimpleHTTPRequestHandler):
             error_response = {'error': str(e)}
             self.wfile.write(json.dumps(error_response).encode())
     
+    def stream_stored_records(self, **filters):
+        """Write storage log records as NDJSON, one line per record.
+
+        Records are read from the log as they are written out, so memory
+        use does not grow with the size of the log.
+        """
+        self.send_response(200)
+        self.send_header('Content-type', 'application/x-ndjson')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        try:
+            for record in read_stored_records(**filters):
+                self.wfile.write((json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8'))
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        except Exception as e:
+            print(f"Error streaming /stored_records: {e}")
+            self.wfile.write((json.dumps({'error': str(e)}) + '\n').encode())
+    
+    def stream_ask_all(self, data):
+        """Write /ask_all results as NDJSON, one line per service as it finishes.
+
+        Validation and context enhancement happen before the status line, so
+        their errors still get a normal JSON response; once streaming has
+        started, a failure is reported as a final {"error": ...} line.
+        """
+        error, message, sessions, timeouts = _parse_ask_all(data)
+        if error:
+            self.send_response(200)
+            self.send_header('Content-type', 'application/json')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            self.wfile.write(json.dumps(error).encode())
+            return
+        enhanced_message = enhance_message(message)
+        
+        self.send_response(200)
+        self.send_header('Content-type', 'application/x-ndjson')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        try:
+            completed = 0
+            for result in iter_ask_all(message, enhanced_message, sessions, timeouts):
+                completed += result['status'] in ('ok', 'partial')
+                self.wfile.write((json.dumps(result) + '\n').encode())
+                self.wfile.flush()
+            summary = {'done': True, 'message_sent': message,
+                       'services': len(sessions), 'completed': completed}
+            self.wfile.write((json.dumps(summary) + '\n').encode())
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        except Exception as e:
+            print(f"Error streaming /ask_all: {e}")
+            try:
+                self.wfile.write((json.dumps({'done': True, 'error': str(e)}) + '\n').encode())
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+    
     def do_OPTIONS(self):
         self.send_response(200)
         self.send_header('Access-Control-Allow-Origin', '*')
@@ -455,6 +995,26 @@ class AIBrowserHandler(http.server.SimpleHTTPRequestHandler):
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
         self.end_headers()
 
+class BoundedThreadingHTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    """Handles each request on a fixed-size worker pool.
+
+    A slow call such as send_message_to_ai no longer blocks /health polls or
+    requests for other services; extra requests queue for a free worker.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+    
+    def __init__(self, server_address, handler_class, max_workers=SERVER_WORKERS):
+        super().__init__(server_address, handler_class)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='http')
+    
+    def process_request(self, request, client_address):
+        self.executor.submit(self.process_request_thread, request, client_address)
+    
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=False)
+
 def start_browser_session(data):
     service = data.get('service')
     url = data.get('url')
@@ -462,14 +1022,17 @@ def start_browser_session(data):
     if not service or not url:
         return {'error': 'Missing service or URL'}
     
-    if service in browser_sessions:
-        browser_sessions[service].close_session()
+    with browser_sessions_lock:
+        previous = browser_sessions.pop(service, None)
+    if previous:
+        previous.close_session()
     
     session = BrowserSession(service, url)
     success = session.start_session()
     
     if success:
-        browser_sessions[service] = session
+        with browser_sessions_lock:
+            browser_sessions[service] = session
         return {
             'success': True,
             'service': service,
@@ -482,9 +1045,10 @@ def start_browser_session(data):
 def close_browser_session(data):
     service = data.get('service')
     
-    if service in browser_sessions:
-        browser_sessions[service].close_session()
-        del browser_sessions[service]
+    with browser_sessions_lock:
+        session = browser_sessions.pop(service, None)
+    if session:
+        session.close_session()
         return {'success': True, 'message': f'Closed session for {service}'}
     
     return {'error': 'Session not found'}
@@ -496,10 +1060,9 @@ def inject_message(data):
     if not service or not message:
         return {'error': 'Missing service or message'}
     
-    if service not in browser_sessions:
+    session = browser_sessions.get(service)
+    if not session:
         return {'error': 'Browser session not found'}
-    
-    session = browser_sessions[service]
     success = session.inject_message(message)
     
     if success:
@@ -518,26 +1081,20 @@ def scrape_chat_data(data):
     if not service:
         return {'error': 'Missing service'}
     
-    if service not in browser_sessions:
+    session = browser_sessions.get(service)
+    if not session:
         return {'error': 'Browser session not found. Please start a session first.'}
-    
-    session = browser_sessions[service]
     scraped_data = session.scrape_current_data()
     
     if not scraped_data:
         return {'error': 'Failed to scrape data'}
     
     try:
-        filename = f"{service}_{int(time.time())}.json"
-        filepath = os.path.join(STORAGE_PATH, filename)
-        
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(scraped_data, f, indent=2, ensure_ascii=False)
+        ingestion.submit_record('scrape', service, scraped_data, session.embedding_text)
         
         return {
             'success': True,
-            'filename': filename,
-            'filepath': filepath,
+            'stored': 'queued',
             'data_preview': {
                 'title': scraped_data['title'],
                 'chat_elements_count': len(scraped_data['chat_elements']),
@@ -549,8 +1106,15 @@ def scrape_chat_data(data):
         return {'error': str(e)}
 
 def get_scraped_files():
+    """List log segments, plus any per-event JSON files not yet consolidated."""
     try:
-        files = []
+        files = [{
+            'filename': os.path.join('segments', segment['filename']),
+            'size': segment['size'],
+            'modified': datetime.fromtimestamp(segment['modified']).isoformat(),
+            'records': segment['records'],
+            'archived': segment['archived']
+        } for segment in storage_log.segments()]
         for filename in os.listdir(STORAGE_PATH):
             if filename.endswith('.json'):
                 filepath = os.path.join(STORAGE_PATH, filename)
@@ -564,6 +1128,50 @@ def get_scraped_files():
     except Exception as e:
         return {'error': str(e)}
 
+def read_stored_records(service=None, kind=None, start=None, end=None, limit=None):
+    """Iterate records from the storage log; start/end are Unix timestamps.
+
+    At most `limit` records are yielded when it is given.
+    """
+    records = storage_log.read(start=start, end=end, service=service, kind=kind)
+    return islice(records, limit)
+
+def _latest_response(chat_elements):
+    """Text of the newest assistant turn, or of the newest turn if no roles are known."""
+    for element in reversed(chat_elements):
+        if element['role'] == 'assistant':
+            return element['text']
+    return chat_elements[-1]['text']
+
+def exchange_message(session, message, enhanced_message=None, timeout=RESPONSE_TIMEOUT):
+    """Send `message` to one session, wait for the answer and record it."""
+    success = session.inject_message(message, enhanced_message)
+    if not success:
+        return {'error': 'Failed to send message'}
+    
+    completed = session.wait_for_response(timeout)
+    session.publish({'type': 'done', 'complete': completed})
+    
+    # Embedding and storage happen on the ingestion workers, so the reply
+    # does not wait for the model or the database.
+    scraped_data = session.scrape_current_data()
+    latest_response = ""
+    if scraped_data:
+        ingestion.submit_record('response', session.service_name, scraped_data,
+                                session.embedding_text)
+        if scraped_data['chat_elements']:
+            latest_response = _latest_response(scraped_data['chat_elements'])
+            ingestion.submit_interaction("web_user", message, latest_response)
+    
+    return {
+        'success': True,
+        'service': session.service_name,
+        'message_sent': message,
+        'response_preview': latest_response[:500],
+        'response_complete': completed,
+        'stored': 'queued' if scraped_data else None
+    }
+
 def send_message_to_ai(data):
     service = data.get('service')
     message = data.get('message')
@@ -571,44 +1179,157 @@ def send_message_to_ai(data):
     if not service or not message:
         return {'error': 'Missing service or message'}
     
-    if service not in browser_sessions:
+    session = browser_sessions.get(service)
+    if not session:
         return {'error': 'Browser session not found'}
     
-    session = browser_sessions[service]
-    
-    success = session.inject_message(message)
-    if not success:
-        return {'error': 'Failed to send message'}
+    return exchange_message(session, message)
+
+def _parse_ask_all(data):
+    """Validate an /ask_all body.
+
+    Returns (error, message, sessions, timeouts). `services` optionally
+    limits the fan-out; `timeout` sets every service's deadline in seconds
+    and `timeouts` overrides it per service.
+    """
+    message = data.get('message')
+    if not message:
+        return {'error': 'Missing message'}, None, None, None
     
-    time.sleep(5)
+    requested = data.get('services')
+    with browser_sessions_lock:
+        sessions = {service: session for service, session in browser_sessions.items()
+                    if session.is_active and (not requested or service in requested)}
+    if not sessions:
+        return {'error': 'No active browser sessions'}, None, None, None
     
-    scraped_data = session.scrape_current_data()
-    if scraped_data:
-        filename = f"{service}_response_{int(time.time())}.json"
-        filepath = os.path.join(STORAGE_PATH, filename)
-        
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(scraped_data, f, indent=2, ensure_ascii=False)
-        
-        if scraped_data['chat_elements']:
-            latest_response = scraped_data['chat_elements'][-1]['text']
-            save_interaction("web_user", message, latest_response)
+    try:
+        default_timeout = float(data.get('timeout', RESPONSE_TIMEOUT))
+        overrides = data.get('timeouts') or {}
+        timeouts = {service: float(overrides.get(service, default_timeout)) for service in sessions}
+    except (TypeError, ValueError, AttributeError):
+        return {'error': 'Invalid timeout'}, None, None, None
+    return None, message, sessions, timeouts
+
+def _ask_all_result(service, future):
+    try:
+        result = future.result()
+    except Exception as e:
+        result = {'error': str(e)}
+    if 'error' in result:
+        status = 'error'
+    elif result.get('response_complete'):
+        status = 'ok'
+    else:
+        # The service's deadline passed; the preview is whatever had rendered.
+        status = 'partial'
+    return {'service': service, 'status': status, **result}
+
+def iter_ask_all(message, enhanced_message, sessions, timeouts):
+    """Send `message` to every session concurrently.
+
+    `enhanced_message` is the context enhancement, computed once by the
+    caller and shared. Yields one result per service as soon as it
+    finishes, with status 'ok', 'partial' (timed out mid-answer), 'error'
+    or 'timeout' (no result by the deadline).
+    """
+    futures = {
+        ask_all_executor.submit(exchange_message, session, message,
+                                enhanced_message, timeouts[service]): service
+        for service, session in sessions.items()
+    }
+    deadline = max(timeouts.values()) + ASK_ALL_GRACE
     
-    latest_response = ""
-    if scraped_data and scraped_data['chat_elements']:
-        latest_response = scraped_data['chat_elements'][-1]['text'] if scraped_data['chat_elements'] else ""
+    reported = set()
+    try:
+        for future in as_completed(futures, timeout=deadline):
+            reported.add(future)
+            yield _ask_all_result(futures[future], future)
+    except FutureTimeoutError:
+        for future, service in futures.items():
+            if future in reported:
+                continue
+            if future.done():
+                yield _ask_all_result(service, future)
+            else:
+                yield {'service': service, 'status': 'timeout',
+                       'error': f'No result within {timeouts[service] + ASK_ALL_GRACE:.0f}s'}
+
+def ask_all(data):
+    error, message, sessions, timeouts = _parse_ask_all(data)
+    if error:
+        return error
     
+    enhanced_message = enhance_message(message)
+    results = {result['service']: result
+               for result in iter_ask_all(message, enhanced_message, sessions, timeouts)}
     return {
-        'success': True,
-        'service': service,
+        'success': any(result['status'] in ('ok', 'partial') for result in results.values()),
         'message_sent': message,
-        'response_preview': latest_response[:500],
-        'scraped_file': filename if scraped_data else None
+        'results': results
     }
 
+def _legacy_record_kind(filename, file_data):
+    if filename.startswith('message_'):
+        return 'message'
+    if '_response_' in filename:
+        return 'response'
+    return 'scrape'
+
+def _iter_legacy_records(json_files):
+    """Yield log records from per-event JSON files, one file in memory at a time.
+
+    Older consolidated_data_*.json files are split back into their original
+    records; their duplicated all_interactions/all_embeddings are dropped.
+    """
+    for filepath, mtime in json_files:
+        filename = os.path.basename(filepath)
+        try:
+            with open(filepath, 'r', encoding='utf-8') as f:
+                file_data = json.load(f)
+            if not isinstance(file_data, dict):
+                raise ValueError(f"expected a JSON object, got {type(file_data).__name__}")
+        except Exception as e:
+            print(f"Error processing {filename}: {e}")
+            continue
+        
+        if filename.startswith('consolidated_data_') and 'consolidated_files' in file_data:
+            entries = file_data['consolidated_files']
+            entries = [entry for entry in entries if isinstance(entry, dict)] \
+                if isinstance(entries, list) else []
+            if not entries:
+                # Nothing to keep; a record-less source is still consumed.
+                yield {'ts': mtime, 'source': filepath}
+            for number, entry in enumerate(entries):
+                original = entry.get('original_filename', filename)
+                data = entry.get('file_data')
+                data = data if isinstance(data, dict) else {}
+                # The consolidated file is deleted with its last record.
+                yield {
+                    'ts': mtime,
+                    'kind': _legacy_record_kind(original, data),
+                    'service': data.get('service'),
+                    'data': {**data, 'source_file': original},
+                    'source': filepath if number == len(entries) - 1 else None
+                }
+        else:
+            yield {
+                'ts': mtime,
+                'kind': _legacy_record_kind(filename, file_data),
+                'service': file_data.get('service'),
+                'data': {**file_data, 'source_file': filename},
+                'source': filepath
+            }
+        print(f"Processed: {filename}")
+
 def consolidate_storage_files():
     """
-    Consolidate all JSON files in storage directory into a single file and delete originals
+    Move per-event JSON files in the storage directory into one log segment.
+    
+    Files are streamed oldest first into a temporary segment, which is
+    fsynced and renamed into place before the originals are deleted; memory
+    use is bounded by the largest single file, and a crash at any point
+    leaves every record either in the originals or in the log.
     """
     try:
         print(f"Checking for files to consolidate in: {STORAGE_PATH}")
@@ -617,99 +1338,103 @@ def consolidate_storage_files():
             print("Storage directory doesn't exist, skipping consolidation")
             return
         
-        json_files = [f for f in os.listdir(STORAGE_PATH) if f.endswith('.json')]
+        storage_log.finish_pending_imports()
+        json_files = []
+        with os.scandir(STORAGE_PATH) as entries:
+            for entry in entries:
+                if entry.name.endswith('.json') and entry.is_file():
+                    json_files.append((entry.path, entry.stat().st_mtime))
         
-        if len(json_files) <= 1:
-            print(f"Found {len(json_files)} JSON files, no consolidation needed")
+        if not json_files:
+            print("Found 0 JSON files, no consolidation needed")
             return
         
         print(f"Found {len(json_files)} JSON files to consolidate")
+        json_files.sort(key=lambda item: item[1])
         
-        consolidated_data = {
-            'consolidation_timestamp': datetime.now().isoformat(),
-            'original_files_count': len(json_files),
-            'consolidated_files': [],
-            'all_interactions': [],
-            'all_embeddings': []
-        }
-        
-        files_to_delete = []
-        
-        for filename in json_files:
-            filepath = os.path.join(STORAGE_PATH, filename)
-            try:
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    file_data = json.load(f)
-                
-                consolidated_data['consolidated_files'].append({
-                    'original_filename': filename,
-                    'file_data': file_data
-                })
-                
-                if 'chat_elements' in file_data:
-                    consolidated_data['all_interactions'].extend(file_data['chat_elements'])
-                
-                if 'embedding' in file_data:
-                    consolidated_data['all_embeddings'].append({
-                        'source_file': filename,
-                        'embedding': file_data['embedding']
-                    })
-                
-                files_to_delete.append(filepath)
-                print(f"Processed: {filename}")
-                
-            except Exception as e:
-                print(f"Error processing {filename}: {e}")
-                continue
-        
-        if not consolidated_data['consolidated_files']:
+        result = storage_log.import_records(_iter_legacy_records(json_files))
+        if not result:
             print("No valid files to consolidate")
             return
         
-        consolidated_filename = f"consolidated_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        consolidated_filepath = os.path.join(STORAGE_PATH, consolidated_filename)
-        
-        with open(consolidated_filepath, 'w', encoding='utf-8') as f:
-            json.dump(consolidated_data, f, indent=2, ensure_ascii=False)
-        
-        for filepath in files_to_delete:
-            try:
-                os.remove(filepath)
-                print(f"Deleted: {os.path.basename(filepath)}")
-            except Exception as e:
-                print(f"Error deleting {filepath}: {e}")
-        
-        print(f"Consolidation complete! Created: {consolidated_filename}")
-        print(f"Consolidated {len(files_to_delete)} files into 1 file")
+        if result['segment']:
+            print(f"Consolidation complete! Created: segments/{result['segment']}")
+        print(f"Consolidated {len(result['sources'])} files into {result['records']} log records")
         
     except Exception as e:
         print(f"Error during file consolidation: {e}")
 
+def maintain_storage():
+    """Background housekeeping: consolidate legacy files, then archive old segments."""
+    consolidate_storage_files()
+    try:
+        for archive in storage_log.archive_segments():
+            print(f"Archived {archive['segment']}: {archive['plain_size']} -> {archive['archived_size']} bytes")
+    except Exception as e:
+        print(f"Error archiving storage segments: {e}")
+
+def reembed_when_idle():
+    """Background job: move stale embeddings to the current model in small steps."""
+    while True:
+        time.sleep(REEMBED_INTERVAL)
+        if time.monotonic() - last_post_at < REEMBED_IDLE_AFTER or ingestion.pending():
+            continue
+        try:
+            done = reembed_stale_rows(REEMBED_BUDGET)
+        except Exception as e:
+            print(f"Error re-embedding stale conversations: {e}")
+            continue
+        if done:
+            print(f"Re-embedded {done} conversations with the current model")
+
 def signal_handler(sig, frame):
     print('\nShutting down browser sessions...')
-    for session in browser_sessions.values():
+    with browser_sessions_lock:
+        sessions = list(browser_sessions.values())
+    for session in sessions:
         session.close_session()
+    shutdown_engine()
+    close_streams()
+    ingestion.stop()
+    save_indexes()
+    close_db()
+    storage_log.close()
+    embedding_provider.stop_serving(embedding_server)
     if server:
         server.shutdown()
     sys.exit(0)
 
 def main():
-    global server
+    global server, embedding_server
     signal.signal(signal.SIGINT, signal_handler)
     
     print("Initializing database...")
-    init_db()
-    
-    print("Consolidating storage files...")
-    consolidate_storage_files()
+    _run_startup_stage('database', init_db)
+    embedding_server = embedding_provider.serve()
+    threading.Thread(
+        target=_run_startup_stage,
+        args=('embedding_model', embedding_provider.warm_up),
+        daemon=True
+    ).start()
     
     PORT = 5001
     print(f"Starting AI Browser Server on port {PORT}")
     print(f"Storage path: {STORAGE_PATH}")
     print("Open http://localhost:5001 in your browser")
     
-    with socketserver.TCPServer(("", PORT), AIBrowserHandler) as httpd:
+    with BoundedThreadingHTTPServer(("", PORT), AIBrowserHandler) as httpd:
         server = httpd
+        startup_stages['server'] = 'ready'
+        # Schema migrations and the embedding matrix sync can take minutes on
+        # a large database; /health reports them as database_migrations.
+        threading.Thread(
+            target=_run_startup_stage,
+            args=('database_migrations', migrate_db),
+            daemon=True
+        ).start()
+        print("Consolidating storage files in the background...")
+        threading.Thread(target=maintain_storage, name='storage-maintenance', daemon=True).start()
+        threading.Thread(target=reembed_when_idle, name='reembed-stale', daemon=True).start()
         try:
             httpd.serve_forever()
         except KeyboardInterrupt:
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Benchmark embedding backends against the default PyTorch backend.
+
+For every backend this reports single-text latency (p50/p99), batched
+throughput, and cosine-similarity parity with the 'torch' reference on two
+corpora: the texts in sample_storage_files/ and a synthetic larger one.
+
+Usage:
+    python benchmarks/bench_embeddings.py
+    python benchmarks/bench_embeddings.py --backends torch int8 onnx --synthetic 5000
+"""
+
+import argparse
+import glob
+import json
+import os
+import random
+import sys
+import time
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from embedding_provider import LocalEmbeddingProvider, EMBEDDING_BACKENDS  # noqa: E402
+
+WORDS = (
+    "model context embedding vector query answer question user assistant "
+    "search memory latency browser session message response python data "
+    "training network layer token sequence attention cache index storage "
+    "machine learning language semantic similarity conversation history"
+).split()
+
+
+def load_sample_corpus():
+    """Collect every text field from the sample storage files."""
+    texts = []
+    for path in sorted(glob.glob(os.path.join(ROOT, 'sample_storage_files', '*.json'))):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        for element in data.get('chat_elements', []):
+            texts.append(element['text'])
+        for field in ('full_text', 'message', 'enhanced_message'):
+            if data.get(field):
+                texts.append(data[field])
+    return texts
+
+
+def make_synthetic_corpus(size, seed=0):
+    rng = random.Random(seed)
+    return [' '.join(rng.choice(WORDS) for _ in range(rng.randint(5, 120)))
+            for _ in range(size)]
+
+
+def percentile_ms(samples, q):
+    return float(np.percentile(samples, q) * 1000)
+
+
+def bench_backend(provider, corpus, latency_samples, batch_size):
+    provider.load()
+    provider.encode(corpus[:batch_size], batch_size=batch_size)  # warm-up
+
+    latencies = []
+    for text in corpus[:latency_samples]:
+        start = time.perf_counter()
+        provider.encode([text], batch_size=1)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    embeddings = np.asarray(provider.encode(corpus, batch_size=batch_size),
+                            dtype=np.float32)
+    elapsed = time.perf_counter() - start
+
+    return embeddings, {
+        'p50_ms': percentile_ms(latencies, 50),
+        'p99_ms': percentile_ms(latencies, 99),
+        'texts_per_sec': len(corpus) / elapsed,
+    }
+
+
+def cosine_parity(reference, candidate):
+    reference = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    candidate = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    cosines = np.sum(reference * candidate, axis=1)
+    return {'mean_cosine': float(cosines.mean()), 'min_cosine': float(cosines.min())}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--backends', nargs='+', default=list(EMBEDDING_BACKENDS),
+                        choices=EMBEDDING_BACKENDS)
+    parser.add_argument('--synthetic', type=int, default=2000,
+                        help='size of the synthetic corpus')
+    parser.add_argument('--latency-samples', type=int, default=200)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--json', help='also write results to this file')
+    args = parser.parse_args()
+
+    corpora = {
+        'sample_storage_files': load_sample_corpus(),
+        f'synthetic_{args.synthetic}': make_synthetic_corpus(args.synthetic),
+    }
+    backends = ['torch'] + [b for b in args.backends if b != 'torch']
+
+    results = []
+    for corpus_name, corpus in corpora.items():
+        reference = None
+        for backend in backends:
+            try:
+                provider = LocalEmbeddingProvider(backend=backend)
+                embeddings, row = bench_backend(provider, corpus,
+                                                args.latency_samples,
+                                                args.batch_size)
+            except Exception as e:
+                print(f"{corpus_name:<24} {backend:<6} unavailable: {e}")
+                continue
+            if backend == 'torch':
+                reference = embeddings
+            if reference is not None:
+                row.update(cosine_parity(reference, embeddings))
+            row.update({'corpus': corpus_name, 'backend': backend,
+                        'texts': len(corpus)})
+            results.append(row)
+            print(f"{corpus_name:<24} {backend:<6} "
+                  f"p50 {row['p50_ms']:7.2f} ms  p99 {row['p99_ms']:7.2f} ms  "
+                  f"{row['texts_per_sec']:8.1f} texts/s  "
+                  f"parity mean {row.get('mean_cosine', float('nan')):.4f} "
+                  f"min {row.get('min_cosine', float('nan')):.4f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
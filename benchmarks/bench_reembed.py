@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Benchmark reembed.py's throughput across worker counts.
+
+Builds a database of synthetic conversations once, then for each worker
+count re-embeds a fresh copy of it with `reembed.py --restart` in its own
+directory and reports rows/sec (model loading in the workers included).
+
+Usage:
+    python benchmarks/bench_reembed.py
+    python benchmarks/bench_reembed.py --rows 50000 --workers 1 2 4 8 --json reembed.json
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORDS = (
+    "model context embedding vector query answer question user assistant "
+    "search memory latency browser session message response python data "
+    "training network layer token sequence attention cache index storage"
+).split()
+
+
+def build_database(path, rows, seed=0):
+    """A schema v2 conversations table; reembed.py migrates it on open."""
+    rng = random.Random(seed)
+    connection = sqlite3.connect(path)
+    connection.execute("""
+        CREATE TABLE conversations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT,
+            timestamp TEXT,
+            user_input TEXT,
+            bot_response TEXT,
+            user_input_embedding TEXT,
+            bot_response_embedding TEXT,
+            combined_embedding TEXT
+        )
+    """)
+    connection.executemany(
+        "INSERT INTO conversations (user_id, timestamp, user_input, bot_response) VALUES (?, ?, ?, ?)",
+        [('web_user', str(1.7e9 + i),
+          ' '.join(rng.choice(WORDS) for _ in range(rng.randint(5, 30))),
+          ' '.join(rng.choice(WORDS) for _ in range(rng.randint(20, 120))))
+         for i in range(rows)])
+    connection.execute("PRAGMA user_version = 2")
+    connection.commit()
+    connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--workers', nargs='+', type=int, default=[1, 2, 4, 8])
+    parser.add_argument('--shard-size', type=int, default=500)
+    parser.add_argument('--json', help='also write results to this file')
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix='bench_reembed_')
+    results = []
+    try:
+        base = os.path.join(work, 'base.db')
+        build_database(base, args.rows)
+        for workers in args.workers:
+            run_dir = os.path.join(work, f"workers-{workers}")
+            os.makedirs(run_dir)
+            # database.py opens database.db relative to the working directory.
+            shutil.copy(base, os.path.join(run_dir, 'database.db'))
+            summary = os.path.join(run_dir, 'summary.json')
+            subprocess.run(
+                [sys.executable, os.path.join(ROOT, 'reembed.py'), '--workers', str(workers),
+                 '--shard-size', str(args.shard_size), '--restart', '--json', summary],
+                cwd=run_dir, check=True, stdout=subprocess.DEVNULL,
+                # Its own socket path, so a running backend does not stop it.
+                env={**os.environ,
+                     'EMBEDDING_SOCKET_PATH': os.path.join(run_dir, 'embeddings.sock')})
+            with open(summary) as f:
+                results.append(json.load(f))
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    print(f"{args.rows} rows, {os.cpu_count()} CPUs")
+    print(f"{'workers':>8} {'seconds':>9} {'rows/s':>9} {'speedup':>8}")
+    for row in results:
+        row['speedup'] = row['rows_per_sec'] / results[0]['rows_per_sec']
+        print(f"{row['workers']:>8} {row['seconds']:9.1f} {row['rows_per_sec']:9.0f} "
+              f"{row['speedup']:7.2f}x")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
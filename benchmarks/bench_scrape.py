@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Benchmark chat scraping against a local fixture page.
+
+Compares the per-element scrape loop that BrowserSession used before
+(page.content(), query_selector_all, then inner_text/inner_html per handle)
+with the in-page extractor (one page.evaluate). Three cases are timed per
+conversation length: a full scrape of a fresh page, a scrape after one new
+message, and a scrape with nothing new.
+
+Usage:
+    python benchmarks/bench_scrape.py
+    python benchmarks/bench_scrape.py --turns 10 100 1000 --repeats 50
+    python benchmarks/bench_scrape.py --cdp-url http://localhost:9222
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURE = os.path.join(ROOT, 'benchmarks', 'fixtures', 'chat_fixture.html')
+sys.path.insert(0, ROOT)
+# Importing app creates its storage directory; keep that out of $HOME.
+os.environ.setdefault('AI_STORAGE_PATH', tempfile.mkdtemp(prefix='bench_scrape_'))
+
+from app import EXTRACTOR_SCRIPT, EXTRACT_CALL, MESSAGE_SELECTORS  # noqa: E402
+
+EXTRACTOR_CONFIG = {
+    'service': 'chatgpt',
+    'selectors': ['[data-message-author-role]'] + MESSAGE_SELECTORS,
+    'roles': [['[data-message-author-role="user"]', 'user'],
+              ['[data-message-author-role="assistant"]', 'assistant']]
+}
+
+
+async def legacy_scrape(page):
+    """The scrape loop as it was before the in-page extractor."""
+    await page.title()
+    await page.content()
+    chat_elements = []
+    for selector in MESSAGE_SELECTORS:
+        elements = await page.query_selector_all(selector)
+        if elements:
+            for element in elements[-10:]:
+                text = await element.inner_text()
+                if text.strip():
+                    chat_elements.append({
+                        'role': 'message',
+                        'text': text.strip(),
+                        'html': await element.inner_html()
+                    })
+            break
+    return chat_elements
+
+
+async def extractor_scrape(page):
+    return (await page.evaluate(EXTRACT_CALL))['elements']
+
+
+async def open_fixture(context, turns, install):
+    page = await context.new_page()
+    await page.goto(f"file://{FIXTURE}?turns={turns}")
+    if install:
+        await page.evaluate(EXTRACTOR_SCRIPT, EXTRACTOR_CONFIG)
+    return page
+
+
+async def time_case(context, turns, repeats, scrape, install):
+    """Return median ms for (full, one new message, nothing new) scrapes."""
+    timings = {'full': [], 'one_new': [], 'unchanged': []}
+    for _ in range(repeats):
+        page = await open_fixture(context, turns, install)
+        for case in ('full', 'one_new', 'unchanged'):
+            if case == 'one_new':
+                await page.evaluate("() => appendTurn('assistant')")
+            start = time.perf_counter()
+            await scrape(page)
+            timings[case].append(time.perf_counter() - start)
+        await page.close()
+    return {case: float(np.median(samples) * 1000) for case, samples in timings.items()}
+
+
+async def run(args):
+    from playwright.async_api import async_playwright
+    async with async_playwright() as playwright:
+        if args.cdp_url:
+            browser = await playwright.chromium.connect_over_cdp(args.cdp_url)
+        else:
+            browser = await playwright.chromium.launch()
+        context = await browser.new_context()
+
+        results = []
+        for turns in args.turns:
+            for name, scrape, install in (('legacy', legacy_scrape, False),
+                                          ('extractor', extractor_scrape, True)):
+                row = await time_case(context, turns, args.repeats, scrape, install)
+                row.update({'method': name, 'turns': turns})
+                results.append(row)
+                print(f"{turns:>6} turns  {name:<9}  full {row['full']:8.2f} ms  "
+                      f"one new {row['one_new']:8.2f} ms  "
+                      f"unchanged {row['unchanged']:8.2f} ms")
+
+        await context.close()
+        await browser.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--turns', nargs='+', type=int, default=[10, 100, 500])
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--cdp-url', help='use a running Chrome instead of launching one')
+    parser.add_argument('--json', help='also write results to this file')
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Benchmark the storage log's archive tier.
+
+Builds a synthetic history from the records in sample_storage_files/
+(varied text and HTML, 384-dim embeddings), then reports bytes on disk and
+read throughput for: one pretty-printed JSON file per event (the old
+format), plain JSONL segments, and the gzip / zstd / zstd+dictionary
+archives produced by SegmentedLog.archive_segments().
+
+Usage:
+    python benchmarks/bench_storage.py
+    python benchmarks/bench_storage.py --records 20000 --json storage.json
+"""
+
+import argparse
+import glob
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from storage_log import SegmentedLog, zstd_available  # noqa: E402
+
+WORDS = (
+    "model context embedding vector query answer question user assistant "
+    "search memory latency browser session message response python data "
+    "training network layer token sequence attention cache index storage"
+).split()
+
+
+def load_templates():
+    templates = []
+    for path in sorted(glob.glob(os.path.join(ROOT, 'sample_storage_files', '*.json'))):
+        with open(path, 'r', encoding='utf-8') as f:
+            templates.append(json.load(f))
+    return templates
+
+
+def make_records(count, seed=0):
+    """Sample records with fresh text, HTML and a full-size embedding."""
+    rng = random.Random(seed)
+    templates = load_templates()
+    services = ['chatgpt', 'claude', 'mistral', 'gemini']
+    for i in range(count):
+        record = json.loads(json.dumps(templates[i % len(templates)]))
+        service = services[i % len(services)]
+        record['service'] = service
+        text = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(20, 200)))
+        if 'chat_elements' in record:
+            for element in record['chat_elements']:
+                element['text'] = text
+                element['html'] = f"<div class='{element['role']}-message'><p>{text}</p></div>"
+            record['full_text'] = text
+            record['embedding'] = [rng.uniform(-0.2, 0.2) for _ in range(384)]
+        else:
+            record['message'] = text
+            record['enhanced_message'] = text
+        yield service, record
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def time_read(log, repeats):
+    """Records/s and seconds for a full read(), best of `repeats`."""
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        count = sum(1 for _ in log.read())
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return count / best, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--records', type=int, default=5000)
+    parser.add_argument('--segment-mb', type=float, default=8)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--json', help='also write results to this file')
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix='bench_storage_')
+    results = []
+    try:
+        files_dir = os.path.join(work, 'files')
+        os.makedirs(files_dir)
+        for i, (service, record) in enumerate(make_records(args.records)):
+            with open(os.path.join(files_dir, f"{service}_{i}.json"), 'w', encoding='utf-8') as f:
+                json.dump(record, f, indent=2, ensure_ascii=False)
+        files_size = directory_size(files_dir)
+        start = time.perf_counter()
+        for name in os.listdir(files_dir):
+            with open(os.path.join(files_dir, name), 'r', encoding='utf-8') as f:
+                json.load(f)
+        files_read = time.perf_counter() - start
+        results.append({'format': 'json files (indent=2)', 'bytes': files_size,
+                        'records_per_sec': args.records / files_read})
+
+        variants = [('jsonl', None, False), ('gzip', 'gzip', False)]
+        if zstd_available():
+            variants += [('zstd', 'zstd', False), ('zstd+dict', 'zstd', True)]
+        else:
+            print("zstandard not installed; skipping zstd variants")
+
+        for name, codec, use_dictionary in variants:
+            log_dir = os.path.join(work, name)
+            log = SegmentedLog(log_dir, max_segment_bytes=int(args.segment_mb * 1024 * 1024),
+                               fsync='never')
+            for service, record in make_records(args.records):
+                log.append('scrape', record, service)
+            log.close()
+
+            log = SegmentedLog(log_dir)
+            archive_seconds = 0.0
+            if codec:
+                start = time.perf_counter()
+                log.archive_segments(older_than=0, codec=codec, use_dictionary=use_dictionary)
+                archive_seconds = time.perf_counter() - start
+            records_per_sec, _ = time_read(log, args.repeats)
+            results.append({'format': name, 'bytes': directory_size(log_dir),
+                            'records_per_sec': records_per_sec,
+                            'archive_seconds': archive_seconds})
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    print(f"{args.records} records")
+    print(f"{'format':<22} {'MB':>9} {'ratio':>7} {'read rec/s':>12} {'archive s':>10}")
+    for row in results:
+        row['ratio'] = files_size / row['bytes']
+        print(f"{row['format']:<22} {row['bytes'] / 1e6:9.2f} {row['ratio']:6.1f}x "
+              f"{row['records_per_sec']:12.0f} {row.get('archive_seconds', 0):10.2f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
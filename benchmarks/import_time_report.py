@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Summarize `python -X importtime` output for a module to catch startup regressions.
+
+Runs `import <module>` in a fresh interpreter, prints the total import time and
+the slowest top-level imports, and optionally fails when the total exceeds a
+budget or a recorded baseline by more than a tolerance.
+
+Usage:
+    python benchmarks/import_time_report.py                  # report for app.py
+    python benchmarks/import_time_report.py --budget-ms 500
+    python benchmarks/import_time_report.py --save-baseline import_baseline.json
+    python benchmarks/import_time_report.py --baseline import_baseline.json
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(module, runs):
+    """Return per-package cumulative microseconds, best of `runs`."""
+    best = None
+    env = dict(os.environ)
+    # Importing app creates its storage directory; keep that out of $HOME.
+    env.setdefault('AI_STORAGE_PATH', tempfile.mkdtemp(prefix='import_time_'))
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+            cwd=ROOT, env=env, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise SystemExit(f"import {module} failed:\n{result.stderr}")
+
+        timings = {}
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or 'self [us]' in line:
+                continue
+            self_us, cumulative_us, name = line[len('import time:'):].split('|')
+            depth = len(name) - len(name.lstrip())
+            timings.setdefault(name.strip(), (int(self_us), int(cumulative_us), depth))
+        total = timings.get(module, (0, 0, 0))[1]
+        if best is None or total < best[0]:
+            best = (total, timings)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('module', nargs='?', default='app')
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--budget-ms', type=float)
+    parser.add_argument('--baseline', help='JSON file from --save-baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed slowdown vs baseline (0.2 = 20%%)')
+    parser.add_argument('--save-baseline')
+    args = parser.parse_args()
+
+    total_us, timings = measure(args.module, args.runs)
+    # Direct imports of the measured module sit one level below it.
+    module_depth = timings[args.module][2]
+    direct = [(name, cumulative) for name, (_, cumulative, depth) in timings.items()
+              if depth == module_depth + 2]
+    direct.sort(key=lambda item: item[1], reverse=True)
+
+    print(f"import {args.module}: {total_us / 1000:.1f} ms (best of {args.runs})")
+    print(f"{'cumulative ms':>14}  import")
+    for name, cumulative in direct[:args.top]:
+        print(f"{cumulative / 1000:14.1f}  {name}")
+
+    failed = False
+    if args.budget_ms is not None and total_us / 1000 > args.budget_ms:
+        print(f"FAIL: {total_us / 1000:.1f} ms exceeds budget of {args.budget_ms} ms")
+        failed = True
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline_us = json.load(f)['total_us']
+        limit = baseline_us * (1 + args.tolerance)
+        if total_us > limit:
+            print(f"FAIL: {total_us / 1000:.1f} ms is more than "
+                  f"{args.tolerance:.0%} over baseline {baseline_us / 1000:.1f} ms")
+            failed = True
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump({'module': args.module, 'total_us': total_us,
+                       'imports': dict(direct)}, f, indent=2)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
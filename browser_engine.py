@@ -0,0 +1,127 @@
+"""
+browser_engine.py
+-----------------
+One async Playwright driver and one CDP connection shared by every
+BrowserSession.
+
+Instructions:
+- The engine runs its own asyncio event loop on a background thread; all
+  Playwright objects live on that loop.
+- Sessions call run() (blocking) or submit() (returns a Future) with a
+  coroutine; coroutines for different services interleave on the loop, so
+  injection and scraping proceed concurrently across services.
+- Each service gets its own page (tab) in the shared browser context.
+"""
+
+import asyncio
+import os
+import threading
+
+CDP_URL = os.environ.get('AI_CDP_URL', 'http://localhost:9222')
+
+
+class BrowserEngine:
+    def __init__(self, cdp_url=CDP_URL):
+        self.cdp_url = cdp_url
+        self.loop = None
+        self.thread = None
+        self.playwright = None
+        self.browser = None
+        self.context = None
+        self._start_lock = threading.Lock()
+        self._connect_lock = None
+
+    def start(self):
+        """Start the event loop thread if it is not already running."""
+        with self._start_lock:
+            if self.loop is not None:
+                return
+            self.loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def run_loop():
+                asyncio.set_event_loop(self.loop)
+                self._connect_lock = asyncio.Lock()
+                ready.set()
+                self.loop.run_forever()
+
+            self.thread = threading.Thread(target=run_loop, name='playwright-engine', daemon=True)
+            self.thread.start()
+            ready.wait()
+
+    def submit(self, coro):
+        """Schedule a coroutine on the engine loop; returns a concurrent Future."""
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        """Run a coroutine on the engine loop and wait for its result."""
+        return self.submit(coro).result(timeout)
+
+    async def connect(self):
+        """Connect the shared driver to Chrome over CDP, reconnecting if needed."""
+        async with self._connect_lock:
+            if self.browser is not None and self.browser.is_connected():
+                return self.context
+
+            from playwright.async_api import async_playwright
+            if self.playwright is None:
+                self.playwright = await async_playwright().start()
+            self.browser = await self.playwright.chromium.connect_over_cdp(self.cdp_url)
+            self.context = self.browser.contexts[0] if self.browser.contexts else await self.browser.new_context()
+            print(f"Connected shared Playwright engine to {self.cdp_url}")
+            return self.context
+
+    async def get_page(self, url):
+        """Return the open tab for `url`, opening one if none exists."""
+        context = await self.connect()
+        bare_url = url.replace('https://', '').replace('http://', '')
+        for page in context.pages:
+            if bare_url in page.url:
+                return page, False
+
+        page = await context.new_page()
+        await page.goto(url)
+        return page, True
+
+    async def _close(self):
+        if self.browser is not None:
+            # For a CDP connection this disconnects; Chrome keeps running.
+            await self.browser.close()
+            self.browser = None
+            self.context = None
+        if self.playwright is not None:
+            await self.playwright.stop()
+            self.playwright = None
+
+    def shutdown(self, timeout=10):
+        """Disconnect from Chrome and stop the loop thread."""
+        if self.loop is None:
+            return
+        try:
+            self.run(self._close(), timeout)
+        except Exception as e:
+            print(f"Error shutting down Playwright engine: {e}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout)
+        self.loop = None
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """Return the process-wide BrowserEngine."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = BrowserEngine()
+        return _engine
+
+
+def shutdown_engine():
+    with _engine_lock:
+        engine = _engine
+    if engine is not None:
+        engine.shutdown()
@@ -8,27 +8,226 @@ Instructions:
 - Provide helper functions to save interactions with embeddings and retrieve
   context using similarity search.
 - Support both raw text storage and vector embeddings for semantic search.
+- Store embeddings as packed little-endian float32 BLOBs in a side table
+  keyed by conversation id; the JSON text columns are legacy (schema v1).
+- conversations.created_at holds the epoch time as REAL and is indexed with
+  user_id, so recent-context lookups are an index range scan (schema v3);
+  the TEXT timestamp column is kept for compatibility.
+- Keep a per-user vector index (see vector_index.py) in memory and persisted
+  under INDEX_DIR; small users are searched exactly, large ones via IVF.
+- conversation_embeddings.model records the model that produced each row
+  (schema v4). Searches only compare vectors from MODEL_VERSION: the
+  per-user indexes and the shared matrix are keyed by it, and
+  reembed_stale_rows() moves rows from other models over in small,
+  time-budgeted steps.
+- Mirror every combined embedding into a shared EmbeddingMatrix file
+  (MATRIX_PATH) so other processes can search with np.memmap instead of
+  loading their own copy; see get_shared_similar_context.
+- Connections run in WAL mode. Reads use one connection per thread
+  (_reader); all writes go through DatabaseWriter, a single thread that
+  group-commits queued jobs every WRITE_BATCH_MS or WRITE_BATCH_ROWS.
+- get_similar_context results are memoized for CONTEXT_CACHE_TTL seconds per
+  (user, query, data version); every write bumps the data version.
 """
 
+import hashlib
+import os
+import queue
 import sqlite3
+import threading
 import time
 import json
 import numpy as np
-from typing import List
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Dict, List
+from vector_index import AdaptiveIndex, EmbeddingMatrix
+import embedding_provider
 
 DB_FILE = "database.db"
-conn = None
-embedding_model = None
-
-
-def init_db():
-    """Initialize the database and create tables if they don't exist."""
-    global conn, embedding_model
-    conn = sqlite3.connect(DB_FILE, check_same_thread=False)
-    cursor = conn.cursor()
-
+SCHEMA_VERSION = 4
+EMBEDDING_DTYPE = np.dtype('<f4')
+MIGRATION_BATCH_SIZE = 500
+EMBEDDING_BATCH_SIZE = 64
+INDEX_DIR = DB_FILE + ".index"
+# Users with fewer rows than ANN_MIN_ROWS are searched exactly; above it the
+# IVF index scans ANN_NPROBE partitions (higher = better recall, slower).
+ANN_MIN_ROWS = int(os.environ.get('ANN_MIN_ROWS', 50000))
+ANN_NPROBE = int(os.environ.get('ANN_NPROBE', 8))
+INDEX_SAVE_INTERVAL = 1000
+# Vectors from different models are not comparable. Backends of one model
+# (torch, onnx, int8) stay close enough to share a version.
+MODEL_VERSION = embedding_provider.EMBEDDING_MODEL_NAME
+MODEL_TAG = hashlib.sha1(MODEL_VERSION.encode('utf-8')).hexdigest()[:8]
+# The only model embeddings were written with before schema v4 tracked it.
+LEGACY_MODEL_VERSION = 'all-MiniLM-L6-v2'
+MATRIX_PATH = f"{DB_FILE}.matrix-{MODEL_TAG}"
+# A writer waits up to WRITE_BATCH_MS after the first queued job for more
+# and commits at most WRITE_BATCH_ROWS jobs per transaction.
+WRITE_BATCH_MS = float(os.environ.get('DB_WRITE_BATCH_MS', 5))
+WRITE_BATCH_ROWS = int(os.environ.get('DB_WRITE_BATCH_ROWS', 256))
+DB_MMAP_SIZE = int(os.environ.get('DB_MMAP_SIZE', 256 * 1024 * 1024))
+DB_CACHE_SIZE_KB = int(os.environ.get('DB_CACHE_SIZE_KB', 64 * 1024))
+_writer = None
+_local = threading.local()
+_user_indexes: Dict[str, AdaptiveIndex] = {}
+# Indexes being loaded, by user; _user_indexes_lock guards both dicts and is
+# never held while an index is read from disk or the database.
+_index_loads: Dict[str, "_IndexLoad"] = {}
+_user_indexes_lock = threading.Lock()
+# Written only by the process that called init_db(); read by any process.
+_matrix = EmbeddingMatrix(MATRIX_PATH)
+# The last conversation id migrate_db() caught the matrix up to; None until
+# then. New rows are left to that catch-up instead of being appended, and a
+# save committed together with it must not append its rows a second time.
+_matrix_synced_id = None
+# The conversation id reembed_stale_rows() resumes after, so each batch
+# starts where the last one stopped; None once a pass found nothing left,
+# so idle ticks skip the scan. Any write of another model's vectors sets
+# _reembed_restart and the next call starts over from the first row.
+_reembed_after_id = -1
+_reembed_restart = False
+CONTEXT_CACHE_TTL = float(os.environ.get('CONTEXT_CACHE_TTL', 30))
+CONTEXT_CACHE_SIZE = 256
+# Bumped by every write that can change search results; part of the context
+# cache key, so a new conversation is never answered from a stale entry.
+_data_version = 0
+_context_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+_context_key_locks: Dict[tuple, threading.Lock] = {}
+_context_cache_lock = threading.Lock()
+
+
+def _connect(read_only: bool = False) -> sqlite3.Connection:
+    """Open a connection to DB_FILE with the shared pragmas."""
+    connection = sqlite3.connect(DB_FILE, timeout=30)
+    if not read_only:
+        connection.execute("PRAGMA journal_mode=WAL")
+    # WAL only needs a sync at checkpoints to stay durable across crashes
+    # of the process; NORMAL may lose the last commits on power loss.
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE}")
+    connection.execute(f"PRAGMA cache_size=-{DB_CACHE_SIZE_KB}")
+    if read_only:
+        connection.execute("PRAGMA query_only=1")
+    return connection
+
+
+def _reader() -> sqlite3.Connection:
+    """This thread's read connection, opened on first use.
+
+    WAL lets readers run alongside the writer; each statement sees the
+    latest committed data.
+    """
+    connection = getattr(_local, 'conn', None)
+    if connection is None:
+        connection = _local.conn = _connect(read_only=True)
+    return connection
+
+
+class DatabaseWriter:
+    """The single connection that writes to DB_FILE, on its own thread.
+
+    Jobs are callables taking a cursor; they may be queued from any thread.
+    After the first queued job the writer waits up to WRITE_BATCH_MS for
+    more, runs at most WRITE_BATCH_ROWS jobs in one transaction and commits
+    once, so concurrent saves share one commit. A failed batch is rolled
+    back and retried job by job, so only the failing job sees the error.
+    `after_commit` callbacks run on the writer thread in commit order.
+    """
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.conn = None
+        self.thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+        self.thread.start()
+
+    def submit(self, job, after_commit=None) -> Future:
+        future = Future()
+        self.queue.put((job, after_commit, future))
+        return future
+
+    def run(self, job, after_commit=None):
+        """Queue `job` and wait until its transaction has committed."""
+        return self.submit(job, after_commit).result()
+
+    def close(self):
+        """Commit everything queued so far and stop the thread."""
+        self.queue.put(None)
+        self.thread.join()
+
+    def _run(self):
+        self.conn = _connect()
+        stopping = False
+        while not stopping:
+            item = self.queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + WRITE_BATCH_MS / 1000
+            while len(batch) < WRITE_BATCH_ROWS:
+                try:
+                    item = self.queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._commit(batch)
+        self.conn.close()
+
+    def _commit(self, batch):
+        cursor = self.conn.cursor()
+        try:
+            results = [job(cursor) for job, _, _ in batch]
+            self.conn.commit()
+        except Exception as e:
+            self.conn.rollback()
+            if len(batch) > 1:
+                for item in batch:
+                    self._commit([item])
+            else:
+                batch[0][2].set_exception(e)
+            return
+
+        for (_, after_commit, future), result in zip(batch, results):
+            if after_commit is not None:
+                try:
+                    after_commit(result)
+                except Exception as e:
+                    print(f"Error in post-commit hook: {e}")
+            future.set_result(result)
+
+
+def run_write(job):
+    """Run `job(cursor)` on the writer thread and wait for it to commit."""
+    return _writer.run(job)
+
+
+def close_db():
+    """Flush queued writes and stop the writer thread."""
+    global _writer
+    if _writer is not None:
+        _writer.close()
+        _writer = None
+
+
+def _add_missing_columns(cursor):
+    """Add the columns save_interactions() writes to an older schema.
+
+    Backfilling them is left to the migrations in migrate_db().
+    """
+    columns = [c[1] for c in cursor.execute("PRAGMA table_info(conversations)").fetchall()]
+    if 'created_at' not in columns:
+        cursor.execute("ALTER TABLE conversations ADD COLUMN created_at REAL")
+    columns = [c[1] for c in cursor.execute(
+        "PRAGMA table_info(conversation_embeddings)").fetchall()]
+    if 'model' not in columns:
+        cursor.execute("ALTER TABLE conversation_embeddings ADD COLUMN model TEXT")
+
+
+def _create_tables(cursor):
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS conversations (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -38,134 +237,782 @@ def init_db():
             bot_response TEXT,
             user_input_embedding TEXT,
             bot_response_embedding TEXT,
-            combined_embedding TEXT
+            combined_embedding TEXT,
+            created_at REAL
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS conversation_embeddings (
+            conversation_id INTEGER PRIMARY KEY,
+            user_input_embedding BLOB,
+            bot_response_embedding BLOB,
+            combined_embedding BLOB,
+            model TEXT
         )
     """)
-    conn.commit()
 
-    embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+
+def init_db():
+    """Initialize the database and create tables if they don't exist.
+
+    Only does what new rows need to be saved (tables and columns), so it is
+    quick on any database; call migrate_db() afterwards for the rest.
+    """
+    global _writer, _matrix_synced_id, _reembed_after_id
+    if _writer is None:
+        _writer = DatabaseWriter()
+    _matrix_synced_id = None
+    _reembed_after_id = -1
+    _writer.run(_create_tables)
+    _writer.run(_add_missing_columns)
+
+
+def migrate_db():
+    """Run pending schema migrations and catch the shared matrix up.
+
+    Can take minutes on a large database, so the backend runs it in the
+    background after binding. Saves are accepted meanwhile; the matrix
+    picks them up in a final catch-up on the writer thread.
+    """
+    version = _reader().execute("PRAGMA user_version").fetchone()[0]
+    if version < SCHEMA_VERSION:
+        if version < 2:
+            print("Converting legacy JSON embeddings to float32 BLOBs...")
+            _convert_json_embeddings()
+        if version < 3:
+            _add_numeric_timestamps()
+        if version < 4:
+            _add_embedding_model_column()
+        _set_schema_version()
+    _sync_embedding_matrix()
+
+    def catch_up(_):
+        # Runs on the writer thread, after every save queued before it has
+        # skipped its append and before any later one appends.
+        global _matrix_synced_id
+        _matrix.refresh()
+        max_id = int(_matrix.rowids['id'].max()) if len(_matrix) else -1
+        for ids, keys, vectors in _matrix_batches(max_id):
+            _matrix.append(ids, keys, vectors)
+            max_id = int(ids[-1])
+        _matrix_synced_id = max_id
+    _writer.run(lambda cursor: None, catch_up)
+
+
+def _user_digest(user_id: str) -> str:
+    return hashlib.sha1(user_id.encode('utf-8')).hexdigest()[:16]
+
+
+def _index_path(user_id: str) -> str:
+    return os.path.join(INDEX_DIR, f"{_user_digest(user_id)}-{MODEL_TAG}.npz")
+
+
+def _user_key(user_id: str) -> int:
+    """The 64-bit key that tags a user's rows in the shared matrix."""
+    return int(_user_digest(user_id), 16)
+
+
+def _fetch_user_embeddings(user_id: str, after_id: int = -1):
+    return _reader().execute(
+        """SELECT c.id, e.combined_embedding
+           FROM conversations c
+           JOIN conversation_embeddings e ON e.conversation_id = c.id
+           WHERE c.user_id=? AND c.id > ? AND e.model = ?
+             AND e.combined_embedding IS NOT NULL
+           ORDER BY c.id""",
+        (user_id, after_id, MODEL_VERSION)
+    ).fetchall()
+
+
+def _count_user_embeddings(user_id: str) -> int:
+    return _reader().execute(
+        """SELECT COUNT(*) FROM conversations c
+           JOIN conversation_embeddings e ON e.conversation_id = c.id
+           WHERE c.user_id=? AND e.model = ?
+             AND e.combined_embedding IS NOT NULL""",
+        (user_id, MODEL_VERSION)
+    ).fetchone()[0]
+
+
+def _add_rows(index: AdaptiveIndex, rows):
+    size = index.dim * EMBEDDING_DTYPE.itemsize
+    rows = [r for r in rows if len(r[1]) == size]
+    if rows:
+        embeddings = unpack_embedding(b''.join(r[1] for r in rows))
+        index.add([r[0] for r in rows], embeddings.reshape(-1, index.dim))
+
+
+def _load_user_index(user_id: str):
+    path = _index_path(user_id)
+    index = None
+    if os.path.exists(path):
+        try:
+            index = AdaptiveIndex.load(path, min_rows=ANN_MIN_ROWS,
+                                       nprobe=ANN_NPROBE)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Ignoring unreadable vector index {path}: {e}")
+
+    rows = _fetch_user_embeddings(
+        user_id, index.max_id if index is not None else -1)
+    if index is not None and len(index) + len(rows) != _count_user_embeddings(user_id):
+        # Rows below max_id changed since the save (re-embedded under this
+        # model by reembed_stale_rows), so catching up is not enough.
+        index = None
+        rows = _fetch_user_embeddings(user_id)
+    if index is None:
+        if not rows:
+            return None
+        dim = len(rows[0][1]) // EMBEDDING_DTYPE.itemsize
+        index = AdaptiveIndex(dim, min_rows=ANN_MIN_ROWS, nprobe=ANN_NPROBE)
+    _add_rows(index, rows)
+
+    if index.dirty:
+        os.makedirs(INDEX_DIR, exist_ok=True)
+        index.save(path)
+    return index
+
+
+class _IndexLoad:
+    """A user index being loaded outside _user_indexes_lock.
+
+    Rows committed meanwhile are queued in `pending` by the after_commit
+    hook, which must not wait for the load, and replayed by the loader
+    before it publishes the index.
+    """
+
+    def __init__(self):
+        self.pending = []
+        self.stale = False
+        self.done = threading.Event()
+        self.index = None
+
+
+def get_user_index(user_id: str):
+    """Return the vector index for a user, loading or building it on first use.
+
+    Persisted indexes are caught up with rows saved after they were written,
+    so a restart only pays for what changed. Concurrent callers for the same
+    user share one load; other users and commits are not held up by it.
+    """
+    with _user_indexes_lock:
+        index = _user_indexes.get(user_id)
+        if index is not None:
+            return index
+        load = _index_loads.get(user_id)
+        if load is None:
+            load = _index_loads[user_id] = _IndexLoad()
+            loader = True
+        else:
+            loader = False
+    if not loader:
+        load.done.wait()
+        return load.index
+
+    try:
+        index = _load_user_index(user_id)
+        while True:
+            with _user_indexes_lock:
+                pending, load.pending = load.pending, []
+                stale, load.stale = load.stale, False
+                if not pending and not stale:
+                    if index is not None:
+                        _user_indexes[user_id] = index
+                    del _index_loads[user_id]
+                    break
+            if stale or index is None:
+                # Rows pending now were committed before this read starts.
+                index = _load_user_index(user_id)
+            else:
+                for ids, embeddings, new_rows in pending:
+                    _add_index_rows(index, ids, embeddings, new_rows)
+        load.index = index
+        return index
+    except BaseException:
+        with _user_indexes_lock:
+            _index_loads.pop(user_id, None)
+        raise
+    finally:
+        load.done.set()
+
+
+def save_indexes():
+    """Persist every vector index with unsaved additions."""
+    with _user_indexes_lock:
+        indexes = list(_user_indexes.items())
+    for user_id, index in indexes:
+        if index.dirty:
+            os.makedirs(INDEX_DIR, exist_ok=True)
+            index.save(_index_path(user_id))
+
+
+def _invalidate_indexes():
+    """Drop cached and persisted indexes after rows were rewritten in place."""
+    _bump_data_version()
+    with _user_indexes_lock:
+        _user_indexes.clear()
+        for load in _index_loads.values():
+            load.stale = True
+        if os.path.isdir(INDEX_DIR):
+            for filename in os.listdir(INDEX_DIR):
+                os.remove(os.path.join(INDEX_DIR, filename))
+    _rebuild_embedding_matrix()
+
+
+def _matrix_batches(after_id: int = -1, batch_size: int = MIGRATION_BATCH_SIZE):
+    """Yield (ids, user keys, vectors) for MODEL_VERSION embeddings by id."""
+    while True:
+        rows = _reader().execute(
+            """SELECT c.id, c.user_id, e.combined_embedding
+               FROM conversations c
+               JOIN conversation_embeddings e ON e.conversation_id = c.id
+               WHERE c.id > ? AND e.model = ?
+                 AND e.combined_embedding IS NOT NULL
+               ORDER BY c.id LIMIT ?""",
+            (after_id, MODEL_VERSION, batch_size)
+        ).fetchall()
+        if not rows:
+            return
+        after_id = rows[-1][0]
+        size = len(rows[0][2])
+        rows = [r for r in rows if len(r[2]) == size]
+        yield ([r[0] for r in rows], [_user_key(r[1]) for r in rows],
+               unpack_embedding(b''.join(r[2] for r in rows)).reshape(len(rows), -1))
+
+
+def _rebuild_embedding_matrix():
+    _matrix.rebuild(_matrix_batches())
+    print(f"Rebuilt shared embedding matrix ({_matrix.read_generation()[1]} rows)")
+
+
+def _sync_embedding_matrix():
+    """Catch the shared matrix up with the database at startup.
+
+    Rows saved since the last run are appended; if the row counts disagree
+    (a failed append, a deleted file, rows re-embedded under another model)
+    the matrix is rebuilt from scratch.
+    """
+    _matrix.refresh()
+    max_id = int(_matrix.rowids['id'].max()) if len(_matrix) else -1
+    expected = _reader().execute(
+        """SELECT COUNT(*) FROM conversation_embeddings
+           WHERE conversation_id <= ? AND model = ?
+             AND combined_embedding IS NOT NULL""",
+        (max_id, MODEL_VERSION)
+    ).fetchone()[0]
+    if expected != len(_matrix) or len(_matrix) != _matrix.read_generation()[1]:
+        _rebuild_embedding_matrix()
+        return
+    for ids, keys, vectors in _matrix_batches(max_id):
+        _matrix.append(ids, keys, vectors)
+
+
+def pack_embedding(embedding) -> bytes:
+    """Pack an embedding as little-endian float32 bytes for BLOB storage."""
+    return np.asarray(embedding, dtype=EMBEDDING_DTYPE).tobytes()
+
+
+def unpack_embedding(blob: bytes) -> np.ndarray:
+    """Decode a float32 BLOB without copying (the result is read-only)."""
+    return np.frombuffer(blob, dtype=EMBEDDING_DTYPE)
 
 
 def generate_embedding(text: str) -> List[float]:
     """Generate embedding for a given text."""
-    global embedding_model
-    if embedding_model is None:
-        embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-
-    embedding = embedding_model.encode(text)
+    embedding = embedding_provider.encode(text)
     return embedding.tolist()
 
 
-def save_interaction(user_id: str, user_input: str, bot_response: str):
+def generate_embeddings(texts: List[str],
+                        batch_size: int = EMBEDDING_BATCH_SIZE) -> np.ndarray:
+    """Generate embeddings for many texts in a single batched encode call."""
+    return embedding_provider.encode(list(texts), batch_size=batch_size)
+
+
+def interaction_texts(interactions) -> List[str]:
+    """The texts embedded for (user_input, bot_response) pairs, in order:
+    every user input, then every bot response, then every combined text."""
+    user_texts = [user_input for user_input, _ in interactions]
+    bot_texts = [bot_response for _, bot_response in interactions]
+    combined_texts = [f"User: {user_input} Bot: {bot_response}"
+                      for user_input, bot_response in interactions]
+    return user_texts + bot_texts + combined_texts
+
+
+def split_interaction_embeddings(embeddings, n: int):
+    """Split embeddings of interaction_texts() into (user, bot, combined)."""
+    return embeddings[:n], embeddings[n:2 * n], embeddings[2 * n:]
+
+
+def embed_interactions(interactions, batch_size: int = EMBEDDING_BATCH_SIZE):
+    """Embed (user_input, bot_response) pairs with one encode call.
+
+    Returns three arrays aligned with `interactions`: user input, bot
+    response and combined embeddings.
+    """
+    embeddings = generate_embeddings(interaction_texts(interactions),
+                                     batch_size=batch_size)
+    return split_interaction_embeddings(embeddings, len(interactions))
+
+
+def _add_to_indexes(conversation_ids, user_ids, embeddings, new_rows: bool):
+    """Add just-committed rows to the loaded user indexes.
+
+    Call only from an after_commit hook: hooks run on the writer thread in
+    commit order, so concurrent savers cannot add rows out of order or skip
+    them. Rows for an index still being loaded are queued for its loader
+    rather than waiting for it.
+    """
+    for user_id in set(user_ids):
+        rows = [i for i, row_user in enumerate(user_ids) if row_user == user_id]
+        ids = [conversation_ids[i] for i in rows]
+        with _user_indexes_lock:
+            index = _user_indexes.get(user_id)
+            load = _index_loads.get(user_id) if index is None else None
+            if load is not None:
+                load.pending.append((ids, embeddings[rows], new_rows))
+        if index is not None:
+            _add_index_rows(index, ids, embeddings[rows], new_rows)
+
+
+def _add_index_rows(index: AdaptiveIndex, ids, embeddings, new_rows: bool):
+    """Add committed rows the index does not hold yet.
+
+    An index loaded after the commit already has them: `new_rows` ones are
+    told apart by id, re-embedded ones by lookup.
+    """
+    if new_rows:
+        keep = [i for i, row_id in enumerate(ids) if row_id > index.max_id]
+    else:
+        keep = [i for i, found in enumerate(index.contains(ids)) if not found]
+    if keep:
+        index.add([ids[i] for i in keep], embeddings[keep])
+
+
+def _save_dirty_indexes(user_ids):
+    """Persist the given users' indexes once enough rows were added."""
+    for user_id in user_ids:
+        with _user_indexes_lock:
+            index = _user_indexes.get(user_id)
+        if index is not None and index.dirty >= INDEX_SAVE_INTERVAL:
+            os.makedirs(INDEX_DIR, exist_ok=True)
+            index.save(_index_path(user_id))
+
+
+def save_interaction(user_id: str, user_input: str, bot_response: str) -> int:
     """Save a single user-bot interaction with embeddings."""
-    timestamp = str(time.time())
+    return save_interactions([(user_id, user_input, bot_response)])[0]
 
-    user_embedding = generate_embedding(user_input)
-    bot_embedding = generate_embedding(bot_response)
-    combined_text = f"User: {user_input} Bot: {bot_response}"
-    combined_embedding = generate_embedding(combined_text)
 
-    cursor = conn.cursor()
+def save_interactions(interactions) -> List[int]:
+    """Save (user_id, user_input, bot_response[, created_at]) tuples with embeddings.
+
+    `created_at` is when the turn happened (epoch seconds) and defaults to
+    now; callers that queue turns pass it so rows keep their real order.
+    All texts are embedded with one encode call and all rows are inserted
+    in one writer job. Returns the new conversation ids in order.
+    """
+    now = time.time()
+    interactions = [(user_id, user_input, bot_response, rest[0] if rest else now)
+                    for user_id, user_input, bot_response, *rest in interactions]
+
+    user_embeddings, bot_embeddings, combined_embeddings = embed_interactions(
+        [(user_input, bot_response) for _, user_input, bot_response, _ in interactions])
+
+    def insert(cursor):
+        conversation_ids = []
+        for i, (user_id, user_input, bot_response, created_at) in enumerate(interactions):
+            cursor.execute(
+                """INSERT INTO conversations
+                   (user_id, timestamp, created_at, user_input, bot_response)
+                   VALUES (?, ?, ?, ?, ?)""",
+                (user_id, str(created_at), created_at, user_input, bot_response)
+            )
+            conversation_id = cursor.lastrowid
+            _insert_embeddings(cursor, conversation_id, user_embeddings[i],
+                               bot_embeddings[i], combined_embeddings[i])
+            conversation_ids.append(conversation_id)
+        return conversation_ids
+
+    def publish(conversation_ids):
+        # Runs on the writer thread in commit order, so matrix rows stay in
+        # conversation id order and every loaded index either was read
+        # before this commit (and lacks these rows) or has a max_id at or
+        # past them.
+        _add_to_indexes(conversation_ids, [interaction[0] for interaction in interactions],
+                        combined_embeddings, new_rows=True)
+        if _matrix_synced_id is None:
+            return
+        rows = [i for i, conversation_id in enumerate(conversation_ids)
+                if conversation_id > _matrix_synced_id]
+        if not rows:
+            return
+        try:
+            _matrix.append([conversation_ids[i] for i in rows],
+                           [_user_key(interactions[i][0]) for i in rows],
+                           combined_embeddings[rows])
+        except OSError as e:
+            print(f"Error appending to shared embedding matrix: {e}")
+
+    conversation_ids = _writer.run(insert, publish)
+    _bump_data_version()
+    _save_dirty_indexes({interaction[0] for interaction in interactions})
+    return conversation_ids
+
+
+def write_embeddings(cursor, conversation_ids, user_embeddings,
+                     bot_embeddings, combined_embeddings,
+                     model: str = MODEL_VERSION):
+    """Store (or overwrite) embeddings for existing conversations.
+
+    Meant for run_write jobs; call rebuild_indexes() once bulk changes are
+    done so searches see them. `model` is the model that produced them.
+    """
+    _note_model_written(model)
+    cursor.executemany(
+        """INSERT OR REPLACE INTO conversation_embeddings
+           (conversation_id, user_input_embedding, bot_response_embedding,
+            combined_embedding, model)
+           VALUES (?, ?, ?, ?, ?)""",
+        [(int(conversation_id), pack_embedding(user), pack_embedding(bot),
+          pack_embedding(combined), model)
+         for conversation_id, user, bot, combined in zip(
+             conversation_ids, user_embeddings, bot_embeddings, combined_embeddings)]
+    )
+
+
+def rebuild_indexes():
+    """Drop the vector indexes and rebuild the shared matrix from the table."""
+    _invalidate_indexes()
+
+
+def _insert_embeddings(cursor, conversation_id: int, user_embedding,
+                       bot_embedding, combined_embedding,
+                       model: str = MODEL_VERSION):
+    _note_model_written(model)
     cursor.execute(
-        """INSERT INTO conversations
-           (user_id, timestamp, user_input, bot_response,
-            user_input_embedding, bot_response_embedding, combined_embedding)
-           VALUES (?, ?, ?, ?, ?, ?, ?)""",
-        (user_id, timestamp, user_input, bot_response,
-         json.dumps(user_embedding), json.dumps(bot_embedding),
-         json.dumps(combined_embedding))
+        """INSERT OR REPLACE INTO conversation_embeddings
+           (conversation_id, user_input_embedding, bot_response_embedding,
+            combined_embedding, model)
+           VALUES (?, ?, ?, ?, ?)""",
+        (conversation_id, pack_embedding(user_embedding),
+         pack_embedding(bot_embedding), pack_embedding(combined_embedding),
+         model)
     )
-    conn.commit()
+
+
+def _note_model_written(model):
+    global _reembed_restart
+    if model != MODEL_VERSION:
+        # Only ever set here and cleared by reembed_stale_rows(), so a write
+        # racing with a pass is never lost: it just triggers one more pass.
+        _reembed_restart = True
+
+
+def reembed_stale_rows(budget: float, batch_size: int = EMBEDDING_BATCH_SIZE) -> int:
+    """Re-embed rows from other models (or with none) for about `budget` seconds.
+
+    Works oldest first, one batch per encode call and writer job, and stops
+    starting new batches once the budget is spent; the next call resumes
+    after the last row done instead of rescanning. Re-embedded rows join
+    the loaded user indexes and the shared matrix right away. Returns the
+    number of rows done; 0 means nothing is stale (or migrate_db() has not
+    finished yet). Once a scan comes back empty, later calls return 0
+    without scanning until another model's vectors are written.
+    """
+    global _reembed_after_id, _reembed_restart
+    if _matrix_synced_id is None:
+        # migrate_db() is still running; its matrix sync only catches up
+        # with new ids, not with rows re-embedded under it.
+        return 0
+    if _reembed_restart:
+        _reembed_restart = False
+        _reembed_after_id = -1
+    if _reembed_after_id is None:
+        return 0
+    deadline = time.monotonic() + budget
+    done = 0
+    users = set()
+    while time.monotonic() < deadline:
+        rows = _reader().execute(
+            """SELECT c.id, c.user_id, c.user_input, c.bot_response
+               FROM conversations c
+               LEFT JOIN conversation_embeddings e ON e.conversation_id = c.id
+               WHERE c.id > ? AND e.model IS NOT ?
+                 AND c.user_input != '' AND c.bot_response != ''
+               ORDER BY c.id LIMIT ?""",
+            (_reembed_after_id, MODEL_VERSION, batch_size)
+        ).fetchall()
+        if not rows:
+            _reembed_after_id = None
+            break
+        _reembed_after_id = rows[-1][0]
+
+        user_embeddings, bot_embeddings, combined_embeddings = embed_interactions(
+            [(r[2], r[3]) for r in rows], batch_size=batch_size)
+        ids = [r[0] for r in rows]
+
+        def publish(_):
+            _add_to_indexes(ids, [r[1] for r in rows], combined_embeddings, new_rows=False)
+            try:
+                _matrix.append(ids, [_user_key(r[1]) for r in rows], combined_embeddings)
+            except OSError as e:
+                print(f"Error appending to shared embedding matrix: {e}")
+
+        _writer.run(lambda cursor: write_embeddings(
+            cursor, ids, user_embeddings, bot_embeddings, combined_embeddings),
+            publish)
+        done += len(rows)
+        users.update(r[1] for r in rows)
+
+    if done:
+        _bump_data_version()
+        _save_dirty_indexes(users)
+    return done
 
 
 def get_recent_context(user_id: str, limit: int = 5) -> List[str]:
-    """Fetch the last 'limit' messages for a user as context (fallback)."""
-    cursor = conn.cursor()
-    cursor.execute(
+    """Fetch the last 'limit' messages for a user as context (fallback).
+
+    Rows migrate_db() has not given a created_at yet sort last, newest id
+    first; the id tie-break is the index's own rowid order, so the lookup
+    stays an index scan.
+    """
+    rows = _reader().execute(
         """SELECT user_input, bot_response FROM conversations
-           WHERE user_id=? ORDER BY timestamp DESC LIMIT ?""",
+           WHERE user_id=? ORDER BY created_at DESC, id DESC LIMIT ?""",
         (user_id, limit)
-    )
-    rows = cursor.fetchall()
+    ).fetchall()
     # Reverse order to chronological
     rows.reverse()
     context = [f"User: {r[0]} | Bot: {r[1]}" for r in rows]
     return context
 
 
-def get_similar_context(user_id: str, query: str, limit: int = 5) -> List[str]:
-    """Retrieve most similar conversations using embedding-based similarity."""
-    cursor = conn.cursor()
-    cursor.execute(
-        """SELECT user_input, bot_response, combined_embedding
-           FROM conversations WHERE user_id=?
-           AND combined_embedding IS NOT NULL""",
-        (user_id,)
-    )
-    rows = cursor.fetchall()
+def _bump_data_version():
+    global _data_version
+    with _context_cache_lock:
+        _data_version += 1
+        _context_cache.clear()
 
-    if not rows:
-        return get_recent_context(user_id, limit)
 
-    query_embedding = generate_embedding(query)
-    query_embedding = np.array(query_embedding).reshape(1, -1)
+def _cached_context(key):
+    """Return a fresh memoized context for `key`; call with the cache lock."""
+    entry = _context_cache.get(key)
+    if entry is None:
+        return None
+    stored_at, context = entry
+    if time.monotonic() - stored_at > CONTEXT_CACHE_TTL:
+        del _context_cache[key]
+        return None
+    _context_cache.move_to_end(key)
+    return list(context)
+
 
-    similarities = []
-    for row in rows:
-        user_input, bot_response, combined_embedding_json = row
+def get_similar_context(user_id: str, query: str, limit: int = 5) -> List[str]:
+    """Retrieve most similar conversations using embedding-based similarity.
+
+    Concurrent calls for the same (user, query, limit) share one search, and
+    the result is reused until CONTEXT_CACHE_TTL expires or data changes, so
+    one message sent to several services, or retried, is looked up once.
+    """
+    with _context_cache_lock:
+        key = (user_id, query, limit, _data_version)
+        context = _cached_context(key)
+        if context is not None:
+            return context
+        key_lock = _context_key_locks.setdefault(key, threading.Lock())
+
+    with key_lock:
+        with _context_cache_lock:
+            context = _cached_context(key)
+        if context is not None:
+            return context
+        context = None
         try:
-            combined_embedding = json.loads(combined_embedding_json)
-            combined_embedding = np.array(combined_embedding).reshape(1, -1)
+            context = _search_similar_context(user_id, query, limit)
+        finally:
+            with _context_cache_lock:
+                if context is not None and key[3] == _data_version:
+                    _context_cache[key] = (time.monotonic(), tuple(context))
+                    while len(_context_cache) > CONTEXT_CACHE_SIZE:
+                        _context_cache.popitem(last=False)
+                _context_key_locks.pop(key, None)
+    return list(context)
+
+
+def _search_similar_context(user_id: str, query: str, limit: int) -> List[str]:
+    index = get_user_index(user_id)
+    if index is None or len(index) == 0:
+        return get_recent_context(user_id, limit)
 
-            similarity = cosine_similarity(
-                query_embedding, combined_embedding)[0][0]
-            similarities.append((similarity, user_input, bot_response))
-        except (json.JSONDecodeError, ValueError):
-            continue
+    query_embedding = generate_embedding(query)
+    ids, _ = index.search(query_embedding, limit)
+    ids = [int(i) for i in ids]
 
-    similarities.sort(key=lambda x: x[0], reverse=True)
-    top_similar = similarities[:limit]
+    cursor = _reader().execute(
+        f"""SELECT id, user_input, bot_response FROM conversations
+            WHERE id IN ({','.join('?' * len(ids))})""",
+        ids
+    )
+    rows = {r[0]: r for r in cursor.fetchall()}
 
-    context = [f"User: {item[1]} | Bot: {item[2]}" for item in top_similar]
+    context = [f"User: {rows[i][1]} | Bot: {rows[i][2]}"
+               for i in ids if i in rows]
     return context
 
 
-def migrate_existing_data():
-    """Migrate existing conversations to include embeddings."""
-    cursor = conn.cursor()
-
-    cursor.execute("PRAGMA table_info(conversations)")
-    columns = [column[1] for column in cursor.fetchall()]
-
-    if 'user_input_embedding' not in columns:
-        cursor.execute(
-            "ALTER TABLE conversations ADD COLUMN user_input_embedding TEXT")
-        cursor.execute(
-            "ALTER TABLE conversations ADD COLUMN bot_response_embedding TEXT")
-        cursor.execute(
-            "ALTER TABLE conversations ADD COLUMN combined_embedding TEXT")
-        conn.commit()
-
-    cursor.execute(
-        """SELECT rowid, user_input, bot_response FROM conversations
-           WHERE combined_embedding IS NULL"""
-    )
-    rows = cursor.fetchall()
-
-    for rowid, user_input, bot_response in rows:
-        if user_input and bot_response:
-            user_embedding = generate_embedding(user_input)
-            bot_embedding = generate_embedding(bot_response)
-            combined_text = f"User: {user_input} Bot: {bot_response}"
-            combined_embedding = generate_embedding(combined_text)
-
-            cursor.execute(
+def get_shared_similar_context(user_id: str, query: str,
+                               limit: int = 5) -> List[str]:
+    """Similarity search for processes other than the backend.
+
+    Searches the shared EmbeddingMatrix through np.memmap, so the desktop
+    apps do not keep their own copy of every embedding, and reads the
+    matching conversations over a read-only connection. Works without
+    init_db(); returns [] until the backend has written the matrix.
+    """
+    _matrix.refresh()
+    if not len(_matrix):
+        return []
+    ids, _ = _matrix.search(generate_embedding(query), limit, key=_user_key(user_id))
+    ids = [int(i) for i in ids]
+    if not ids:
+        return []
+
+    reader = sqlite3.connect(f"file:{DB_FILE}?mode=ro", uri=True)
+    try:
+        cursor = reader.execute(
+            f"""SELECT id, user_input, bot_response FROM conversations
+                WHERE id IN ({','.join('?' * len(ids))})""",
+            ids
+        )
+        rows = {r[0]: r for r in cursor.fetchall()}
+    finally:
+        reader.close()
+    return [f"User: {rows[i][1]} | Bot: {rows[i][2]}" for i in ids if i in rows]
+
+
+def _convert_json_embeddings(batch_size: int = MIGRATION_BATCH_SIZE):
+    """Move legacy JSON embedding columns into conversation_embeddings.
+
+    Converted rows have their JSON columns cleared in the same transaction,
+    which is what makes the conversion resumable.
+    """
+    reader = _reader()
+    columns = reader.execute("PRAGMA table_info(conversations)").fetchall()
+    if 'combined_embedding' not in [c[1] for c in columns]:
+        return
+
+    converted = 0
+    last_rowid = 0
+    while True:
+        # A rowid cursor keeps each batch a range scan instead of rescanning
+        # the rows already cleared.
+        rows = reader.execute(
+            """SELECT rowid, user_input_embedding, bot_response_embedding,
+                      combined_embedding
+               FROM conversations
+               WHERE rowid > ? AND combined_embedding IS NOT NULL
+               ORDER BY rowid LIMIT ?""",
+            (last_rowid, batch_size)
+        ).fetchall()
+        if not rows:
+            break
+        last_rowid = rows[-1][0]
+
+        def convert(cursor):
+            for rowid, user_json, bot_json, combined_json in rows:
+                try:
+                    _insert_embeddings(cursor, rowid, json.loads(user_json),
+                                       json.loads(bot_json),
+                                       json.loads(combined_json),
+                                       model=LEGACY_MODEL_VERSION)
+                except (TypeError, json.JSONDecodeError, ValueError):
+                    # Unreadable legacy vectors are dropped; the row is
+                    # re-embedded by reembed_stale_rows().
+                    pass
+
+            cursor.executemany(
                 """UPDATE conversations
-                   SET user_input_embedding=?, bot_response_embedding=?,
-                       combined_embedding=?
+                   SET user_input_embedding=NULL, bot_response_embedding=NULL,
+                       combined_embedding=NULL
                    WHERE rowid=?""",
-                (json.dumps(user_embedding), json.dumps(bot_embedding),
-                 json.dumps(combined_embedding), rowid)
+                [(row[0],) for row in rows]
             )
-
-    conn.commit()
+        _writer.run(convert)
+        converted += len(rows)
+
+    if converted:
+        _invalidate_indexes()
+        print(f"Converted {converted} legacy embedding rows")
+
+
+def _parse_timestamp(value) -> float:
+    """Epoch seconds from a legacy TEXT timestamp; 0.0 if unreadable."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _add_numeric_timestamps(batch_size: int = MIGRATION_BATCH_SIZE):
+    """Add conversations.created_at, backfill it and index it (schema v3).
+
+    str(time.time()) values sort lexicographically as TEXT ('999.5' after
+    '1000.1'), and without an index every lookup scanned and sorted the
+    table. Like the other migrations this commits per batch and resumes.
+    """
+    reader = _reader()
+    columns = [c[1] for c in reader.execute("PRAGMA table_info(conversations)").fetchall()]
+    if 'created_at' not in columns:
+        _writer.run(lambda cursor: cursor.execute(
+            "ALTER TABLE conversations ADD COLUMN created_at REAL"))
+
+    backfilled = 0
+    last_rowid = 0
+    while True:
+        rows = reader.execute(
+            """SELECT rowid, timestamp FROM conversations
+               WHERE rowid > ? AND created_at IS NULL
+               ORDER BY rowid LIMIT ?""",
+            (last_rowid, batch_size)
+        ).fetchall()
+        if not rows:
+            break
+        last_rowid = rows[-1][0]
+        _writer.run(lambda cursor: cursor.executemany(
+            "UPDATE conversations SET created_at=? WHERE rowid=?",
+            [(_parse_timestamp(timestamp), rowid) for rowid, timestamp in rows]))
+        backfilled += len(rows)
+
+    _writer.run(lambda cursor: cursor.execute(
+        """CREATE INDEX IF NOT EXISTS idx_conversations_user_created
+           ON conversations (user_id, created_at)"""))
+    if backfilled:
+        print(f"Backfilled numeric timestamps for {backfilled} conversations")
+
+
+def _add_embedding_model_column():
+    """Record which model produced each embedding (schema v4).
+
+    Existing rows are tagged LEGACY_MODEL_VERSION, the model that wrote
+    every embedding before models were tracked, whatever EMBEDDING_MODEL is
+    set to now; reembed_stale_rows() takes over from here for any row whose
+    model differs from MODEL_VERSION.
+    """
+    _note_model_written(LEGACY_MODEL_VERSION)
+    columns = [c[1] for c in _reader().execute(
+        "PRAGMA table_info(conversation_embeddings)").fetchall()]
+    if 'model' not in columns:
+        _writer.run(lambda cursor: cursor.execute(
+            "ALTER TABLE conversation_embeddings ADD COLUMN model TEXT"))
+    _writer.run(lambda cursor: cursor.execute(
+        "UPDATE conversation_embeddings SET model=? WHERE model IS NULL",
+        (LEGACY_MODEL_VERSION,)))
+
+
+def _set_schema_version():
+    _writer.run(lambda cursor: cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}"))
@@ -1,13 +1,15 @@
 import webview
 import threading
-import json
 import os
 import platform
 from datetime import datetime
 import requests
 from bs4 import BeautifulSoup
-from sentence_transformers import SentenceTransformer
 import time
+from concurrent.futures import ThreadPoolExecutor
+import embedding_provider
+from database import get_shared_similar_context
+from storage_log import SegmentedLog
 
 class AIBrowserApp:
     def __init__(self):
@@ -15,6 +17,8 @@ class AIBrowserApp:
         DEFAULT_LINUX_PATH = "/home/ubuntu/scraped_data"
         self.storage_path = os.environ.get('AI_STORAGE_PATH', DEFAULT_WINDOWS_PATH if platform.system() == 'Windows' else DEFAULT_LINUX_PATH)
         os.makedirs(self.storage_path, exist_ok=True)
+        # Separate from the backend's segments/: a log directory has one writer.
+        self.storage_log = SegmentedLog(os.path.join(self.storage_path, 'desktop_segments'))
         
         self.ai_services = {
             'chatgpt': {
@@ -44,12 +48,6 @@ class AIBrowserApp:
         }
         
         self.browser_windows = {}
-        self.embedding_model = None
-        
-    def get_embedding_model(self):
-        if self.embedding_model is None:
-            self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-        return self.embedding_model
     
     def toggle_ai_service(self, service_id):
         if service_id in self.ai_services:
@@ -87,23 +85,24 @@ class AIBrowserApp:
             'timestamp': timestamp,
             'service': service_id,
             'message': message,
-            'response': f"Simulated response from {self.ai_services[service_id]['name']}"
+            'response': f"Simulated response from {self.ai_services[service_id]['name']}",
+            # Searches the backend's shared embedding matrix via np.memmap.
+            'similar_context': get_shared_similar_context('web_user', message, limit=3)
         }
         
-        filename = f"{service_id}_{timestamp.replace(':', '-')}.json"
-        filepath = os.path.join(self.storage_path, filename)
-        
-        with open(filepath, 'w') as f:
-            json.dump(interaction_data, f, indent=2)
+        self.storage_log.append('message', interaction_data, service_id)
             
         return True
     
     def send_message_to_all_active(self, message):
-        results = {}
-        for service_id, service in self.ai_services.items():
-            if service['enabled'] and service['connected']:
-                results[service_id] = self.send_message_to_ai(service_id, message)
-        return results
+        active = [service_id for service_id, service in self.ai_services.items()
+                  if service['enabled'] and service['connected']]
+        if not active:
+            return {}
+        with ThreadPoolExecutor(max_workers=len(active)) as executor:
+            futures = {service_id: executor.submit(self.send_message_to_ai, service_id, message)
+                       for service_id in active}
+        return {service_id: future.result() for service_id, future in futures.items()}
     
     def scrape_ai_data(self, service_id):
         timestamp = datetime.now().isoformat()
@@ -115,15 +114,10 @@ class AIBrowserApp:
             'embeddings': []
         }
         
-        model = self.get_embedding_model()
-        content_embedding = model.encode(scraped_data['scraped_content']).tolist()
+        content_embedding = embedding_provider.encode(scraped_data['scraped_content']).tolist()
         scraped_data['embeddings'] = content_embedding
         
-        filename = f"scraped_{service_id}_{timestamp.replace(':', '-')}.json"
-        filepath = os.path.join(self.storage_path, filename)
-        
-        with open(filepath, 'w') as f:
-            json.dump(scraped_data, f, indent=2)
+        self.storage_log.append('scrape', scraped_data, service_id)
             
         return scraped_data
     
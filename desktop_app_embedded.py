@@ -9,6 +9,8 @@ from PyQt5.QtCore import Qt, QTimer, pyqtSignal, QObject, QUrl
 from PyQt5.QtGui import QFont
 from PyQt5.QtWebEngineWidgets import QWebEngineView
 
+BACKEND_TIMEOUT = 30
+
 class WebEngineWidget(QWidget):
     def __init__(self, service_name, url, parent=None):
         super(WebEngineWidget, self).__init__(parent)
@@ -123,7 +125,8 @@ class AIPanel(QWidget):
             
             try:
                 response = requests.post('http://localhost:8000/start_session', 
-                                       json={'service_id': self.service_id})
+                                       json={'service_id': self.service_id},
+                                       timeout=BACKEND_TIMEOUT)
                 if response.status_code == 200:
                     print(f"Backend session started for {self.service_name}")
             except Exception as e:
@@ -152,7 +155,8 @@ class AIPanel(QWidget):
         if self.session_active:
             try:
                 response = requests.post('http://localhost:8000/scrape_data', 
-                                       json={'service_id': self.service_id})
+                                       json={'service_id': self.service_id},
+                                       timeout=BACKEND_TIMEOUT)
                 if response.status_code == 200:
                     print(f"Data scraped for {self.service_name}")
             except Exception as e:
@@ -162,7 +166,8 @@ class AIPanel(QWidget):
         if self.session_active:
             try:
                 response = requests.post('http://localhost:8000/inject_message', 
-                                       json={'service_id': self.service_id, 'message': message})
+                                       json={'service_id': self.service_id, 'message': message},
+                                       timeout=BACKEND_TIMEOUT)
                 if response.status_code == 200:
                     print(f"Message sent to {self.service_name}")
             except Exception as e:
@@ -259,9 +264,13 @@ class MainWindow(QMainWindow):
     def send_to_all(self):
         message = self.message_input.text().strip()
         if message:
+            # The panels' sessions live in this window's browsers, so the
+            # fan-out stays here; each panel sends on its own thread so one
+            # slow backend doesn't hold up the others or the UI.
             for panel in self.panels.values():
                 if panel.is_active and panel.session_active:
-                    panel.send_message(message)
+                    threading.Thread(target=panel.send_message, args=(message,),
+                                     daemon=True).start()
             self.message_input.clear()
             
     def scrape_all(self):
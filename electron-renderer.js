@@ -2,6 +2,9 @@ class ElectronAIControlPanel {
     constructor() {
         this.services = ['chatgpt', 'claude', 'mistral', 'gemini'];
         this.activeServices = new Set();
+        this.backendUrl = 'http://localhost:5001';
+        this.stream = null;
+        this.streamText = new Map();
         this.logPanel = document.getElementById('log-panel');
         
         this.init();
@@ -47,6 +50,7 @@ class ElectronAIControlPanel {
                 this.activeServices.add(service);
                 this.updateServiceStatus(service, 'connected');
                 this.log(`${service} session started successfully`, 'success');
+                this.openStream(service);
             } else {
                 this.updateServiceStatus(service, 'disconnected');
                 this.log(`Failed to start ${service}: ${result.message}`, 'error');
@@ -65,6 +69,7 @@ class ElectronAIControlPanel {
             
             if (result.success) {
                 this.activeServices.delete(service);
+                this.closeStream(service);
                 this.updateServiceStatus(service, 'disconnected');
                 this.log(`${service} session stopped`, 'info');
             } else {
@@ -113,6 +118,41 @@ class ElectronAIControlPanel {
         }
     }
 
+    openStream(service) {
+        // Responses stream from the Python backend's Playwright sessions.
+        // One EventSource carries every service's events (tagged with
+        // data.service); services without a backend session send none.
+        this.streamText.set(service, '');
+        if (this.stream) return;
+        this.stream = new EventSource(`${this.backendUrl}/stream`);
+
+        const on = (type, handler) => this.stream.addEventListener(type, (e) => {
+            const data = JSON.parse(e.data);
+            if (this.streamText.has(data.service)) handler(data.service, data);
+        });
+        on('reset', (service, data) => {
+            this.streamText.set(service, data.text);
+        });
+        on('delta', (service, data) => {
+            this.streamText.set(service, this.streamText.get(service) + data.text);
+            this.updateServiceStatus(service, 'connected', 'Responding...');
+        });
+        on('done', (service) => {
+            const text = this.streamText.get(service) || '';
+            this.updateServiceStatus(service, 'connected');
+            this.log(`${service} responded: ${text.substring(0, 100)}`, 'success');
+        });
+        on('closed', (service) => this.closeStream(service));
+    }
+
+    closeStream(service) {
+        this.streamText.delete(service);
+        if (this.streamText.size === 0 && this.stream) {
+            this.stream.close();
+            this.stream = null;
+        }
+    }
+
     async sendToAll() {
         const input = document.querySelector('.global-input');
         const message = input.value.trim();
@@ -164,7 +204,7 @@ class ElectronAIControlPanel {
         });
     }
 
-    updateServiceStatus(service, status) {
+    updateServiceStatus(service, status, label = null) {
         const serviceElement = document.querySelector(`[data-service="${service}"]`);
         const statusIndicator = serviceElement.querySelector('.status-indicator');
         const statusText = serviceElement.querySelector('.service-status');
@@ -180,7 +220,7 @@ class ElectronAIControlPanel {
             'disconnected': 'Not Connected',
             'connecting': 'Connecting...'
         };
-        statusText.textContent = statusTexts[status] || status;
+        statusText.textContent = label || statusTexts[status] || status;
 
         if (status === 'connected') {
             startBtn.disabled = true;
@@ -0,0 +1,168 @@
+"""
+embedding_cache.py
+------------------
+Content-addressed cache for sentence embeddings.
+
+Instructions:
+- Entries are keyed by a SHA-256 of (model name, normalized text), so the
+  same string is only ever encoded once per model.
+- A bounded in-memory LRU tier serves hot strings; an optional SQLite tier
+  (EMBEDDING_CACHE_PATH) keeps embeddings across restarts.
+- Use cached_encode() wherever a SentenceTransformer would be called
+  directly; stats() exposes hit/miss counters.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+MEMORY_CACHE_SIZE = int(os.environ.get('EMBEDDING_CACHE_SIZE', 4096))
+DISK_CACHE_PATH = os.environ.get('EMBEDDING_CACHE_PATH')
+
+_caches: Dict[str, "EmbeddingCache"] = {}
+_caches_lock = threading.Lock()
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so trivially different strings share an entry."""
+    return ' '.join(text.split())
+
+
+class EmbeddingCache:
+    """Two-tier (LRU memory, optional SQLite disk) embedding cache."""
+
+    def __init__(self, model_name: str, max_entries: int = MEMORY_CACHE_SIZE,
+                 disk_path: Optional[str] = None):
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.disk = None
+        if disk_path:
+            self.disk = sqlite3.connect(disk_path, check_same_thread=False)
+            self.disk.execute("""
+                CREATE TABLE IF NOT EXISTS embedding_cache (
+                    key TEXT PRIMARY KEY,
+                    embedding BLOB
+                )
+            """)
+            self.disk.commit()
+
+    def key(self, text: str) -> str:
+        payload = f"{self.model_name}\0{normalize_text(text)}"
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self.lock:
+            embedding = self.entries.get(key)
+            if embedding is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return embedding
+
+            if self.disk is not None:
+                row = self.disk.execute(
+                    "SELECT embedding FROM embedding_cache WHERE key=?",
+                    (key,)
+                ).fetchone()
+                if row is not None:
+                    embedding = np.frombuffer(row[0], dtype='<f4')
+                    self._remember(key, embedding)
+                    self.disk_hits += 1
+                    return embedding
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, embedding: np.ndarray):
+        self.put_many([key], [embedding])
+
+    def put_many(self, keys: List[str], embeddings):
+        """Store several entries; the disk tier writes them in one commit."""
+        embeddings = [np.asarray(embedding, dtype='<f4') for embedding in embeddings]
+        for embedding in embeddings:
+            embedding.setflags(write=False)
+        with self.lock:
+            for key, embedding in zip(keys, embeddings):
+                self._remember(key, embedding)
+            if self.disk is not None:
+                self.disk.executemany(
+                    """INSERT OR REPLACE INTO embedding_cache (key, embedding)
+                       VALUES (?, ?)""",
+                    [(key, embedding.tobytes()) for key, embedding in zip(keys, embeddings)]
+                )
+                self.disk.commit()
+
+    def _remember(self, key: str, embedding: np.ndarray):
+        self.entries[key] = embedding
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'model': self.model_name,
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': ((self.hits + self.disk_hits) / lookups
+                             if lookups else 0.0),
+                'disk_enabled': self.disk is not None
+            }
+
+
+def get_embedding_cache(model_name: str) -> EmbeddingCache:
+    """Return the process-wide cache for a model."""
+    with _caches_lock:
+        cache = _caches.get(model_name)
+        if cache is None:
+            cache = EmbeddingCache(model_name, disk_path=DISK_CACHE_PATH)
+            _caches[model_name] = cache
+        return cache
+
+
+def cached_encode(model, model_name: str, texts, batch_size: int = 32):
+    """Encode `texts` with `model`, only running the model on cache misses.
+
+    Accepts a single string (returns a 1-D array) or a list of strings
+    (returns a 2-D array), mirroring SentenceTransformer.encode.
+    """
+    single = isinstance(texts, str)
+    texts: List[str] = [texts] if single else list(texts)
+    cache = get_embedding_cache(model_name)
+
+    keys = [cache.key(text) for text in texts]
+    results = [cache.get(key) for key in keys]
+
+    # Encode each distinct missing string once, even if repeated in `texts`.
+    missing = {}
+    for key, text, result in zip(keys, texts, results):
+        if result is None and key not in missing:
+            missing[key] = text
+    if missing:
+        encoded = model.encode(list(missing.values()), batch_size=batch_size)
+        cache.put_many(list(missing), encoded)
+        fresh = dict(zip(missing, encoded))
+        results = [result if result is not None else fresh[key]
+                   for key, result in zip(keys, results)]
+
+    embeddings = np.asarray(results, dtype=np.float32)
+    return embeddings[0] if single else embeddings
+
+
+def cache_stats() -> Dict[str, dict]:
+    """Hit/miss counters for every model cache in this process."""
+    with _caches_lock:
+        caches = list(_caches.values())
+    return {cache.model_name: cache.stats() for cache in caches}
@@ -0,0 +1,321 @@
+"""
+embedding_provider.py
+---------------------
+Single owner of the sentence embedding model for the whole process.
+
+Instructions:
+- Call encode() instead of constructing a SentenceTransformer; the model is
+  loaded once, lazily, and shared by every thread.
+- Configure with EMBEDDING_MODEL, EMBEDDING_DEVICE, EMBEDDING_THREADS and
+  EMBEDDING_MAX_SEQ_LENGTH environment variables.
+- EMBEDDING_BACKEND selects the inference backend: 'torch' (default),
+  'onnx' (ONNX Runtime, needs optimum[onnxruntime]; EMBEDDING_ONNX_FILE picks
+  a quantized export) or 'int8' (PyTorch dynamic int8 quantization on CPU).
+  benchmarks/bench_embeddings.py compares them.
+- The backend can serve its loaded model over a Unix socket (serve()) so the
+  desktop front ends reuse it instead of loading their own copy; they pick
+  it up automatically through get_provider().
+- The socket carries conversation text, so it lives in a per-user directory
+  (XDG_RUNTIME_DIR, else a 0700 directory named after the uid under the
+  temp dir), is chmod 0600, and clients only use a socket in a directory
+  owned by them that others cannot write to.
+"""
+
+import json
+import os
+import socket
+import socketserver
+import struct
+import tempfile
+import threading
+import numpy as np
+from typing import Optional
+
+from embedding_cache import cached_encode
+
+EMBEDDING_MODEL_NAME = os.environ.get('EMBEDDING_MODEL', 'all-MiniLM-L6-v2')
+EMBEDDING_DEVICE = os.environ.get('EMBEDDING_DEVICE') or None
+EMBEDDING_THREADS = int(os.environ.get('EMBEDDING_THREADS', 0)) or None
+EMBEDDING_MAX_SEQ_LENGTH = int(os.environ.get('EMBEDDING_MAX_SEQ_LENGTH', 0)) or None
+EMBEDDING_BACKEND = os.environ.get('EMBEDDING_BACKEND', 'torch')
+EMBEDDING_ONNX_FILE = os.environ.get('EMBEDDING_ONNX_FILE') or None
+EMBEDDING_BACKENDS = ('torch', 'onnx', 'int8')
+
+
+def _default_socket_dir() -> str:
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir and os.path.isdir(runtime_dir):
+        return runtime_dir
+    user = os.getuid() if hasattr(os, 'getuid') else os.environ.get('USERNAME', 'user')
+    return os.path.join(tempfile.gettempdir(), f'ai_browser-{user}')
+
+
+EMBEDDING_SOCKET_PATH = os.environ.get(
+    'EMBEDDING_SOCKET_PATH',
+    os.path.join(_default_socket_dir(), 'ai_browser_embeddings.sock'))
+DEFAULT_BATCH_SIZE = 32
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+class LocalEmbeddingProvider:
+    """Loads the model in this process; safe to call from any thread."""
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL_NAME,
+                 device: Optional[str] = EMBEDDING_DEVICE,
+                 threads: Optional[int] = EMBEDDING_THREADS,
+                 max_seq_length: Optional[int] = EMBEDDING_MAX_SEQ_LENGTH,
+                 backend: str = EMBEDDING_BACKEND,
+                 onnx_file: Optional[str] = EMBEDDING_ONNX_FILE):
+        if backend not in EMBEDDING_BACKENDS:
+            raise ValueError(f"Unknown embedding backend {backend!r}; "
+                             f"expected one of {EMBEDDING_BACKENDS}")
+        self.model_name = model_name
+        self.device = device
+        self.threads = threads
+        self.max_seq_length = max_seq_length
+        self.backend = backend
+        self.onnx_file = onnx_file
+        self.model = None
+        self._load_lock = threading.Lock()
+        self._encode_lock = threading.Lock()
+
+    @property
+    def model_key(self) -> str:
+        """Identifies the vectors this provider produces, for caching."""
+        return make_model_key(self.model_name, self.backend)
+
+    def load(self):
+        if self.model is None:
+            with self._load_lock:
+                if self.model is None:
+                    self.model = self._build_model()
+        return self.model
+
+    def _build_model(self):
+        from sentence_transformers import SentenceTransformer
+        if self.threads:
+            import torch
+            torch.set_num_threads(self.threads)
+
+        if self.backend == 'onnx':
+            model_kwargs = {'file_name': self.onnx_file} if self.onnx_file else None
+            model = SentenceTransformer(self.model_name, device=self.device,
+                                        backend='onnx',
+                                        model_kwargs=model_kwargs)
+        else:
+            model = SentenceTransformer(self.model_name, device=self.device)
+            if self.backend == 'int8':
+                import torch
+                model = torch.quantization.quantize_dynamic(
+                    model.to('cpu'), {torch.nn.Linear}, dtype=torch.qint8)
+
+        if self.max_seq_length:
+            model.max_seq_length = self.max_seq_length
+        return model
+
+    def encode(self, texts, batch_size: int = DEFAULT_BATCH_SIZE) -> np.ndarray:
+        model = self.load()
+        # One forward pass at a time: concurrent encodes on CPU only fight
+        # over the same intra-op threads.
+        with self._encode_lock:
+            return model.encode(texts, batch_size=batch_size)
+
+
+def _send_frame(sock, header: dict, payload: bytes = b''):
+    header_bytes = json.dumps(header).encode('utf-8')
+    sock.sendall(struct.pack('!II', len(header_bytes), len(payload))
+                 + header_bytes + payload)
+
+
+def _recv_exact(sock, size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("Embedding socket closed mid-frame")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def _recv_frame(sock):
+    header_size, payload_size = struct.unpack('!II', _recv_exact(sock, 8))
+    header = json.loads(_recv_exact(sock, header_size).decode('utf-8'))
+    return header, _recv_exact(sock, payload_size)
+
+
+def make_model_key(model_name: str, backend: str = 'torch') -> str:
+    # Quantized backends produce close but not identical vectors, so they
+    # get their own cache entries.
+    return model_name if backend == 'torch' else f"{model_name}@{backend}"
+
+
+def _is_private(path: str) -> bool:
+    """True if `path` and its directory are ours and others cannot replace it."""
+    if not hasattr(os, 'getuid'):
+        return False
+    try:
+        directory = os.stat(os.path.dirname(os.path.abspath(path)))
+        owner = os.stat(path).st_uid if os.path.exists(path) else os.getuid()
+    except OSError:
+        return False
+    return (directory.st_uid == os.getuid() and not directory.st_mode & 0o022
+            and owner == os.getuid())
+
+
+class RemoteEmbeddingProvider:
+    """Client for an EmbeddingServer running in another local process."""
+
+    def __init__(self, path: str = EMBEDDING_SOCKET_PATH, timeout: float = 60):
+        self.path = path
+        self.timeout = timeout
+        self.model_key = None
+
+    def _request(self, header: dict):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(self.timeout)
+            sock.connect(self.path)
+            _send_frame(sock, header)
+            return _recv_frame(sock)
+
+    def ping(self) -> bool:
+        try:
+            header, _ = self._request({'op': 'info'})
+        except (OSError, ValueError):
+            return False
+        self.model_key = header.get('model')
+        return True
+
+    def load(self):
+        return self
+
+    def encode(self, texts, batch_size: int = DEFAULT_BATCH_SIZE) -> np.ndarray:
+        header, payload = self._request(
+            {'op': 'encode', 'texts': list(texts), 'batch_size': batch_size})
+        if 'error' in header:
+            raise RuntimeError(f"Embedding server error: {header['error']}")
+        return np.frombuffer(payload, dtype='<f4').reshape(header['shape'])
+
+
+class _EmbeddingRequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        try:
+            header, _ = _recv_frame(self.request)
+            if header.get('op') == 'info':
+                _send_frame(self.request, {'model': self.server.provider.model_key})
+                return
+            embeddings = encode(header['texts'],
+                                batch_size=header.get('batch_size', DEFAULT_BATCH_SIZE))
+            embeddings = np.ascontiguousarray(embeddings, dtype='<f4')
+            _send_frame(self.request, {'shape': list(embeddings.shape)},
+                        embeddings.tobytes())
+        except Exception as e:
+            try:
+                _send_frame(self.request, {'error': str(e)})
+            except OSError:
+                pass
+
+
+if hasattr(socketserver, 'ThreadingUnixStreamServer'):
+    class EmbeddingServer(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+
+        def __init__(self, path: str, provider):
+            self.provider = provider
+            super().__init__(path, _EmbeddingRequestHandler)
+else:
+    EmbeddingServer = None
+
+
+def serve(path: str = EMBEDDING_SOCKET_PATH):
+    """Serve this process's model on a Unix socket in a background thread.
+
+    Returns the server, or None where Unix sockets are unavailable, another
+    live process already owns the socket, or the socket cannot be made
+    private to this user.
+    """
+    if EmbeddingServer is None:
+        return None
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), mode=0o700, exist_ok=True)
+    except OSError as e:
+        print(f"Not serving embeddings: cannot create the socket directory: {e}")
+        return None
+    if not _is_private(path):
+        print(f"Not serving embeddings: {path} is not private to this user")
+        return None
+    try:
+        if os.path.exists(path):
+            if RemoteEmbeddingProvider(path, timeout=2).ping():
+                print(f"Embedding server already running at {path}")
+                return None
+            os.remove(path)
+        server = EmbeddingServer(path, get_provider())
+    except OSError as e:
+        print(f"Not serving embeddings on {path}: {e}")
+        return None
+    try:
+        os.chmod(path, 0o600)
+    except OSError as e:
+        print(f"Not serving embeddings on {path}: {e}")
+        server.server_close()
+        os.remove(path)
+        return None
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    print(f"Embedding server listening on {path}")
+    return server
+
+
+def stop_serving(server):
+    if server is not None:
+        server.shutdown()
+        server.server_close()
+        try:
+            os.remove(server.server_address)
+        except OSError:
+            pass
+
+
+def get_provider():
+    """Return the process-wide provider.
+
+    A running EmbeddingServer for the same model is preferred, so front ends
+    started next to the backend share its already-loaded model.
+    """
+    global _provider
+    with _provider_lock:
+        if _provider is None:
+            remote = None
+            wanted = make_model_key(EMBEDDING_MODEL_NAME, EMBEDDING_BACKEND)
+            if (EmbeddingServer is not None and os.path.exists(EMBEDDING_SOCKET_PATH)
+                    and _is_private(EMBEDDING_SOCKET_PATH)):
+                remote = RemoteEmbeddingProvider()
+                if not remote.ping() or remote.model_key != wanted:
+                    remote = None
+            _provider = remote or LocalEmbeddingProvider()
+        return _provider
+
+
+def encode(texts, batch_size: int = DEFAULT_BATCH_SIZE) -> np.ndarray:
+    """Embed a string (1-D result) or list of strings (2-D result)."""
+    provider = get_provider()
+    try:
+        return cached_encode(provider, provider.model_key, texts,
+                             batch_size=batch_size)
+    except OSError:
+        if not isinstance(provider, RemoteEmbeddingProvider):
+            raise
+        # The serving process went away; fall back to a local model.
+        global _provider
+        with _provider_lock:
+            _provider = LocalEmbeddingProvider()
+        return cached_encode(_provider, _provider.model_key, texts,
+                             batch_size=batch_size)
+
+
+def warm_up():
+    """Load the model now rather than on the first encode."""
+    get_provider().load()
@@ -0,0 +1,174 @@
+"""
+ingestion.py
+------------
+Background embedding and storage for what the request handlers produce.
+
+Instructions:
+- Handlers call submit_interaction() and submit_record() and return without
+  waiting for the embedding model or the database.
+- INGEST_WORKERS threads drain one bounded queue (INGEST_QUEUE_SIZE). Each
+  takes up to INGEST_BATCH_SIZE items, embeds all of their texts with one
+  encode call and stores interactions with one database write.
+- When the queue is full, submit blocks the handler until a worker catches
+  up (backpressure) instead of dropping data.
+- Records and interactions are stored separately, so a failure in one does
+  not lose the other. A failed step is retried INGEST_RETRIES times with
+  doubling delays from INGEST_RETRY_DELAY seconds; a batch of interactions
+  that still fails is stored one by one, so only the turns that cannot be
+  stored are dropped.
+- Conversation turns keep the time they were submitted, not the time a
+  worker got to them.
+- flush() waits until everything queued has been stored; stop() flushes and
+  ends the workers, and is called from app.signal_handler before the
+  database and storage log are closed.
+"""
+
+import os
+import queue
+import threading
+import time
+
+import embedding_provider
+from database import save_interactions
+
+INGEST_QUEUE_SIZE = int(os.environ.get('INGEST_QUEUE_SIZE', 1000))
+INGEST_WORKERS = int(os.environ.get('INGEST_WORKERS', 2))
+INGEST_BATCH_SIZE = int(os.environ.get('INGEST_BATCH_SIZE', 32))
+INGEST_RETRIES = int(os.environ.get('INGEST_RETRIES', 4))
+INGEST_RETRY_DELAY = float(os.environ.get('INGEST_RETRY_DELAY', 1))
+
+
+class IngestionPipeline:
+    def __init__(self, storage_log, workers: int = INGEST_WORKERS,
+                 queue_size: int = INGEST_QUEUE_SIZE,
+                 batch_size: int = INGEST_BATCH_SIZE):
+        self.storage_log = storage_log
+        self.workers = workers
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.threads = []
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        """Start the worker threads if they are not already running."""
+        with self._start_lock:
+            if self.threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f'ingest-{i}', daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def _put(self, item):
+        self.start()
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            print("Ingestion queue full; waiting for workers to catch up")
+            self.queue.put(item)
+
+    def submit_interaction(self, user_id: str, user_input: str, bot_response: str):
+        """Queue a conversation turn for database.save_interactions."""
+        self._put(('interaction', (user_id, user_input, bot_response, time.time())))
+
+    def submit_record(self, kind: str, service: str, record: dict, text: str):
+        """Queue a storage-log record; `text` is embedded into record['embedding']."""
+        self._put(('record', (kind, service, record, text)))
+
+    def pending(self) -> int:
+        return self.queue.qsize()
+
+    def flush(self):
+        """Block until every item queued so far has been stored."""
+        if self.threads:
+            self.queue.join()
+
+    def stop(self):
+        """Store everything still queued, then stop the workers."""
+        with self._start_lock:
+            threads, self.threads = self.threads, []
+        for _ in threads:
+            self.queue.put(None)
+        for thread in threads:
+            thread.join()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                break
+            batch = [item]
+            while len(batch) < self.batch_size:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self.queue.task_done()
+                    stopping = True
+                    break
+                batch.append(item)
+            try:
+                self._store(batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def _store(self, batch):
+        records = [payload for kind, payload in batch if kind == 'record']
+        if records:
+            self._store_records(records)
+
+        interactions = [payload for kind, payload in batch if kind == 'interaction']
+        if interactions:
+            self._store_interactions(interactions)
+
+    def _store_records(self, records):
+        embedded = False
+        stored = 0
+
+        def store():
+            # Resumes after the records a failed attempt already appended.
+            nonlocal embedded, stored
+            if not embedded:
+                embeddings = embedding_provider.encode([text for _, _, _, text in records])
+                for (_, _, record, _), embedding in zip(records, embeddings):
+                    record['embedding'] = embedding.tolist()
+                    record['embedding_model'] = embedding_provider.EMBEDDING_MODEL_NAME
+                embedded = True
+            while stored < len(records):
+                kind, service, record, _ = records[stored]
+                self.storage_log.append(kind, record, service)
+                stored += 1
+
+        if not _retry(store, f"storing {len(records)} records"):
+            print(f"Dropped {len(records) - stored} records")
+
+    def _store_interactions(self, interactions):
+        if _retry(lambda: save_interactions(interactions),
+                  f"storing {len(interactions)} interactions"):
+            return
+        if len(interactions) == 1:
+            print(f"Dropped an interaction for {interactions[0][0]}")
+            return
+        # One bad turn must not take the rest of the batch with it.
+        for interaction in interactions:
+            try:
+                save_interactions([interaction])
+            except Exception as e:
+                print(f"Dropped an interaction for {interaction[0]}: {e}")
+
+
+def _retry(func, what: str) -> bool:
+    """Call func(), retrying INGEST_RETRIES times; False if every try failed."""
+    for attempt in range(INGEST_RETRIES + 1):
+        try:
+            func()
+            return True
+        except Exception as e:
+            print(f"Error {what} (attempt {attempt + 1} of {INGEST_RETRIES + 1}): {e}")
+            if attempt < INGEST_RETRIES:
+                time.sleep(INGEST_RETRY_DELAY * 2 ** attempt)
+    return False
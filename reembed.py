@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+reembed.py
+----------
+Re-embed every stored conversation with a pool of worker processes.
+
+Instructions:
+- Conversation rowids are split into fixed ranges of --shard-size. Each
+  worker process loads the model once (the CPU threads are divided between
+  workers), reads and embeds whole shards and sends the vectors back.
+- This process is the only writer: every shard is stored through
+  database.run_write together with its row in reembed_checkpoints, in one
+  transaction.
+- Checkpoints are keyed by --run-id (default: the model key), so running the
+  same command again skips shards that already finished. --restart forgets
+  them.
+- Embeds with EMBEDDING_MODEL, the model the backend searches with: set
+  it before running. --model only confirms it; any other model is
+  rejected, since the backend's idle-time job would re-embed those rows
+  back (see database.reembed_stale_rows).
+- Refuses to run while the backend is up (it answers on the embedding
+  socket): the backend appends to the shared embedding matrix and keeps
+  the vector indexes loaded, and both are rebuilt here. Stop it first and
+  start it again afterwards. Where Unix sockets are unavailable this
+  cannot be detected, so check by hand.
+- Once every shard is done, the vector indexes and the shared embedding
+  matrix are rebuilt.
+
+Usage:
+    python reembed.py --workers 4
+    EMBEDDING_MODEL=all-mpnet-base-v2 python reembed.py --run-id mpnet-upgrade
+    python reembed.py --workers 8 --restart --json reembed.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sqlite3
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+import database
+import embedding_provider
+
+SHARD_SIZE = 2000
+SHARD_QUERY = """SELECT rowid, user_input, bot_response FROM conversations
+                 WHERE rowid >= ? AND rowid < ?
+                   AND user_input != '' AND bot_response != ''
+                 ORDER BY rowid"""
+
+_worker_provider = None
+_worker_db_file = None
+
+
+def _create_checkpoint_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS reembed_checkpoints (
+            run_id TEXT,
+            shard_start INTEGER,
+            shard_end INTEGER,
+            rows INTEGER,
+            model TEXT,
+            completed_at REAL,
+            PRIMARY KEY (run_id, shard_start, shard_end)
+        )
+    """)
+
+
+def _init_worker(db_file, model_name, backend, threads):
+    global _worker_provider, _worker_db_file
+    # Always a local model: a worker routed to the backend's embedding
+    # server would just queue behind every other worker.
+    _worker_provider = embedding_provider.LocalEmbeddingProvider(
+        model_name=model_name, backend=backend, threads=threads)
+    _worker_provider.load()
+    _worker_db_file = db_file
+
+
+def _embed_shard(start, end, batch_size):
+    """Embed one shard; returns (start, end, rowids, (3, rows, dim) float32)."""
+    connection = sqlite3.connect(f"file:{_worker_db_file}?mode=ro", uri=True)
+    try:
+        rows = connection.execute(SHARD_QUERY, (start, end)).fetchall()
+    finally:
+        connection.close()
+    if not rows:
+        return start, end, [], None
+    texts = database.interaction_texts([(r[1], r[2]) for r in rows])
+    embeddings = np.asarray(_worker_provider.encode(texts, batch_size=batch_size),
+                            dtype=database.EMBEDDING_DTYPE)
+    return start, end, [r[0] for r in rows], embeddings.reshape(3, len(rows), -1)
+
+
+def shard_ranges(connection, shard_size):
+    """Fixed [start, end) rowid ranges covering the table.
+
+    Boundaries are multiples of shard_size, so they line up with the
+    checkpoints of an earlier run even after rows were added.
+    """
+    low, high = connection.execute(
+        "SELECT MIN(rowid), MAX(rowid) FROM conversations").fetchone()
+    if low is None:
+        return []
+    first = low // shard_size * shard_size
+    return [(start, start + shard_size) for start in range(first, high + 1, shard_size)]
+
+
+def reembed(workers=1, shard_size=SHARD_SIZE, batch_size=database.EMBEDDING_BATCH_SIZE,
+            model_name=embedding_provider.EMBEDDING_MODEL_NAME,
+            backend=embedding_provider.EMBEDDING_BACKEND, run_id=None, restart=False):
+    """Re-embed all conversations; returns rows, seconds and rows/sec.
+
+    Raises RuntimeError if `model_name` is not EMBEDDING_MODEL or the
+    backend is running.
+    """
+    if model_name != embedding_provider.EMBEDDING_MODEL_NAME:
+        raise RuntimeError(
+            f"--model {model_name} differs from EMBEDDING_MODEL "
+            f"({embedding_provider.EMBEDDING_MODEL_NAME}); set EMBEDDING_MODEL instead")
+    if (embedding_provider.EmbeddingServer is not None
+            and embedding_provider.RemoteEmbeddingProvider(
+                embedding_provider.EMBEDDING_SOCKET_PATH, timeout=2).ping()):
+        raise RuntimeError(
+            f"The backend is running (it answers on {embedding_provider.EMBEDDING_SOCKET_PATH}); "
+            "stop it before re-embedding")
+    run_id = run_id or embedding_provider.make_model_key(model_name, backend)
+    database.init_db()
+    database.migrate_db()
+    database.run_write(_create_checkpoint_table)
+    if restart:
+        database.run_write(lambda cursor: cursor.execute(
+            "DELETE FROM reembed_checkpoints WHERE run_id=?", (run_id,)))
+
+    reader = sqlite3.connect(database.DB_FILE)
+    try:
+        shards = shard_ranges(reader, shard_size)
+        # Checkpoints from a run with another --shard-size do not line up.
+        finished = {(start, end) for start, end in reader.execute(
+            """SELECT shard_start, shard_end FROM reembed_checkpoints
+               WHERE run_id=? AND shard_end - shard_start = ?""",
+            (run_id, shard_size))}
+        total = reader.execute(
+            """SELECT COUNT(*) FROM conversations
+               WHERE user_input != '' AND bot_response != ''""").fetchone()[0]
+        already = reader.execute(
+            """SELECT COALESCE(SUM(rows), 0) FROM reembed_checkpoints
+               WHERE run_id=? AND shard_end - shard_start = ?""",
+            (run_id, shard_size)).fetchone()[0]
+    finally:
+        reader.close()
+    pending = [shard for shard in shards if shard not in finished]
+    print(f"Run {run_id}: {len(pending)} of {len(shards)} shards to embed "
+          f"({already} of {total} rows already done), {workers} workers")
+
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    done = 0
+    started = time.perf_counter()
+    # spawn: the parent runs the database writer thread, which fork would
+    # copy into every worker mid-flight.
+    with ProcessPoolExecutor(max_workers=workers,
+                             mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_init_worker,
+                             initargs=(os.path.abspath(database.DB_FILE), model_name,
+                                       backend, threads)) as pool:
+        queued = iter(pending)
+        running = set()
+        while True:
+            # Keep two shards per worker in flight so results never pile up.
+            while len(running) < 2 * workers:
+                shard = next(queued, None)
+                if shard is None:
+                    break
+                running.add(pool.submit(_embed_shard, shard[0], shard[1], batch_size))
+            if not running:
+                break
+            completed, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in completed:
+                start, end, rowids, embeddings = future.result()
+
+                def store(cursor):
+                    if rowids:
+                        database.write_embeddings(cursor, rowids, *embeddings, model=model_name)
+                    cursor.execute(
+                        """INSERT OR REPLACE INTO reembed_checkpoints
+                           (run_id, shard_start, shard_end, rows, model, completed_at)
+                           VALUES (?, ?, ?, ?, ?, ?)""",
+                        (run_id, start, end, len(rowids),
+                         embedding_provider.make_model_key(model_name, backend), time.time()))
+                database.run_write(store)
+
+                done += len(rowids)
+                elapsed = time.perf_counter() - started
+                rate = done / elapsed if elapsed else 0.0
+                remaining = total - already - done
+                eta = f"{remaining / rate:.0f}s" if rate else "?"
+                print(f"  {already + done}/{total} rows  {rate:.0f} rows/s  ETA {eta}")
+
+    seconds = time.perf_counter() - started
+    if done:
+        database.rebuild_indexes()
+    database.close_db()
+    return {'workers': workers, 'rows': done, 'seconds': seconds,
+            'rows_per_sec': done / seconds if seconds else 0.0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--shard-size', type=int, default=SHARD_SIZE)
+    parser.add_argument('--batch-size', type=int, default=database.EMBEDDING_BATCH_SIZE)
+    parser.add_argument('--model', default=embedding_provider.EMBEDDING_MODEL_NAME,
+                        help='must match EMBEDDING_MODEL')
+    parser.add_argument('--backend', default=embedding_provider.EMBEDDING_BACKEND,
+                        choices=embedding_provider.EMBEDDING_BACKENDS)
+    parser.add_argument('--run-id', help='checkpoint key (default: the model key)')
+    parser.add_argument('--restart', action='store_true',
+                        help='ignore checkpoints from an earlier run with this id')
+    parser.add_argument('--json', help='also write the summary to this file')
+    args = parser.parse_args()
+
+    try:
+        result = reembed(args.workers, args.shard_size, args.batch_size, args.model,
+                         args.backend, args.run_id, args.restart)
+    except RuntimeError as e:
+        parser.exit(1, f"{e}\n")
+    print(f"Re-embedded {result['rows']} rows in {result['seconds']:.1f}s "
+          f"({result['rows_per_sec']:.0f} rows/s)")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
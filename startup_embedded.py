@@ -3,11 +3,15 @@
 Startup script for the embedded browser version of the Multi-AI Chatbot Manager
 """
 
+import json
 import subprocess
 import sys
 import os
 import time
 import threading
+import urllib.request
+
+HEALTH_URL = "http://localhost:5001/health"
 
 def start_backend_server():
     """Start the backend HTTP server"""
@@ -16,6 +20,20 @@ def start_backend_server():
     except KeyboardInterrupt:
         pass
 
+def wait_for_backend(timeout=30):
+    """Poll /health until the backend answers, instead of guessing a delay"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(HEALTH_URL, timeout=1) as response:
+                health = json.loads(response.read().decode('utf-8'))
+                print(f"Backend is up (stages: {health.get('stages')})")
+                return True
+        except OSError:
+            time.sleep(0.1)
+    print(f"Backend did not answer within {timeout}s, continuing anyway")
+    return False
+
 def start_embedded_app():
     """Start the embedded desktop application"""
     try:
@@ -32,7 +50,7 @@ def main():
     backend_thread.start()
     
     print("Starting backend server...")
-    time.sleep(2)
+    wait_for_backend()
     
     print("Starting embedded desktop application...")
     start_embedded_app()
@@ -4,6 +4,7 @@ class ChatApp {
         this.userId = 'web_user';
         this.panels = new Map();
         this.compatibilityResults = null;
+        this.stream = null;
         this.init();
         
         window.addEventListener('beforeunload', () => {
@@ -48,15 +49,11 @@ class ChatApp {
             loading.style.display = 'flex';
             input.value = '';
 
-            enabledPanels.forEach(panel => {
-                panel.injectMessage(message);
-            });
+            await this.askAll(message, enabledPanels);
 
-            setTimeout(() => {
-                input.disabled = false;
-                button.disabled = false;
-                loading.style.display = 'none';
-            }, 3000);
+            input.disabled = false;
+            button.disabled = false;
+            loading.style.display = 'none';
         };
 
         button.addEventListener('click', sendToAll);
@@ -65,6 +62,80 @@ class ChatApp {
         });
     }
 
+    async askAll(message, panels) {
+        // One request: the server enhances the message once, sends it to
+        // every service concurrently and streams back a line per service.
+        const activePanels = panels.filter(panel => panel.sessionActive);
+        if (activePanels.length === 0) return;
+        activePanels.forEach(panel => {
+            panel.addPreviewMessage('Broadcast', message);
+            panel.streamRendered = false;
+        });
+
+        try {
+            const response = await fetch(`${this.baseUrl}/ask_all`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify({
+                    message: message,
+                    services: activePanels.map(panel => panel.model),
+                    stream: true
+                }),
+            });
+
+            // Validation errors come back as a single JSON object without a
+            // trailing newline, so whatever is left at EOF is parsed too.
+            const showLine = line => {
+                if (!line.trim()) return;
+                const result = JSON.parse(line);
+                if (!result.service && result.error) throw new Error(result.error);
+                this.showAskAllResult(result);
+            };
+            if (!response.ok) {
+                const text = await response.text();
+                let error = `HTTP ${response.status}`;
+                try {
+                    error = JSON.parse(text).error || error;
+                } catch (parseError) {}
+                throw new Error(error);
+            }
+
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffered = '';
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffered += decoder.decode(value, { stream: true });
+                const lines = buffered.split('\n');
+                buffered = lines.pop();
+                lines.forEach(showLine);
+            }
+            showLine(buffered + decoder.decode());
+        } catch (error) {
+            console.error('Ask All failed:', error);
+            activePanels.forEach(panel => panel.addPreviewMessage('Error', `Failed to send message: ${error.message}`));
+        }
+    }
+
+    showAskAllResult(result) {
+        const panel = this.panels.get(result.service);
+        if (!panel) {
+            if (result.error) console.error('Ask All failed:', result.error);
+            return;
+        }
+        if (result.status === 'ok' || result.status === 'partial') {
+            // Skip the preview only when the stream already rendered this answer.
+            if (!panel.streamRendered) {
+                panel.addPreviewMessage(panel.model, result.response_preview || 'Message sent successfully');
+            }
+        } else {
+            panel.addPreviewMessage('Error', result.error || 'No response');
+        }
+    }
+
     initScrapingControls() {
         const scrapeAllButton = document.getElementById('scrape-all-button');
         const testCompatibilityButton = document.getElementById('test-compatibility-button');
@@ -124,8 +195,28 @@ class ChatApp {
         }
     }
     
+    openStream() {
+        // One EventSource carries every service's events (tagged with
+        // data.service), so the page holds one server worker and one of the
+        // browser's per-host connections however many panels stream.
+        if (this.stream) return;
+        this.stream = new EventSource(`${this.baseUrl}/stream`);
+        ['reset', 'delta', 'done', 'closed'].forEach(type => {
+            this.stream.addEventListener(type, (e) => {
+                const data = JSON.parse(e.data);
+                const panel = this.panels.get(data.service);
+                if (panel) panel.handleStreamEvent(type, data);
+            });
+        });
+    }
+
     closeAllWindows() {
+        if (this.stream) {
+            this.stream.close();
+            this.stream = null;
+        }
         this.panels.forEach(panel => {
+            panel.closeStream();
             if (panel.aiWindow && !panel.aiWindow.closed) {
                 panel.aiWindow.close();
             }
@@ -144,6 +235,9 @@ class AIPanel {
         this.sessionActive = false;
         this.messages = [];
         this.aiWindow = null;
+        this.streaming = false;
+        this.streamingMessage = null;
+        this.streamRendered = false;
         
         this.initElements();
         this.initEventListeners();
@@ -254,6 +348,7 @@ class AIPanel {
                 this.sessionActive = true;
                 this.aiWindow = aiWindow;
                 this.addPreviewMessage('System', `Browser session started. AI site opened in new tab. Please login and start chatting.`);
+                this.openStream();
             } else {
                 if (aiWindow) aiWindow.close();
                 throw new Error(result.error || 'Failed to start session');
@@ -271,6 +366,7 @@ class AIPanel {
         if (!message || !this.sessionActive) return;
 
         this.addPreviewMessage('You', message);
+        this.streamRendered = false;
         this.previewInput.value = '';
         this.previewInput.disabled = true;
         this.sendIndividualBtn.disabled = true;
@@ -290,7 +386,10 @@ class AIPanel {
             const result = await response.json();
             
             if (result.success) {
-                this.addPreviewMessage(this.model, result.response_preview || 'Message sent successfully');
+                // Skip the preview only when the stream already rendered this answer.
+                if (!this.streamRendered) {
+                    this.addPreviewMessage(this.model, result.response_preview || 'Message sent successfully');
+                }
             } else {
                 throw new Error(result.error || 'Failed to send message');
             }
@@ -306,13 +405,59 @@ class AIPanel {
     addPreviewMessage(sender, text) {
         const messageDiv = document.createElement('div');
         messageDiv.className = `preview-message ${sender === 'You' ? 'user' : 'bot'}`;
-        messageDiv.innerHTML = `<strong>${sender}:</strong> ${text}`;
+        messageDiv.innerHTML = `<strong>${sender}:</strong> <span class="preview-text">${text}</span>`;
         this.previewMessages.appendChild(messageDiv);
         this.previewMessages.scrollTop = this.previewMessages.scrollHeight;
+        return messageDiv;
+    }
+
+    openStream() {
+        this.streaming = true;
+        this.streamingMessage = null;
+        this.app.openStream();
+    }
+
+    closeStream() {
+        this.streaming = false;
+        this.streamingMessage = null;
+    }
+
+    handleStreamEvent(type, data) {
+        if (!this.streaming) return;
+        if (type === 'reset') {
+            // A reset replaces the current answer's text (the page re-rendered
+            // it); an empty one while text is shown starts the next answer.
+            if (this.streamingMessage && data.text === '' && this.streamText()) {
+                this.streamingMessage = null;
+            }
+            this.setStreamText(data.text);
+        } else if (type === 'delta') {
+            this.setStreamText(this.streamText() + data.text);
+        } else if (type === 'done') {
+            this.streamingMessage = null;
+        } else if (type === 'closed') {
+            this.closeStream();
+        }
+    }
+
+    streamText() {
+        return this.streamingMessage
+            ? this.streamingMessage.querySelector('.preview-text').textContent : '';
+    }
+
+    setStreamText(text) {
+        if (!this.streamingMessage) {
+            if (!text) return;
+            this.streamingMessage = this.addPreviewMessage(this.model, '');
+        }
+        if (text) this.streamRendered = true;
+        this.streamingMessage.querySelector('.preview-text').textContent = text;
+        this.previewMessages.scrollTop = this.previewMessages.scrollHeight;
     }
 
     refreshSession() {
         if (this.sessionActive) {
+            this.closeStream();
             if (this.aiWindow && !this.aiWindow.closed) {
                 this.aiWindow.close();
             }
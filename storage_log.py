@@ -0,0 +1,543 @@
+"""
+storage_log.py
+--------------
+Segmented append-only log for scraped data, messages and responses.
+
+Instructions:
+- Records are appended as one JSON line each to segment files
+  (segment-00000001.jsonl, ...) in the log directory; a new segment starts
+  when the current one reaches max_segment_bytes or max_segment_age seconds,
+  and every process start opens a fresh segment.
+- Each segment has an offset index (segment-N.idx) with one fixed-size
+  entry per record: timestamp, byte offset and a CRC32 of the service name,
+  so readers can seek to a time range and skip other services without
+  parsing their lines.
+- fsync policy: 'always' (every append), 'interval' (at most every
+  fsync_interval seconds, and on rotate/close) or 'never' (leave it to the
+  OS).
+- read() yields records in append order, filtered by time range, service
+  and kind; a torn last line from a crash is skipped.
+- import_records() writes a whole segment from an iterator (e.g. old
+  per-event JSON files) crash-safely: temp files, fsync, rename, and a
+  .sources journal of the files it replaced so they are deleted exactly
+  once even if the process dies midway (finish_pending_imports()).
+- archive_segments() moves closed segments older than AI_ARCHIVE_AFTER
+  seconds to a compressed tier (segment-N.jsonl.gz, or .zst when the
+  optional zstandard package is installed, optionally with a dictionary
+  trained on our own records). Embeddings are stored there as base64
+  float32 instead of decimal text. read() and segments() handle archived
+  segments transparently.
+"""
+
+import base64
+import bisect
+import gzip
+import io
+import json
+import os
+import re
+import struct
+import sys
+import threading
+import time
+import zlib
+from array import array
+from typing import Iterable, Iterator, List, Optional
+
+FSYNC_POLICIES = ('always', 'interval', 'never')
+SEGMENT_MAX_BYTES = int(os.environ.get('AI_SEGMENT_MAX_BYTES', 64 * 1024 * 1024))
+SEGMENT_MAX_AGE = float(os.environ.get('AI_SEGMENT_MAX_AGE', 24 * 3600))
+FSYNC_POLICY = os.environ.get('AI_STORAGE_FSYNC', 'interval')
+FSYNC_INTERVAL = 1.0
+
+# timestamp (float64), byte offset (uint64), crc32 of the service (uint32)
+INDEX_ENTRY = struct.Struct('<dQI')
+SEGMENT_PATTERN = re.compile(r'^segment-(\d{8})\.jsonl(\.gz|\.zst)?$')
+
+ARCHIVE_AFTER = float(os.environ.get('AI_ARCHIVE_AFTER', 7 * 24 * 3600))
+ARCHIVE_CODEC = os.environ.get('AI_ARCHIVE_CODEC', 'gzip')
+ARCHIVE_ZSTD_DICT = os.environ.get('AI_ARCHIVE_ZSTD_DICT', '0') == '1'
+ARCHIVE_EXTENSIONS = {'gzip': '.gz', 'zstd': '.zst'}
+ZSTD_DICT_SIZE = 112640
+ZSTD_DICT_SAMPLES = 2000
+
+
+def _zstandard():
+    """The optional zstandard module, or None."""
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+def zstd_available() -> bool:
+    return _zstandard() is not None
+
+
+def pack_embedding(values) -> dict:
+    """Float list -> {"$f32": base64 of little-endian float32}."""
+    packed = array('f', values)
+    if sys.byteorder != 'little':
+        packed.byteswap()
+    return {'$f32': base64.b64encode(packed.tobytes()).decode('ascii')}
+
+
+def unpack_embedding(value):
+    if not (isinstance(value, dict) and '$f32' in value):
+        return value
+    packed = array('f')
+    packed.frombytes(base64.b64decode(value['$f32']))
+    if sys.byteorder != 'little':
+        packed.byteswap()
+    return packed.tolist()
+
+
+def service_key(service: Optional[str]) -> int:
+    return zlib.crc32((service or '').encode('utf-8'))
+
+
+def segment_filename(number: int) -> str:
+    return f"segment-{number:08d}.jsonl"
+
+
+class SegmentIndex:
+    """Offset index of one segment, read fully into memory."""
+
+    def __init__(self, path: str):
+        self.timestamps = []
+        self.offsets = []
+        self.services = []
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                data = f.read()
+            # A torn trailing entry from a crash is ignored.
+            usable = len(data) - len(data) % INDEX_ENTRY.size
+            for ts, offset, service in INDEX_ENTRY.iter_unpack(data[:usable]):
+                self.timestamps.append(ts)
+                self.offsets.append(offset)
+                self.services.append(service)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    @property
+    def first_ts(self) -> Optional[float]:
+        return self.timestamps[0] if self.timestamps else None
+
+    @property
+    def last_ts(self) -> Optional[float]:
+        return self.timestamps[-1] if self.timestamps else None
+
+    def positions(self, start: Optional[float] = None, end: Optional[float] = None,
+                  service: Optional[str] = None) -> List[int]:
+        """Entry numbers of records in [start, end] for `service`."""
+        low = bisect.bisect_left(self.timestamps, start) if start is not None else 0
+        high = bisect.bisect_right(self.timestamps, end) if end is not None else len(self)
+        if service is None:
+            return list(range(low, high))
+        wanted = service_key(service)
+        return [i for i in range(low, high) if self.services[i] == wanted]
+
+
+class SegmentedLog:
+    """Append-only, segment-rotated JSONL log with an offset index."""
+
+    def __init__(self, directory: str, max_segment_bytes: int = SEGMENT_MAX_BYTES,
+                 max_segment_age: float = SEGMENT_MAX_AGE,
+                 fsync: str = FSYNC_POLICY, fsync_interval: float = FSYNC_INTERVAL):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy {fsync!r}; expected one of {FSYNC_POLICIES}")
+        self.directory = directory
+        self.max_segment_bytes = max_segment_bytes
+        self.max_segment_age = max_segment_age
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.lock = threading.Lock()
+        self._data = None
+        self._index = None
+        self._segment = None
+        self._opened_at = 0.0
+        self._last_fsync = 0.0
+        self._last_ts = 0.0
+        self._highest_segment = 0
+        # Imports clean up each other's temp files, so they run one at a time.
+        self._import_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def segment_numbers(self) -> List[int]:
+        numbers = []
+        for filename in os.listdir(self.directory):
+            match = SEGMENT_PATTERN.match(filename)
+            if match:
+                numbers.append(int(match.group(1)))
+        return sorted(set(numbers))
+
+    def segment_path(self, number: int) -> str:
+        return os.path.join(self.directory, segment_filename(number))
+
+    def data_path(self, number: int) -> str:
+        """The segment's data file: plain while it exists, else its archive."""
+        path = self.segment_path(number)
+        if not os.path.exists(path):
+            for extension in ARCHIVE_EXTENSIONS.values():
+                if os.path.exists(path + extension):
+                    return path + extension
+        return path
+
+    def index_path(self, number: int) -> str:
+        return self.segment_path(number)[:-len('.jsonl')] + '.idx'
+
+    def _next_segment_number(self) -> int:
+        """Reserve a segment number; call with the lock held."""
+        numbers = self.segment_numbers()
+        self._highest_segment = max([self._highest_segment] + numbers) + 1
+        return self._highest_segment
+
+    def _open_next_segment(self):
+        self._segment = self._next_segment_number()
+        # 'wb': a reserved number is new, but an interrupted import may have
+        # left an orphan index behind for it.
+        self._data = open(self.segment_path(self._segment), 'wb')
+        self._index = open(self.index_path(self._segment), 'wb')
+        self._opened_at = time.time()
+
+    def _close_segment(self):
+        if self._data is not None:
+            self._sync(force=self.fsync != 'never')
+            self._data.close()
+            self._index.close()
+            self._data = None
+            self._index = None
+
+    def _sync(self, force: bool = False):
+        self._data.flush()
+        self._index.flush()
+        now = time.monotonic()
+        if force or self.fsync == 'always' or (
+                self.fsync == 'interval' and now - self._last_fsync >= self.fsync_interval):
+            os.fsync(self._data.fileno())
+            os.fsync(self._index.fileno())
+            self._last_fsync = now
+
+    def append(self, kind: str, record: dict, service: Optional[str] = None) -> dict:
+        """Append one record; returns where it was written.
+
+        The stored line is {"ts", "kind", "service", "data"}; ts is assigned
+        here and never decreases, so each segment's index stays sorted.
+        """
+        with self.lock:
+            ts = max(time.time(), self._last_ts)
+            self._last_ts = ts
+            line = json.dumps({'ts': ts, 'kind': kind, 'service': service, 'data': record},
+                              ensure_ascii=False).encode('utf-8') + b'\n'
+
+            if self._data is not None and self._should_rotate(len(line)):
+                self._close_segment()
+            if self._data is None:
+                self._open_next_segment()
+
+            offset = self._data.tell()
+            self._data.write(line)
+            self._index.write(INDEX_ENTRY.pack(ts, offset, service_key(service)))
+            self._sync()
+            return {'segment': segment_filename(self._segment), 'offset': offset, 'ts': ts}
+
+    def _should_rotate(self, incoming: int) -> bool:
+        size = self._data.tell()
+        if size and size + incoming > self.max_segment_bytes:
+            return True
+        return time.time() - self._opened_at >= self.max_segment_age
+
+    def flush(self):
+        """Flush and fsync the open segment regardless of policy."""
+        with self.lock:
+            if self._data is not None:
+                self._sync(force=True)
+
+    def close(self):
+        with self.lock:
+            self._close_segment()
+
+    def import_records(self, records: Iterable[dict]) -> Optional[dict]:
+        """Write `records` as one new segment, crash-safely.
+
+        Each record is {"ts", "kind", "service", "data"} plus an optional
+        "source" file path; records must come in non-decreasing ts order.
+        A record with only "ts" and "source" marks a source that holds
+        nothing to keep. Only one record is held at a time. The segment
+        becomes visible only once complete and fsynced; the sources of the
+        written records are then deleted. Returns {"segment", "records",
+        "sources"} ("segment" is None when only empty sources were
+        consumed) or None if there was nothing to do.
+        """
+        with self._import_lock:
+            return self._import_records(records)
+
+    def _import_records(self, records: Iterable[dict]) -> Optional[dict]:
+        with self.lock:
+            number = self._next_segment_number()
+        data_path = self.segment_path(number)
+        index_path = self.index_path(number)
+        journal_path = data_path[:-len('.jsonl')] + '.sources'
+
+        sources = []
+        count = 0
+        last_ts = 0.0
+        try:
+            with open(data_path + '.tmp', 'wb') as data, open(index_path + '.tmp', 'wb') as index, \
+                    open(journal_path + '.tmp', 'w', encoding='utf-8') as journal:
+                for record in records:
+                    ts = max(float(record['ts']), last_ts)
+                    last_ts = ts
+                    # Without "data" the record only marks its source as
+                    # consumed (e.g. an empty legacy file).
+                    if 'data' in record:
+                        line = json.dumps({'ts': ts, 'kind': record['kind'],
+                                           'service': record.get('service'), 'data': record['data']},
+                                          ensure_ascii=False).encode('utf-8') + b'\n'
+                        index.write(INDEX_ENTRY.pack(ts, data.tell(), service_key(record.get('service'))))
+                        data.write(line)
+                        count += 1
+                    if record.get('source'):
+                        sources.append(record['source'])
+                        journal.write(record['source'] + '\n')
+                for f in (data, index, journal):
+                    f.flush()
+                    os.fsync(f.fileno())
+        except BaseException:
+            # Nothing was renamed, so every source is still in place.
+            for path in (data_path, index_path, journal_path):
+                if os.path.exists(path + '.tmp'):
+                    os.remove(path + '.tmp')
+            raise
+
+        if not count:
+            for path in (data_path, index_path, journal_path):
+                os.remove(path + '.tmp')
+            # No segment to wait for, so nothing is lost by deleting these now.
+            for source in sources:
+                if os.path.exists(source):
+                    os.remove(source)
+            return {'segment': None, 'records': 0, 'sources': sources} if sources else None
+
+        # The journal and index go first: a segment is only listed once its
+        # .jsonl exists, and by then its sources are recorded for deletion.
+        os.replace(journal_path + '.tmp', journal_path)
+        os.replace(index_path + '.tmp', index_path)
+        os.replace(data_path + '.tmp', data_path)
+        self._fsync_directory()
+        self._finish_pending_imports()
+        return {'segment': segment_filename(number), 'records': count, 'sources': sources}
+
+    def finish_pending_imports(self):
+        """Delete the sources of completed imports and any half-written one."""
+        with self._import_lock:
+            self._finish_pending_imports()
+
+    def _finish_pending_imports(self):
+        for filename in os.listdir(self.directory):
+            path = os.path.join(self.directory, filename)
+            if filename.endswith('.tmp'):
+                # An import that died before its rename; its sources remain.
+                os.remove(path)
+            elif filename.endswith('.sources'):
+                segment_path = path[:-len('.sources')] + '.jsonl'
+                if os.path.exists(segment_path):
+                    with open(path, 'r', encoding='utf-8') as journal:
+                        for source in journal:
+                            source = source.rstrip('\n')
+                            if source and os.path.exists(source):
+                                os.remove(source)
+                os.remove(path)
+
+    def _fsync_directory(self):
+        if hasattr(os, 'O_DIRECTORY'):
+            fd = os.open(self.directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def read(self, start: Optional[float] = None, end: Optional[float] = None,
+             service: Optional[str] = None, kind: Optional[str] = None) -> Iterator[dict]:
+        """Yield records with start <= ts <= end, optionally for one service/kind."""
+        with self.lock:
+            if self._data is not None:
+                self._data.flush()
+                self._index.flush()
+        for number in self.segment_numbers():
+            index = SegmentIndex(self.index_path(number))
+            if not len(index):
+                continue
+            if (start is not None and index.last_ts < start) or \
+                    (end is not None and index.first_ts > end):
+                continue
+            positions = index.positions(start, end, service)
+            if not positions:
+                continue
+            path = self.data_path(number)
+            lines = (self._read_plain(path, index, positions) if path.endswith('.jsonl')
+                     else self._read_archived(path, positions))
+            for line in lines:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if kind is None or entry['kind'] == kind:
+                    if 'embedding' in entry['data']:
+                        entry['data']['embedding'] = unpack_embedding(entry['data']['embedding'])
+                    yield entry
+
+    def _read_plain(self, path: str, index: SegmentIndex, positions: List[int]):
+        with open(path, 'rb') as f:
+            for position in positions:
+                f.seek(index.offsets[position])
+                yield f.readline()
+
+    def _read_archived(self, path: str, positions: List[int]):
+        # Archives are read sequentially; line i matches index entry i.
+        wanted = set(positions)
+        last = positions[-1]
+        with self._open_archive(path) as f:
+            for number, line in enumerate(f):
+                if number in wanted:
+                    yield line
+                if number >= last:
+                    break
+
+    def _open_archive(self, path: str):
+        if path.endswith('.gz'):
+            return gzip.open(path, 'rb')
+        zstandard = _zstandard()
+        if zstandard is None:
+            raise RuntimeError(f"{path} needs the zstandard package to read")
+        raw = open(path, 'rb')
+        dict_id = zstandard.get_frame_parameters(raw.read(18)).dict_id
+        raw.seek(0)
+        dictionary = self._load_zstd_dictionary(dict_id) if dict_id else None
+        decompressor = zstandard.ZstdDecompressor(dict_data=dictionary)
+        return io.BufferedReader(decompressor.stream_reader(raw, closefd=True))
+
+    def _zstd_dictionary_path(self, dict_id: int) -> str:
+        return os.path.join(self.directory, f"zstd-{dict_id}.dict")
+
+    def _load_zstd_dictionary(self, dict_id: int):
+        with open(self._zstd_dictionary_path(dict_id), 'rb') as f:
+            return _zstandard().ZstdCompressionDict(f.read())
+
+    def train_zstd_dictionary(self, size: int = ZSTD_DICT_SIZE,
+                              samples: int = ZSTD_DICT_SAMPLES):
+        """Train a zstd dictionary on records from the newest segments.
+
+        Scraped HTML and JSON keys repeat across records, which a shared
+        dictionary captures; it is saved next to the segments, where
+        readers find it by the id stored in each archive.
+        """
+        zstandard = _zstandard()
+        lines = []
+        for number in reversed(self.segment_numbers()):
+            path = self.data_path(number)
+            with (open(path, 'rb') if path.endswith('.jsonl') else self._open_archive(path)) as f:
+                for line in f:
+                    lines.append(self._archive_line(line))
+                    if len(lines) >= samples:
+                        break
+            if len(lines) >= samples:
+                break
+        dictionary = zstandard.train_dictionary(size, lines)
+        with open(self._zstd_dictionary_path(dictionary.dict_id()), 'wb') as f:
+            f.write(dictionary.as_bytes())
+        return dictionary
+
+    @staticmethod
+    def _archive_line(line: bytes) -> bytes:
+        """Re-encode a record for the archive with a binary embedding."""
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            # Keep unparseable lines so line numbers still match the index.
+            return line
+        embedding = entry['data'].get('embedding') if isinstance(entry.get('data'), dict) else None
+        if isinstance(embedding, list) and embedding:
+            entry['data']['embedding'] = pack_embedding(embedding)
+        return json.dumps(entry, ensure_ascii=False).encode('utf-8') + b'\n'
+
+    def archive_segments(self, older_than: float = ARCHIVE_AFTER,
+                         codec: str = ARCHIVE_CODEC,
+                         use_dictionary: bool = ARCHIVE_ZSTD_DICT) -> List[dict]:
+        """Compress closed segments whose newest record is older than `older_than` seconds.
+
+        Each archive is written to a temp file, fsynced and renamed before
+        the plain segment is removed. Falls back to gzip when zstd is
+        requested but not installed. Returns one entry per archived segment
+        with its plain and compressed sizes.
+        """
+        if codec not in ARCHIVE_EXTENSIONS:
+            raise ValueError(f"Unknown archive codec {codec!r}; expected one of {tuple(ARCHIVE_EXTENSIONS)}")
+        if codec == 'zstd' and _zstandard() is None:
+            print("zstandard is not installed; archiving with gzip")
+            codec = 'gzip'
+
+        with self.lock:
+            current = self._segment if self._data is not None else None
+        cutoff = time.time() - older_than
+        dictionary = None
+        archived = []
+        for number in self.segment_numbers():
+            plain = self.segment_path(number)
+            if number == current or not os.path.exists(plain):
+                continue
+            if any(os.path.exists(plain + extension) for extension in ARCHIVE_EXTENSIONS.values()):
+                # Archived earlier; the plain copy outlived a crash.
+                os.remove(plain)
+                continue
+            index = SegmentIndex(self.index_path(number))
+            if not len(index) or index.last_ts > cutoff:
+                continue
+
+            if codec == 'zstd' and use_dictionary and dictionary is None:
+                dictionary = self.train_zstd_dictionary()
+            target = plain + ARCHIVE_EXTENSIONS[codec]
+            self._write_archive(plain, target + '.tmp', len(index), codec, dictionary)
+            os.replace(target + '.tmp', target)
+            self._fsync_directory()
+            archived.append({'segment': os.path.basename(target),
+                             'plain_size': os.path.getsize(plain),
+                             'archived_size': os.path.getsize(target)})
+            os.remove(plain)
+        return archived
+
+    def _write_archive(self, source: str, target: str, records: int, codec: str, dictionary):
+        with open(source, 'rb') as f, open(target, 'wb') as raw:
+            if codec == 'gzip':
+                out = gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=9)
+            else:
+                compressor = _zstandard().ZstdCompressor(level=19, dict_data=dictionary)
+                out = compressor.stream_writer(raw, closefd=False)
+            with out:
+                # Only indexed lines: a torn tail from a crash is dropped.
+                for number, line in enumerate(f):
+                    if number >= records:
+                        break
+                    out.write(self._archive_line(line))
+            raw.flush()
+            os.fsync(raw.fileno())
+
+    def segments(self) -> List[dict]:
+        """Per-segment file stats and time range, oldest first."""
+        result = []
+        for number in self.segment_numbers():
+            path = self.data_path(number)
+            index = SegmentIndex(self.index_path(number))
+            stat = os.stat(path)
+            result.append({
+                'filename': os.path.basename(path),
+                'archived': not path.endswith('.jsonl'),
+                'size': stat.st_size,
+                'modified': stat.st_mtime,
+                'records': len(index),
+                'first_ts': index.first_ts,
+                'last_ts': index.last_ts
+            })
+        return result
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Test that concurrent saves keep the in-memory vector indexes complete.
+
+Several threads save conversations for one user while its index is loaded,
+and idle-time re-embedding runs alongside them; afterwards the index must
+hold exactly the rows the database has for the current model. Saves made
+while an index is still loading must not wait for it and must reach it. The
+embedding model is replaced with a deterministic stand-in, so this runs
+without sentence-transformers.
+"""
+
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+import database
+import embedding_provider
+from vector_index import EmbeddingMatrix
+
+USER = 'web_user'
+THREADS = 8
+SAVES_PER_THREAD = 50
+
+
+def fake_encode(texts, batch_size=None):
+    texts = [texts] if isinstance(texts, str) else list(texts)
+    rng = np.random.default_rng(len(texts))
+    return rng.random((len(texts), 16), dtype=np.float32)
+
+
+def open_database(tmp):
+    database.close_db()
+    database._local.__dict__.clear()
+    database._user_indexes.clear()
+    database.DB_FILE = os.path.join(tmp, 'concurrency.db')
+    database.INDEX_DIR = os.path.join(tmp, 'indexes')
+    database._matrix = EmbeddingMatrix(database.DB_FILE + ".matrix")
+    database.init_db()
+    database.migrate_db()
+
+
+def indexed_rows():
+    return database._reader().execute(
+        """SELECT COUNT(*) FROM conversations c
+           JOIN conversation_embeddings e ON e.conversation_id = c.id
+           WHERE c.user_id=? AND e.model=?""",
+        (USER, database.MODEL_VERSION)).fetchone()[0]
+
+
+def run_concurrently(*targets):
+    """Run `targets` in threads, with a random pause after every commit.
+
+    The pause lets savers woken by one group commit reach the index in any
+    order, which is what lost rows when the index was updated by them.
+    """
+    bump = database._bump_data_version
+    rng = random.Random(0)
+
+    def bump_slowly():
+        time.sleep(rng.random() / 500)
+        bump()
+
+    database._bump_data_version = bump_slowly
+    try:
+        threads = [threading.Thread(target=target) for target in targets]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        database._bump_data_version = bump
+
+
+def test_concurrent_saves_reach_the_index():
+    original_encode = embedding_provider.encode
+    embedding_provider.encode = fake_encode
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            open_database(tmp)
+            database.save_interaction(USER, 'first', 'answer')
+            index = database.get_user_index(USER)
+            assert index is not None
+
+            def save():
+                for i in range(SAVES_PER_THREAD):
+                    database.save_interaction(USER, f'question {i}', 'answer')
+
+            run_concurrently(*[save] * THREADS)
+            assert len(index) == indexed_rows() == 1 + THREADS * SAVES_PER_THREAD
+            database.close_db()
+    finally:
+        embedding_provider.encode = original_encode
+
+
+def test_reembedding_alongside_saves_reaches_the_index():
+    original_encode = embedding_provider.encode
+    embedding_provider.encode = fake_encode
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            open_database(tmp)
+            for i in range(100):
+                database.save_interaction(USER, f'old {i}', 'answer')
+            database.run_write(lambda cursor: cursor.execute(
+                "UPDATE conversation_embeddings SET model='older-model' WHERE conversation_id % 2 = 0"))
+            database._user_indexes.clear()
+            index = database.get_user_index(USER)
+            assert len(index) == 50
+
+            def save():
+                for i in range(SAVES_PER_THREAD):
+                    database.save_interaction(USER, f'question {i}', 'answer')
+
+            def reembed():
+                while database.reembed_stale_rows(budget=1.0, batch_size=8):
+                    pass
+
+            run_concurrently(reembed, *[save] * 4)
+            assert len(index) == indexed_rows() == 100 + 4 * SAVES_PER_THREAD
+            assert len(set(index.index.snapshot()[0].tolist())) == len(index)
+            database.close_db()
+    finally:
+        embedding_provider.encode = original_encode
+
+
+def test_saves_do_not_wait_for_an_index_load():
+    original_encode = embedding_provider.encode
+    embedding_provider.encode = fake_encode
+    load = database._load_user_index
+    reading = threading.Event()
+    release = threading.Event()
+
+    def slow_load(user_id):
+        index = load(user_id)
+        if user_id == USER:
+            reading.set()
+            release.wait(10)
+        return index
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            open_database(tmp)
+            for i in range(20):
+                database.save_interaction(USER, f'old {i}', 'answer')
+            database._user_indexes.clear()
+            database._load_user_index = slow_load
+            loaded = []
+            loader = threading.Thread(target=lambda: loaded.append(database.get_user_index(USER)))
+            loader.start()
+            assert reading.wait(10)
+
+            # Commits run their index hook while the load is still going.
+            started = time.monotonic()
+            for i in range(10):
+                database.save_interaction(USER, f'new {i}', 'answer')
+            database.save_interaction('other_user', 'question', 'answer')
+            assert database.get_user_index('other_user') is not None
+            assert time.monotonic() - started < 5
+            assert loader.is_alive()
+
+            release.set()
+            loader.join()
+            assert len(loaded[0]) == indexed_rows() == 30
+            assert database.get_user_index(USER) is loaded[0]
+            database.close_db()
+    finally:
+        release.set()
+        database._load_user_index = load
+        embedding_provider.encode = original_encode
+
+
+if __name__ == "__main__":
+    try:
+        test_concurrent_saves_reach_the_index()
+        print("✓ Concurrent saves: every row reaches the loaded index")
+        test_reembedding_alongside_saves_reaches_the_index()
+        print("✓ Re-embedding alongside saves: no rows lost or duplicated")
+        test_saves_do_not_wait_for_an_index_load()
+        print("✓ Index load: saves and other users' loads do not wait for it")
+        sys.exit(0)
+    except Exception as e:
+        print(f"\n❌ TEST ERROR: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
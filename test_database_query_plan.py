@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Test that recent-context lookups use the (user_id, created_at) index.
+
+Checks EXPLAIN QUERY PLAN for get_recent_context's query on a fresh
+database and on a schema v2 database migrated by migrate_db(), so the lookup
+stays an index range scan (no full scan, no temp B-tree sort) as history
+grows, and that rows without created_at yet come back in id order while
+the migration is pending. Runs without the embedding model.
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+
+import database
+from vector_index import EmbeddingMatrix
+
+RECENT_QUERY = """SELECT user_input, bot_response FROM conversations
+                  WHERE user_id=? ORDER BY created_at DESC, id DESC LIMIT ?"""
+
+
+def open_database(path):
+    """Point database.py at `path` and run init_db() and migrate_db()."""
+    database.close_db()
+    database._local.__dict__.clear()
+    database.DB_FILE = path
+    database._matrix = EmbeddingMatrix(path + ".matrix")
+    database.init_db()
+    database.migrate_db()
+
+
+def query_plan(sql, params):
+    rows = database._reader().execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+    return [row[-1] for row in rows]
+
+
+def assert_uses_index(plan):
+    assert any('USING INDEX idx_conversations_user_created' in step for step in plan), plan
+    assert not any('TEMP B-TREE' in step for step in plan), plan
+    assert not any(step.startswith('SCAN') for step in plan), plan
+
+
+def test_recent_context_query_uses_index():
+    with tempfile.TemporaryDirectory() as tmp:
+        open_database(os.path.join(tmp, 'fresh.db'))
+        assert_uses_index(query_plan(RECENT_QUERY, ('web_user', 5)))
+        database.close_db()
+
+
+def create_v2_database(path, rows):
+    """A schema v2 database holding (timestamp, user_input, bot_response) rows."""
+    legacy = sqlite3.connect(path)
+    legacy.execute("""
+        CREATE TABLE conversations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT,
+            timestamp TEXT,
+            user_input TEXT,
+            bot_response TEXT,
+            user_input_embedding TEXT,
+            bot_response_embedding TEXT,
+            combined_embedding TEXT
+        )
+    """)
+    legacy.executemany(
+        "INSERT INTO conversations (user_id, timestamp, user_input, bot_response) VALUES ('web_user', ?, ?, ?)",
+        rows)
+    legacy.execute("PRAGMA user_version = 2")
+    legacy.commit()
+    legacy.close()
+
+
+def test_v2_database_is_migrated_and_indexed():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'legacy.db')
+        # As TEXT, '999.5' sorts after '1000.1'.
+        create_v2_database(path, [('1000.1', 'newer', 'b'),
+                                  ('999.5', 'older', 'a'),
+                                  ('2024-01-01T00:00:00', 'newest', 'c')])
+
+        open_database(path)
+        assert database._reader().execute("PRAGMA user_version").fetchone()[0] == database.SCHEMA_VERSION
+        assert database.get_recent_context('web_user', 3) == [
+            'User: older | Bot: a', 'User: newer | Bot: b', 'User: newest | Bot: c']
+        assert_uses_index(query_plan(RECENT_QUERY, ('web_user', 5)))
+        database.close_db()
+
+
+def test_recent_context_before_migration():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'legacy.db')
+        create_v2_database(path, [(str(1000 + i), f'old {i}', 'a') for i in range(5)])
+        database.close_db()
+        database._local.__dict__.clear()
+        database.DB_FILE = path
+        database.init_db()
+        # A save made while migrate_db() has not backfilled created_at yet.
+        database.run_write(lambda cursor: cursor.execute(
+            """INSERT INTO conversations (user_id, user_input, bot_response, created_at)
+               VALUES ('web_user', 'new', 'b', 2000)"""))
+
+        assert database.get_recent_context('web_user', 3) == [
+            'User: old 3 | Bot: a', 'User: old 4 | Bot: a', 'User: new | Bot: b']
+        database.close_db()
+
+
+if __name__ == "__main__":
+    try:
+        test_recent_context_query_uses_index()
+        print("✓ Fresh database: recent-context query uses the index")
+        test_v2_database_is_migrated_and_indexed()
+        print("✓ Schema v2 database: timestamps backfilled and indexed")
+        test_recent_context_before_migration()
+        print("✓ Before migration: recent context falls back to id order")
+        sys.exit(0)
+    except Exception as e:
+        print(f"\n❌ TEST ERROR: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
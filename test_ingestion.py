@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Test the background ingestion pipeline in ingestion.py.
+
+Checks that a failed storage-log append is retried without duplicating or
+re-embedding the records already written, that a batch of interactions
+that keeps failing is stored one by one so only the bad turn is dropped,
+and that stop() stores everything still queued before the workers end.
+The database and embedding model are replaced with stand-ins.
+"""
+
+import sys
+import threading
+import time
+
+import numpy as np
+
+import embedding_provider
+import ingestion
+from ingestion import IngestionPipeline
+
+
+class FakeLog:
+    """Storage log whose appends fail `failures` times, once each, at `fail_at`."""
+
+    def __init__(self, fail_at=None, failures=0):
+        self.records = []
+        self.fail_at = fail_at
+        self.failures = failures
+
+    def append(self, kind, record, service=None):
+        if len(self.records) == self.fail_at and self.failures:
+            self.failures -= 1
+            raise OSError('disk full')
+        self.records.append((kind, service, record))
+
+
+def with_stand_ins(test):
+    """Run `test(encoded, saved)` with a counting encoder and no retry delay."""
+    original_encode = embedding_provider.encode
+    original_save = ingestion.save_interactions
+    original_delay = ingestion.INGEST_RETRY_DELAY
+    encoded = []
+    saved = []
+    lock = threading.Lock()
+
+    def fake_encode(texts, batch_size=None):
+        encoded.append(list(texts))
+        return np.ones((len(texts), 4), dtype=np.float32)
+
+    def fake_save(interactions):
+        with lock:
+            saved.extend(interactions)
+
+    embedding_provider.encode = fake_encode
+    ingestion.save_interactions = fake_save
+    ingestion.INGEST_RETRY_DELAY = 0
+    try:
+        test(encoded, saved)
+    finally:
+        embedding_provider.encode = original_encode
+        ingestion.save_interactions = original_save
+        ingestion.INGEST_RETRY_DELAY = original_delay
+
+
+def test_record_retry_resumes_after_stored_records():
+    def test(encoded, saved):
+        log = FakeLog(fail_at=2, failures=2)
+        pipeline = IngestionPipeline(log, workers=1)
+        pipeline._store_records([('scrape', 'chatgpt', {'number': i}, f'text {i}')
+                                 for i in range(5)])
+
+        assert [record['number'] for _, _, record in log.records] == list(range(5))
+        assert len(encoded) == 1
+        assert all(record['embedding'] == [1.0] * 4 for _, _, record in log.records)
+    with_stand_ins(test)
+
+
+def test_failing_batch_is_stored_one_by_one():
+    def test(encoded, saved):
+        def save_without_bad_turns(interactions):
+            if any(user_input == 'bad' for _, user_input, _, _ in interactions):
+                raise ValueError('bad turn')
+            saved.extend(interactions)
+
+        ingestion.save_interactions = save_without_bad_turns
+        pipeline = IngestionPipeline(FakeLog(), workers=1)
+        turns = [('web_user', text, 'answer', 1000.0 + i)
+                 for i, text in enumerate(['first', 'bad', 'third'])]
+        pipeline._store_interactions(turns)
+        assert [turn[1] for turn in saved] == ['first', 'third']
+    with_stand_ins(test)
+
+
+def test_stop_stores_everything_queued():
+    def test(encoded, saved):
+        log = FakeLog()
+        pipeline = IngestionPipeline(log, workers=2, batch_size=4)
+        submitted_at = time.time()
+        for i in range(50):
+            pipeline.submit_interaction('web_user', f'question {i}', 'answer')
+            pipeline.submit_record('message', 'chatgpt', {'number': i}, f'question {i}')
+        pipeline.stop()
+
+        assert pipeline.threads == [] and pipeline.pending() == 0
+        assert sorted(turn[1] for turn in saved) == sorted(f'question {i}' for i in range(50))
+        # Turns keep the time they were submitted.
+        assert all(submitted_at <= turn[3] <= time.time() for turn in saved)
+        assert sorted(record['number'] for _, _, record in log.records) == list(range(50))
+    with_stand_ins(test)
+
+
+if __name__ == "__main__":
+    try:
+        test_record_retry_resumes_after_stored_records()
+        print("✓ Records: a failed append is retried without duplicates")
+        test_failing_batch_is_stored_one_by_one()
+        print("✓ Interactions: a failing batch falls back to one by one")
+        test_stop_stores_everything_queued()
+        print("✓ stop(): everything queued is stored first")
+        sys.exit(0)
+    except Exception as e:
+        print(f"\n❌ TEST ERROR: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
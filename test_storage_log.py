@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Test the segmented storage log in storage_log.py.
+
+Checks that segments rotate at max_segment_bytes and read back in append
+order, that a reopened log starts a fresh segment, that a torn last
+line left by a crash is skipped while every complete record is still read,
+that an import interrupted at any point keeps every legacy file's
+records exactly once, and that segments archived with gzip or zstd (when
+zstandard is installed) read back the same as before.
+"""
+
+import json
+import os
+import sys
+import tempfile
+
+import storage_log
+from storage_log import SegmentedLog
+
+
+def write_records(log, count, service='chatgpt'):
+    for i in range(count):
+        log.append('message', {'number': i, 'text': 'x' * 100}, service=service)
+
+
+def test_segments_rotate_and_read_in_order():
+    with tempfile.TemporaryDirectory() as tmp:
+        log = SegmentedLog(tmp, max_segment_bytes=1000, fsync='never')
+        write_records(log, 30)
+        write_records(log, 5, service='claude')
+        log.close()
+
+        segments = log.segments()
+        assert len(segments) > 1
+        assert all(segment['size'] <= 1000 for segment in segments)
+        assert sum(segment['records'] for segment in segments) == 35
+
+        numbers = [entry['data']['number'] for entry in log.read(service='chatgpt')]
+        assert numbers == list(range(30))
+        assert len(list(log.read(service='claude', kind='message'))) == 5
+        assert list(log.read(kind='scrape')) == []
+
+        timestamps = [entry['ts'] for entry in log.read()]
+        assert timestamps == sorted(timestamps)
+        middle = timestamps[17]
+        assert [entry['ts'] for entry in log.read(start=middle)] == \
+            [ts for ts in timestamps if ts >= middle]
+
+        reopened = SegmentedLog(tmp, fsync='never')
+        reopened.append('message', {'number': 30}, service='chatgpt')
+        reopened.close()
+        assert len(reopened.segments()) == len(segments) + 1
+        assert len(list(reopened.read(service='chatgpt'))) == 31
+
+
+def test_torn_last_line_is_skipped():
+    with tempfile.TemporaryDirectory() as tmp:
+        log = SegmentedLog(tmp, fsync='never')
+        write_records(log, 3)
+        log.close()
+
+        # A crash mid-append: the index entry made it, half the line did not.
+        data_path = log.segment_path(log.segment_numbers()[-1])
+        with open(data_path, 'rb') as f:
+            data = f.read()
+        last_line = data.rindex(b'\n', 0, len(data) - 1) + 1
+        with open(data_path, 'wb') as f:
+            f.write(data[:last_line + 20])
+        # ...and a partial index entry after it.
+        with open(log.index_path(log.segment_numbers()[-1]), 'ab') as f:
+            f.write(b'\0' * 7)
+
+        numbers = [entry['data']['number'] for entry in log.read()]
+        assert numbers == [0, 1]
+
+        reopened = SegmentedLog(tmp, fsync='never')
+        reopened.append('message', {'number': 3})
+        reopened.close()
+        assert [entry['data']['number'] for entry in reopened.read()] == [0, 1, 3]
+
+
+def legacy_files(directory, count):
+    """Per-event JSON files, plus an empty consolidated file, as import records."""
+    os.makedirs(directory)
+    records = []
+    for i in range(count):
+        path = os.path.join(directory, f"message_{i}.json")
+        with open(path, 'w') as f:
+            json.dump({'number': i}, f)
+        records.append({'ts': i, 'kind': 'message', 'service': 'chatgpt',
+                        'data': {'number': i}, 'source': path})
+    path = os.path.join(directory, 'consolidated_data_empty.json')
+    with open(path, 'w') as f:
+        json.dump({'consolidated_files': []}, f)
+    records.append({'ts': count, 'source': path})
+    return records
+
+
+def test_interrupted_import_recovers():
+    with tempfile.TemporaryDirectory() as tmp:
+        log = SegmentedLog(os.path.join(tmp, 'log'), fsync='never')
+        legacy = os.path.join(tmp, 'legacy')
+        records = legacy_files(legacy, 5)
+
+        def failing():
+            yield from records[:3]
+            raise RuntimeError('crash while reading')
+
+        # Dies while writing: temp files go, the originals stay.
+        try:
+            log.import_records(failing())
+        except RuntimeError:
+            pass
+        assert not [name for name in os.listdir(log.directory) if name.endswith('.tmp')]
+        assert len(os.listdir(legacy)) == 6 and list(log.read()) == []
+
+        # Dies between renames: the journal is in place but not the segment.
+        replace = storage_log.os.replace
+        calls = []
+
+        def replace_then_die(src, dst):
+            calls.append(src)
+            if len(calls) == 3:
+                raise SystemExit('crash before the segment rename')
+            replace(src, dst)
+
+        storage_log.os.replace = replace_then_die
+        try:
+            log.import_records(iter(records))
+        except SystemExit:
+            pass
+        finally:
+            storage_log.os.replace = replace
+        log.finish_pending_imports()
+        assert len(os.listdir(legacy)) == 6 and list(log.read()) == []
+
+        # Dies after the rename, before deleting the originals.
+        finish = log._finish_pending_imports
+        log._finish_pending_imports = lambda: None
+        result = log.import_records(iter(records))
+        log._finish_pending_imports = finish
+        assert result['records'] == 5 and len(result['sources']) == 6
+        assert len(os.listdir(legacy)) == 6
+
+        SegmentedLog(log.directory).finish_pending_imports()
+        assert os.listdir(legacy) == []
+        assert [entry['data']['number'] for entry in log.read()] == list(range(5))
+
+
+def test_archived_segments_read_back():
+    codecs = [('gzip', False)]
+    if storage_log.zstd_available():
+        codecs += [('zstd', False), ('zstd', True)]
+    for codec, use_dictionary in codecs:
+        with tempfile.TemporaryDirectory() as tmp:
+            log = SegmentedLog(tmp, max_segment_bytes=4000, fsync='never')
+            for i in range(40):
+                log.append('scrape', {'number': i, 'html': f'<div class="message">{i}</div>' * 5,
+                                      'embedding': [i / 4, -0.5, 0.25]},
+                           service='chatgpt' if i % 2 else 'claude')
+            log.close()
+            before = list(log.read())
+            claude = list(log.read(service='claude', start=before[10]['ts']))
+
+            archived = log.archive_segments(older_than=0, codec=codec,
+                                            use_dictionary=use_dictionary)
+            assert len(archived) == len(log.segment_numbers()) > 1
+            assert all(segment['archived'] for segment in log.segments())
+            assert all(name.endswith(storage_log.ARCHIVE_EXTENSIONS[codec])
+                       for name in (entry['segment'] for entry in archived))
+
+            assert list(log.read()) == before
+            assert list(log.read(service='claude', start=before[10]['ts'])) == claude
+
+
+if __name__ == "__main__":
+    try:
+        test_segments_rotate_and_read_in_order()
+        print("✓ Storage log: segments rotate and read back in order")
+        test_torn_last_line_is_skipped()
+        print("✓ Storage log: torn last line is skipped")
+        test_interrupted_import_recovers()
+        print("✓ Storage log: interrupted imports keep every record once")
+        test_archived_segments_read_back()
+        print("✓ Storage log: archived segments read back unchanged")
+        sys.exit(0)
+    except Exception as e:
+        print(f"\n❌ TEST ERROR: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Test the conversation vector indexes in vector_index.py.
+
+Checks that IVF search keeps high recall against exact flat search on
+clustered data, that exact IVF search (every partition probed) matches flat
+search, and that flat and IVF indexes survive a save/load round trip.
+Runs on synthetic vectors, without the embedding model.
+"""
+
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+from vector_index import AdaptiveIndex, FlatIndex, IVFFlatIndex, normalize
+
+DIM = 32
+
+
+def clustered_vectors(rows, clusters=20, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, DIM))
+    labels = rng.integers(clusters, size=rows)
+    return normalize(centers[labels] + 0.3 * rng.standard_normal((rows, DIM)))
+
+
+def recall(index, flat, queries, k=10, **search_args):
+    found = 0
+    for query in queries:
+        expected = set(flat.search(query, k)[0].tolist())
+        found += len(expected & set(index.search(query, k, **search_args)[0].tolist()))
+    return found / (k * len(queries))
+
+
+def test_ivf_recall_against_flat_search():
+    vectors = clustered_vectors(5000)
+    ids = np.arange(len(vectors))
+    flat = FlatIndex.from_arrays(ids, vectors)
+    ivf = IVFFlatIndex.train(ids, vectors, nprobe=8)
+    queries = clustered_vectors(50, seed=1)
+
+    assert len(ivf) == len(flat) == len(vectors)
+    assert recall(ivf, flat, queries) >= 0.9
+    assert recall(ivf, flat, queries, nprobe=len(ivf.centroids)) == 1.0
+
+
+def test_adaptive_index_switches_to_ivf():
+    vectors = clustered_vectors(600)
+    index = AdaptiveIndex(DIM, min_rows=500)
+    index.add(np.arange(400), vectors[:400])
+    assert index.kind == 'flat'
+    index.add(np.arange(400, 600), vectors[400:])
+    # Training runs in the background; rows added meanwhile still land.
+    index.add(np.arange(600, 650), vectors[:50])
+    assert len(index) == 650
+    index.wait_for_rebuild()
+    assert index.kind == 'ivf'
+    assert len(index) == 650 and index.max_id == 649
+    assert index.contains(np.arange(650)).all()
+
+
+def test_save_load_round_trip():
+    vectors = clustered_vectors(600)
+    ids = np.arange(100, 700)
+    query = vectors[42]
+    with tempfile.TemporaryDirectory() as tmp:
+        for min_rows in (10000, 500):
+            index = AdaptiveIndex(DIM, min_rows=min_rows)
+            index.add(ids, vectors)
+            index.wait_for_rebuild()
+            path = os.path.join(tmp, f"{index.kind}.npz")
+            index.save(path)
+            assert index.dirty == 0
+
+            loaded = AdaptiveIndex.load(path, min_rows=min_rows)
+            assert loaded.kind == index.kind
+            assert len(loaded) == len(index) and loaded.max_id == index.max_id
+            for before, after in zip(index.search(query, 5, exact=True),
+                                     loaded.search(query, 5, exact=True)):
+                np.testing.assert_allclose(before, after, rtol=1e-6)
+            assert loaded.search(query, 1, exact=True)[0][0] == 142
+
+
+if __name__ == "__main__":
+    try:
+        test_ivf_recall_against_flat_search()
+        print("✓ IVF search: recall@10 against flat search")
+        test_adaptive_index_switches_to_ivf()
+        print("✓ AdaptiveIndex: switches to IVF at min_rows")
+        test_save_load_round_trip()
+        print("✓ Flat and IVF indexes: save/load round trip")
+        sys.exit(0)
+    except Exception as e:
+        print(f"\n❌ TEST ERROR: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,528 @@
+"""
+vector_index.py
+---------------
+Nearest-neighbour indexes over conversation embeddings.
+
+Instructions:
+- Every index implements the same small interface: add(ids, vectors),
+  search(query, k) -> (ids, scores), save(path) and load(path).
+- FlatIndex is exact brute force over one contiguous, L2-normalized matrix.
+- IVFFlatIndex partitions vectors around k-means centroids and only scans the
+  `nprobe` closest partitions, trading a little recall for sub-linear search.
+- AdaptiveIndex stays exact for small users and switches to IVF once a user
+  has at least `min_rows` vectors, training it on a background thread.
+- EmbeddingMatrix is an append-only float32 matrix file with a rowid map that
+  any process can search through np.memmap without copying it into memory.
+"""
+
+import os
+import struct
+import threading
+import numpy as np
+from typing import Tuple
+
+INDEX_FORMAT_VERSION = 1
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize along the last axis, leaving zero vectors untouched."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _merge_top_k(ids: np.ndarray, scores: np.ndarray,
+                 k: int) -> Tuple[np.ndarray, np.ndarray]:
+    if k < len(scores):
+        top = np.argpartition(scores, -k)[-k:]
+    else:
+        top = np.arange(len(scores))
+    top = top[np.argsort(scores[top])[::-1]]
+    return ids[top], scores[top]
+
+
+def _save_npz(path: str, **arrays):
+    # np.savez appends .npz to names without it, so write under a name that
+    # already has the suffix and rename into place atomically.
+    tmp_path = f"{path}.tmp.npz"
+    np.savez(tmp_path, format_version=INDEX_FORMAT_VERSION, **arrays)
+    os.replace(tmp_path, path)
+
+
+class FlatIndex:
+    """Exact search over a contiguous, L2-normalized float32 matrix.
+
+    Rows live in a buffer that grows by doubling, so appends are amortized
+    O(1) and scoring is one matrix-vector product without copying.
+    """
+
+    kind = 'flat'
+
+    def __init__(self, dim: int, capacity: int = 1024):
+        self.dim = dim
+        self.size = 0
+        self.max_id = -1
+        self.ids = np.empty(capacity, dtype=np.int64)
+        self.vectors = np.empty((capacity, dim), dtype=np.float32)
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.size
+
+    def add(self, ids, vectors, normalized: bool = False):
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        if not normalized:
+            vectors = normalize(vectors)
+        with self.lock:
+            needed = self.size + len(vectors)
+            if needed > len(self.ids):
+                capacity = max(needed, 2 * len(self.ids))
+                new_ids = np.empty(capacity, dtype=np.int64)
+                new_vectors = np.empty((capacity, self.dim), dtype=np.float32)
+                new_ids[:self.size] = self.ids[:self.size]
+                new_vectors[:self.size] = self.vectors[:self.size]
+                self.ids, self.vectors = new_ids, new_vectors
+            self.ids[self.size:needed] = ids
+            self.vectors[self.size:needed] = vectors
+            self.size = needed
+            if len(vectors):
+                self.max_id = max(self.max_id, int(np.max(ids)))
+
+    def search(self, query, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (ids, scores) of the k best matches, best first."""
+        query = normalize(query)
+        with self.lock:
+            ids = self.ids[:self.size]
+            scores = self.vectors[:self.size] @ query
+        return _merge_top_k(ids, scores, k)
+
+    def snapshot(self) -> Tuple[np.ndarray, np.ndarray]:
+        with self.lock:
+            return self.ids[:self.size], self.vectors[:self.size]
+
+    def save(self, path: str):
+        ids, vectors = self.snapshot()
+        _save_npz(path, kind=self.kind, ids=ids, vectors=vectors)
+
+    @classmethod
+    def from_arrays(cls, ids, vectors):
+        index = cls(vectors.shape[1], capacity=max(1024, 2 * len(ids)))
+        index.add(ids, vectors, normalized=True)
+        return index
+
+
+def train_centroids(vectors: np.ndarray, nlist: int, iterations: int = 10,
+                    sample_size: int = 64, seed: int = 0) -> np.ndarray:
+    """Spherical k-means on a sample of at most `sample_size * nlist` rows."""
+    rng = np.random.default_rng(seed)
+    if len(vectors) > sample_size * nlist:
+        sample = vectors[rng.choice(len(vectors), sample_size * nlist,
+                                    replace=False)]
+    else:
+        sample = vectors
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignment = assign_to_centroids(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, sample)
+        empty = np.bincount(assignment, minlength=nlist) == 0
+        # Re-seed empty partitions so every centroid stays useful.
+        sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+        centroids = normalize(sums)
+    return centroids
+
+
+def assign_to_centroids(vectors: np.ndarray, centroids: np.ndarray,
+                        chunk_size: int = 65536) -> np.ndarray:
+    assignment = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), chunk_size):
+        chunk = vectors[start:start + chunk_size]
+        assignment[start:start + chunk_size] = np.argmax(
+            chunk @ centroids.T, axis=1)
+    return assignment
+
+
+class IVFFlatIndex:
+    """Inverted-file index: one FlatIndex per k-means partition."""
+
+    kind = 'ivf'
+
+    def __init__(self, centroids: np.ndarray, nprobe: int = 8):
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.dim = self.centroids.shape[1]
+        self.nprobe = nprobe
+        self.lists = [FlatIndex(self.dim, capacity=16)
+                      for _ in range(len(self.centroids))]
+        self.trained_size = 0
+
+    def __len__(self):
+        return sum(len(partition) for partition in self.lists)
+
+    @property
+    def max_id(self) -> int:
+        return max((partition.max_id for partition in self.lists), default=-1)
+
+    @classmethod
+    def train(cls, ids, vectors, nlist: int = None, nprobe: int = 8):
+        """Train centroids on normalized `vectors` and index them."""
+        if nlist is None:
+            nlist = max(1, int(np.sqrt(len(vectors))))
+        nlist = min(nlist, len(vectors))
+        index = cls(train_centroids(vectors, nlist), nprobe=nprobe)
+        index.add(ids, vectors, normalized=True)
+        index.trained_size = len(vectors)
+        return index
+
+    def add(self, ids, vectors, normalized: bool = False):
+        ids = np.asarray(ids, dtype=np.int64)
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        if not normalized:
+            vectors = normalize(vectors)
+        assignment = assign_to_centroids(vectors, self.centroids)
+        for partition in np.unique(assignment):
+            mask = assignment == partition
+            self.lists[partition].add(ids[mask], vectors[mask],
+                                      normalized=True)
+
+    def search(self, query, k: int,
+               nprobe: int = None) -> Tuple[np.ndarray, np.ndarray]:
+        query = normalize(query)
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        centroid_scores = self.centroids @ query
+        if nprobe < len(centroid_scores):
+            probe = np.argpartition(centroid_scores, -nprobe)[-nprobe:]
+        else:
+            probe = np.arange(len(centroid_scores))
+
+        found_ids, found_scores = [], []
+        for partition in probe:
+            ids, scores = self.lists[partition].search(query, k)
+            found_ids.append(ids)
+            found_scores.append(scores)
+        if not found_ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        return _merge_top_k(np.concatenate(found_ids),
+                            np.concatenate(found_scores), k)
+
+    def snapshot(self) -> Tuple[np.ndarray, np.ndarray]:
+        parts = [partition.snapshot() for partition in self.lists]
+        return (np.concatenate([p[0] for p in parts]),
+                np.concatenate([p[1] for p in parts]))
+
+    def save(self, path: str):
+        parts = [partition.snapshot() for partition in self.lists]
+        _save_npz(path, kind=self.kind, centroids=self.centroids,
+                  nprobe=self.nprobe, trained_size=self.trained_size,
+                  list_sizes=np.array([len(p[0]) for p in parts]),
+                  ids=np.concatenate([p[0] for p in parts]),
+                  vectors=np.concatenate([p[1] for p in parts]))
+
+    @classmethod
+    def from_arrays(cls, centroids, nprobe, list_sizes, ids, vectors):
+        index = cls(centroids, nprobe=int(nprobe))
+        offsets = np.concatenate([[0], np.cumsum(list_sizes)])
+        for partition, (start, end) in enumerate(zip(offsets, offsets[1:])):
+            index.lists[partition].add(ids[start:end], vectors[start:end],
+                                       normalized=True)
+        return index
+
+
+class AdaptiveIndex:
+    """Exact search for small collections, IVF once they grow past min_rows.
+
+    The IVF partitions are retrained when the collection has grown to
+    `retrain_factor` times the size they were trained on, so centroids keep
+    tracking the data as history accumulates. Training runs on a background
+    thread: searches keep using the current index, rows added meanwhile are
+    replayed into the new one, and it is swapped in when ready.
+    """
+
+    def __init__(self, dim: int, min_rows: int = 50000, nprobe: int = 8,
+                 retrain_factor: float = 4.0):
+        self.dim = dim
+        self.min_rows = min_rows
+        self.nprobe = nprobe
+        self.retrain_factor = retrain_factor
+        self.index = FlatIndex(dim)
+        self.dirty = 0
+        self.lock = threading.Lock()
+        # Rows added while a rebuild trains; None when none is running.
+        self._added_during_rebuild = None
+        self._rebuild_thread = None
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def kind(self) -> str:
+        return self.index.kind
+
+    @property
+    def max_id(self) -> int:
+        return self.index.max_id
+
+    def add(self, ids, vectors):
+        with self.lock:
+            self.index.add(ids, vectors)
+            self.dirty += len(np.atleast_1d(ids))
+            if self._added_during_rebuild is not None:
+                self._added_during_rebuild.append((ids, vectors))
+            self._maybe_rebuild()
+
+    def contains(self, ids) -> np.ndarray:
+        """Boolean mask of which `ids` are already in the index."""
+        index = self.index
+        partitions = index.lists if isinstance(index, IVFFlatIndex) else [index]
+        found = np.zeros(len(ids), dtype=bool)
+        for partition in partitions:
+            with partition.lock:
+                found |= np.isin(ids, partition.ids[:partition.size])
+        return found
+
+    def _maybe_rebuild(self):
+        """Start a background rebuild if one is due; call with the lock held."""
+        if self._added_during_rebuild is not None:
+            return
+        size = len(self.index)
+        if size < self.min_rows:
+            return
+        if (isinstance(self.index, IVFFlatIndex)
+                and size < self.retrain_factor * self.index.trained_size):
+            return
+        ids, vectors = self.index.snapshot()
+        self._added_during_rebuild = []
+        self._rebuild_thread = threading.Thread(
+            target=self._rebuild, args=(ids, vectors), daemon=True,
+            name='ivf-rebuild')
+        self._rebuild_thread.start()
+
+    def _rebuild(self, ids, vectors):
+        try:
+            rebuilt = IVFFlatIndex.train(ids, vectors, nprobe=self.nprobe)
+        except Exception as e:
+            print(f"Failed to rebuild IVF index: {e}")
+            rebuilt = None
+        with self.lock:
+            added, self._added_during_rebuild = self._added_during_rebuild, None
+            if rebuilt is None:
+                return
+            for added_ids, added_vectors in added:
+                rebuilt.add(added_ids, added_vectors)
+            self.index = rebuilt
+            # The new partitions are not on disk yet either.
+            self.dirty = max(self.dirty, 1)
+            self._maybe_rebuild()
+
+    def wait_for_rebuild(self):
+        """Block until background rebuilds, including chained ones, are swapped in."""
+        thread = self._rebuild_thread
+        while thread is not None:
+            thread.join()
+            thread, finished = self._rebuild_thread, thread
+            if thread is finished:
+                break
+
+    def search(self, query, k: int,
+               exact: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        index = self.index
+        if isinstance(index, IVFFlatIndex):
+            nprobe = len(index.centroids) if exact else self.nprobe
+            return index.search(query, k, nprobe=nprobe)
+        return index.search(query, k)
+
+    def save(self, path: str):
+        with self.lock:
+            self.index.save(path)
+            self.dirty = 0
+
+    @classmethod
+    def load(cls, path: str, min_rows: int = 50000, nprobe: int = 8,
+             retrain_factor: float = 4.0):
+        with np.load(path) as data:
+            if int(data['format_version']) != INDEX_FORMAT_VERSION:
+                raise ValueError(f"Unsupported index format in {path}")
+            kind = str(data['kind'])
+            if kind == IVFFlatIndex.kind:
+                inner = IVFFlatIndex.from_arrays(
+                    data['centroids'], nprobe, data['list_sizes'],
+                    data['ids'], data['vectors'])
+                inner.trained_size = int(data['trained_size'])
+            else:
+                inner = FlatIndex.from_arrays(data['ids'], data['vectors'])
+        index = cls(inner.dim, min_rows=min_rows, nprobe=nprobe,
+                    retrain_factor=retrain_factor)
+        index.index = inner
+        return index
+
+
+MATRIX_HEADER_SIZE = 128
+# One (conversation id, user key) pair per matrix row.
+ROWID_DTYPE = np.dtype([('id', '<i8'), ('key', '<u8')])
+# generation, rows, dim; rewritten atomically after every append or rebuild.
+MATRIX_GENERATION = struct.Struct('<QQQ')
+
+
+def _npy_header(dtype: np.dtype, shape: tuple) -> bytes:
+    """A .npy v1.0 header padded to MATRIX_HEADER_SIZE bytes.
+
+    The padding leaves room for the shape to grow, so appending rows only
+    rewrites the header in place and the data never moves.
+    """
+    header = repr({'descr': np.lib.format.dtype_to_descr(dtype),
+                   'fortran_order': False, 'shape': shape})
+    body = header.ljust(MATRIX_HEADER_SIZE - 11) + '\n'
+    return b'\x93NUMPY\x01\x00' + struct.pack('<H', len(body)) + body.encode('latin1')
+
+
+class EmbeddingMatrix:
+    """Append-only float32 matrix on disk, shared by processes via np.memmap.
+
+    Three files sit next to each other:
+    - `<path>.npy`: L2-normalized float32 rows, a regular .npy file
+      (np.load(..., mmap_mode='r') works too).
+    - `<path>.ids.npy`: the rowid map, one ROWID_DTYPE entry per row.
+    - `<path>.gen`: generation, row count and dimension. Readers compare
+      the generation to notice appended rows; it is 24 bytes, so checking
+      it per query is cheap.
+
+    There is a single writer (the backend's database.py). Rows are written
+    and the headers updated before the generation file is replaced, so a
+    reader never maps rows that are not fully on disk. rebuild() swaps in
+    new files with os.replace(); readers holding the old mapping keep a
+    consistent view until their next refresh().
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.data_path = f"{path}.npy"
+        self.ids_path = f"{path}.ids.npy"
+        self.generation_path = f"{path}.gen"
+        self.generation = -1
+        self.rows = 0
+        self.dim = 0
+        self.vectors = None
+        self.rowids = None
+        self.lock = threading.Lock()
+
+    def read_generation(self) -> Tuple[int, int, int]:
+        """Return (generation, rows, dim); (0, 0, 0) if nothing is written yet."""
+        try:
+            with open(self.generation_path, 'rb') as f:
+                return MATRIX_GENERATION.unpack(f.read(MATRIX_GENERATION.size))
+        except (OSError, struct.error):
+            return 0, 0, 0
+
+    def _write_generation(self, generation: int, rows: int, dim: int):
+        tmp_path = f"{self.generation_path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(MATRIX_GENERATION.pack(generation, rows, dim))
+        os.replace(tmp_path, self.generation_path)
+
+    # -- writer -----------------------------------------------------------
+
+    def append(self, ids, keys, vectors, normalized: bool = False):
+        """Append rows and publish them with a new generation."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        vectors = vectors.reshape(len(np.atleast_1d(ids)), -1)
+        if not len(vectors):
+            return
+        if not normalized:
+            vectors = normalize(vectors)
+        rowids = np.empty(len(vectors), dtype=ROWID_DTYPE)
+        rowids['id'] = ids
+        rowids['key'] = keys
+
+        with self.lock:
+            generation, rows, dim = self.read_generation()
+            if rows == 0:
+                self._create(vectors.shape[1])
+                dim = vectors.shape[1]
+            elif vectors.shape[1] != dim:
+                raise ValueError(f"Expected {dim}-dim vectors, got {vectors.shape[1]}")
+            total = rows + len(vectors)
+            self._append_rows(self.data_path, vectors, rows * dim * 4, (total, dim))
+            self._append_rows(self.ids_path, rowids, rows * ROWID_DTYPE.itemsize, (total,))
+            self._write_generation(generation + 1, total, dim)
+
+    def _create(self, dim: int):
+        for path, dtype, shape in ((self.data_path, np.dtype('<f4'), (0, dim)),
+                                   (self.ids_path, ROWID_DTYPE, (0,))):
+            with open(path, 'wb') as f:
+                f.write(_npy_header(dtype, shape))
+
+    @staticmethod
+    def _append_rows(path: str, array: np.ndarray, offset: int, shape: tuple):
+        with open(path, 'r+b') as f:
+            f.seek(MATRIX_HEADER_SIZE + offset)
+            f.write(array.tobytes())
+            f.seek(0)
+            f.write(_npy_header(array.dtype, shape))
+
+    def rebuild(self, batches):
+        """Replace the whole matrix with `batches` of (ids, keys, vectors).
+
+        Used after rows were rewritten in place; the new files are built
+        under temporary names and swapped in under a bumped generation.
+        """
+        with self.lock:
+            generation = self.read_generation()[0]
+            tmp = EmbeddingMatrix(f"{self.path}.rebuild")
+            for path in (tmp.data_path, tmp.ids_path, tmp.generation_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            for ids, keys, vectors in batches:
+                tmp.append(ids, keys, vectors)
+            _, rows, dim = tmp.read_generation()
+            if rows:
+                os.replace(tmp.ids_path, self.ids_path)
+                os.replace(tmp.data_path, self.data_path)
+                os.remove(tmp.generation_path)
+            self._write_generation(generation + 1, rows, dim)
+
+    # -- reader -----------------------------------------------------------
+
+    def refresh(self) -> bool:
+        """Remap the files if the generation changed; True if it did."""
+        generation, rows, dim = self.read_generation()
+        if generation == self.generation:
+            return False
+        with self.lock:
+            try:
+                if rows:
+                    self.vectors = np.memmap(self.data_path, dtype='<f4', mode='r',
+                                             offset=MATRIX_HEADER_SIZE, shape=(rows, dim))
+                    self.rowids = np.memmap(self.ids_path, dtype=ROWID_DTYPE, mode='r',
+                                            offset=MATRIX_HEADER_SIZE, shape=(rows,))
+                else:
+                    self.vectors = self.rowids = None
+            except (OSError, ValueError):
+                # Missing or truncated files read as empty; the writer
+                # rebuilds them (database._sync_embedding_matrix).
+                self.vectors = self.rowids = None
+                self.rows = 0
+                return False
+            self.generation, self.rows, self.dim = generation, rows, dim
+        return True
+
+    def __len__(self):
+        return self.rows
+
+    def search(self, query, k: int, key: int = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (ids, scores) of the k best rows, optionally only for `key`.
+
+        Scoring streams the mapped pages through one matrix-vector product;
+        only the per-row scores are allocated on the heap.
+        """
+        self.refresh()
+        with self.lock:
+            vectors, rowids = self.vectors, self.rowids
+        if vectors is None:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        scores = vectors @ normalize(query)
+        ids = rowids['id']
+        if key is not None:
+            mine = np.flatnonzero(rowids['key'] == key)
+            ids, scores = ids[mine], scores[mine]
+        return _merge_top_k(np.asarray(ids), scores, k)